@@ -0,0 +1,71 @@
+"""Shared helpers of the tests that solve the example input. """
+import os
+import unittest
+
+try:
+    import pyomo.environ
+    import urbs
+    from pyomo.opt.base import SolverFactory
+except ImportError:
+    urbs = None
+
+INPUT_FILE = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'mimo-example.xlsx')
+TIMESTEPS = list(range(0, 13))
+
+# solvers for linear and quadratic (ADMM) problems, in order of preference
+LP_SOLVERS = ['glpk', 'cbc', 'appsi_highs']
+QP_SOLVERS = ['gurobi', 'cplex', 'ipopt']
+# LP solvers with usable duals (Benders cuts); cbc may report zero duals
+DUAL_SOLVERS = ['glpk', 'appsi_highs']
+
+
+def find_solver(names):
+    """Name of the first available solver of names, or None. """
+    if urbs is None:
+        return None
+    for name in names:
+        try:
+            if SolverFactory(name).available(exception_flag=False):
+                return name
+        except Exception:
+            # unknown solver interface, e.g. in older Pyomo versions
+            continue
+    return None
+
+
+LP_SOLVER = find_solver(LP_SOLVERS)
+
+
+def solve_model(data, timesteps, **kwds):
+    """Solve the Pyomo model and return its objective value.
+
+    Args:
+        data: input data dict
+        timesteps: list of timesteps
+        **kwds: keyword arguments forwarded to create_model
+    """
+    prob = urbs.create_model(data, timesteps=timesteps, **kwds)
+    SolverFactory(LP_SOLVER).solve(prob)
+    return pyomo.environ.value(prob.obj)
+
+
+def scenario_expensive_gas(data):
+    """Double gas prices, raise the gas plant input ratio, limit CO2. """
+    commodity = data['commodity']
+    gas = commodity.index.get_level_values('Commodity') == 'Gas'
+    commodity.loc[gas, 'price'] *= 2
+    data['process_commodity'].loc[('Gas plant', 'Gas', 'In'), 'ratio'] *= 1.1
+    data['global_prop'].loc['CO2 limit', 'value'] = 1e5
+    return data
+
+
+@unittest.skipIf(urbs is None, 'pandas or pyomo not installed')
+class SolverTestCase(unittest.TestCase):
+    """Base class of tests on the example input; skipped without solver. """
+
+    def setUp(self):
+        if LP_SOLVER is None:
+            self.skipTest('no LP solver available')
+        self.solver = LP_SOLVER
+        self.data = urbs.read_excel(INPUT_FILE, cache=False)
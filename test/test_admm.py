@@ -0,0 +1,30 @@
+"""Check that ADMM on two regions converges to the full model's costs.
+
+Run from the repository root with: python -m unittest discover test
+"""
+import unittest
+from helpers import QP_SOLVERS, SolverTestCase, find_solver, solve_model, urbs
+
+ADMM_TIMESTEPS = list(range(0, 5))
+REGIONS = {'Centre': ['Mid'], 'Periphery': ['North', 'South']}
+
+
+class AdmmTest(SolverTestCase):
+
+    def setUp(self):
+        super(AdmmTest, self).setUp()
+        self.solver = find_solver(QP_SOLVERS)
+        if self.solver is None:
+            self.skipTest('no QP solver available')
+
+    def test_two_regions_costs(self):
+        prob = urbs.run_admm(self.data, ADMM_TIMESTEPS, REGIONS, self.solver,
+                             processes=1, max_iter=500, tol=1e-4)
+        self.assertLess(len(prob.residuals), 500)
+        expected = solve_model(self.data, ADMM_TIMESTEPS)
+        self.assertAlmostEqual(prob._result['costs'].sum() / expected, 1.0,
+                               places=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+"""Check that segment_timeseries without merging keeps the problem intact.
+
+Run from the repository root with: python -m unittest discover test
+"""
+import unittest
+from helpers import SolverTestCase, TIMESTEPS, solve_model, urbs
+
+
+class SegmentTimeseriesTest(SolverTestCase):
+
+    def test_one_segment_per_timestep(self):
+        expected = solve_model(self.data, TIMESTEPS)
+        data = urbs.segment_timeseries(self.data, len(TIMESTEPS) - 1,
+                                       timesteps=TIMESTEPS)
+        self.assertEqual(data['timestep']['duration'].tolist(),
+                         [1.0] * len(TIMESTEPS))
+        result = solve_model(data, TIMESTEPS)
+        self.assertAlmostEqual(result / expected, 1.0, places=6)
+
+    def test_demand_is_summed(self):
+        data = urbs.segment_timeseries(self.data, 1, timesteps=TIMESTEPS)
+        modelled = self.data['demand'].loc[TIMESTEPS[1:]].sum()
+        self.assertTrue(((data['demand'].loc[1] - modelled).abs() <
+                         1e-9).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
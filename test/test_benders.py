@@ -0,0 +1,47 @@
+"""Check that Benders decomposition converges to the full model's objective.
+
+Run from the repository root with: python -m unittest discover test
+"""
+import unittest
+from helpers import (DUAL_SOLVERS, SolverTestCase, find_solver, solve_model,
+                     urbs)
+
+try:
+    from urbs.benders import check_termination
+except ImportError:
+    pass
+
+# a single block covers the whole horizon, so decomposition is exact
+BENDERS_TIMESTEPS = list(range(0, 5))
+TOL = 1e-4
+
+
+class BendersTest(SolverTestCase):
+
+    def setUp(self):
+        super(BendersTest, self).setUp()
+        self.solver = find_solver(DUAL_SOLVERS)
+        if self.solver is None:
+            self.skipTest('no LP solver with usable duals available')
+
+    def test_single_block_objective(self):
+        prob = urbs.run_benders(self.data, BENDERS_TIMESTEPS,
+                                len(BENDERS_TIMESTEPS) - 1, self.solver,
+                                processes=1, max_iter=100, tol=TOL)
+        expected = solve_model(self.data, BENDERS_TIMESTEPS)
+        lower, upper = prob.bounds.iloc[-1]
+        self.assertLessEqual(upper - lower, TOL * abs(upper))
+        self.assertLessEqual(lower, expected * (1 + 1e-6))
+        self.assertAlmostEqual(upper / expected, 1.0, places=3)
+        self.assertAlmostEqual(prob.penalty / expected, 0.0, places=3)
+
+    def test_failed_solve_raises(self):
+        class Result(object):
+            class solver(object):
+                termination_condition = 'infeasible'
+        with self.assertRaisesRegex(RuntimeError, 'master problem'):
+            check_termination(Result(), 'Benders master problem')
+
+
+if __name__ == '__main__':
+    unittest.main()
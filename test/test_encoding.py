@@ -0,0 +1,44 @@
+"""Check that integer-coded models solve like labelled ones.
+
+Run from the repository root with: python -m unittest discover test
+"""
+import unittest
+from helpers import SolverTestCase, TIMESTEPS, urbs
+
+try:
+    import pyomo.environ
+    from pyomo.opt.base import SolverFactory
+except ImportError:
+    pass
+
+ENTITIES = ['costs', 'cap_pro', 'cap_tra', 'cap_sto_c', 'e_pro_out',
+            'e_tra_in', 'e_sto_con']
+
+
+class EncodeTest(SolverTestCase):
+
+    def solve(self, **kwds):
+        prob = urbs.create_model(self.data, timesteps=TIMESTEPS, **kwds)
+        SolverFactory(self.solver).solve(prob)
+        return prob
+
+    def test_same_objective_and_labels(self):
+        plain = self.solve()
+        coded = self.solve(encode=True)
+        self.assertAlmostEqual(
+            pyomo.environ.value(coded.obj) / pyomo.environ.value(plain.obj),
+            1.0, places=6)
+        # values may differ among optimal solutions, labels must not
+        for name in ENTITIES:
+            result = urbs.get_entity(coded, name).sort_index()
+            expected = urbs.get_entity(plain, name).sort_index()
+            self.assertTrue(result.index.equals(expected.index), name)
+
+    def test_input_decoded(self):
+        coded = self.solve(encode=True)
+        self.assertTrue(coded._data['process'].index.equals(
+            self.data['process'].index))
+
+
+if __name__ == '__main__':
+    unittest.main()
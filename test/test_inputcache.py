@@ -0,0 +1,61 @@
+"""Check the cache of parsed input workbooks.
+
+Run from the repository root with: python -m unittest discover test
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from helpers import INPUT_FILE, urbs
+
+try:
+    from urbs.inputcache import cache_key, load_cached, store_cached
+except ImportError:
+    pass
+
+
+@unittest.skipIf(urbs is None, 'urbs dependencies not available')
+class InputCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous = os.environ.get('URBS_CACHE_DIR')
+        os.environ['URBS_CACHE_DIR'] = os.path.join(self.directory, 'cache')
+
+    def tearDown(self):
+        if self.previous is None:
+            del os.environ['URBS_CACHE_DIR']
+        else:
+            os.environ['URBS_CACHE_DIR'] = self.previous
+        shutil.rmtree(self.directory)
+
+    def assertSameData(self, result, expected):
+        self.assertEqual(sorted(result), sorted(expected))
+        for name in expected:
+            self.assertTrue(result[name].equals(expected[name]), name)
+
+    def test_round_trip(self):
+        data = urbs.read_excel(INPUT_FILE, cache=False)
+        key = cache_key(INPUT_FILE)
+        self.assertIsNone(load_cached(key))
+        store_cached(key, data)
+        self.assertSameData(load_cached(key), data)
+
+    def test_read_excel_uses_cache(self):
+        data = urbs.read_excel(INPUT_FILE)
+        marked = dict(data, marker=data['site'])
+        store_cached(cache_key(INPUT_FILE), marked)
+        self.assertSameData(urbs.read_excel(INPUT_FILE), marked)
+
+    def test_modified_file_new_key(self):
+        filename = os.path.join(self.directory, 'input.xlsx')
+        shutil.copyfile(INPUT_FILE, filename)
+        key = cache_key(filename)
+        self.assertEqual(cache_key(filename), key)
+        with open(filename, 'ab') as f:
+            f.write(b'\0')
+        self.assertNotEqual(cache_key(filename), key)
+
+
+if __name__ == '__main__':
+    unittest.main()
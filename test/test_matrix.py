@@ -0,0 +1,31 @@
+"""Check that create_matrix_model and create_model build the same problem.
+
+Run from the repository root with: python -m unittest discover test
+"""
+import unittest
+from helpers import SolverTestCase, TIMESTEPS, solve_model, urbs
+
+try:
+    import scipy
+except ImportError:
+    scipy = None
+
+
+@unittest.skipIf(scipy is None, 'scipy not installed')
+class MatrixModelTest(SolverTestCase):
+
+    def test_same_objective(self):
+        expected = solve_model(self.data, TIMESTEPS)
+        result = urbs.create_matrix_model(self.data,
+                                          timesteps=TIMESTEPS).solve()
+        self.assertEqual(result.status, 0)
+        self.assertAlmostEqual(result.fun / expected, 1.0, places=6)
+
+    def test_timestep_properties_rejected(self):
+        data = urbs.segment_timeseries(self.data, 6, timesteps=TIMESTEPS)
+        with self.assertRaises(ValueError):
+            urbs.create_matrix_model(data, timesteps=list(range(0, 7)))
+
+
+if __name__ == '__main__':
+    unittest.main()
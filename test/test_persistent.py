@@ -0,0 +1,39 @@
+"""Check that ScenarioSolver reuses its model and matches fresh solves.
+
+Run from the repository root with: python -m unittest discover test
+"""
+import copy
+import unittest
+from helpers import (SolverTestCase, TIMESTEPS, scenario_expensive_gas,
+                     solve_model, urbs)
+
+try:
+    import pyomo.environ
+    from urbs.persistent import parameter_constraints
+except ImportError:
+    pass
+
+
+class ScenarioSolverTest(SolverTestCase):
+
+    def test_two_scenarios(self):
+        runner = urbs.ScenarioSolver(self.solver, timesteps=TIMESTEPS)
+        for scenario in [copy.deepcopy, scenario_expensive_gas]:
+            data = scenario(copy.deepcopy(self.data))
+            prob = runner.solve(data)
+            result = pyomo.environ.value(prob.obj)
+            expected = solve_model(data, TIMESTEPS)
+            self.assertAlmostEqual(result / expected, 1.0, places=6)
+        self.assertEqual(runner.rebuilds, 1)
+
+    def test_parameter_constraints(self):
+        prob = urbs.create_model(self.data, timesteps=TIMESTEPS,
+                                 mutable=True)
+        occurrences = parameter_constraints(prob)
+        price = prob.commodity_price[('Mid', 'Coal', 'Stock')]
+        self.assertEqual([con.name for con in occurrences[id(price)]],
+                         ['def_costs[Fuel]'])
+
+
+if __name__ == '__main__':
+    unittest.main()
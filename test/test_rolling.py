@@ -0,0 +1,48 @@
+"""Check rolling horizon results against the monolithic model.
+
+Run from the repository root with: python -m unittest discover test
+"""
+import unittest
+from helpers import SolverTestCase, TIMESTEPS, solve_model, urbs
+
+try:
+    import pyomo.environ
+    from pyomo.opt.base import SolverFactory
+except ImportError:
+    pass
+
+
+class RollingHorizonTest(SolverTestCase):
+
+    def test_single_window_objective(self):
+        prob = urbs.run_rolling_horizon(self.data, TIMESTEPS,
+                                        len(TIMESTEPS) - 1, 0, self.solver)
+        expected = solve_model(self.data, TIMESTEPS)
+        self.assertAlmostEqual(prob._result['costs'].sum() / expected, 1.0,
+                               places=6)
+
+    def test_fixed_optimal_capacities(self):
+        mono = urbs.create_model(self.data, timesteps=TIMESTEPS)
+        SolverFactory(self.solver).solve(mono)
+        expected = pyomo.environ.value(mono.obj)
+
+        # raises RuntimeError if a window is infeasible
+        prob = urbs.run_rolling_horizon(self.data, TIMESTEPS, 6, 2,
+                                        self.solver, capacities=mono)
+        result = prob._result
+        self.assertGreaterEqual(result['costs'].sum(), expected * (1 - 1e-6))
+        for name in ['cap_pro', 'cap_sto_c']:
+            difference = result[name] - urbs.get_entity(mono, name)
+            self.assertLess(difference.abs().max(), 1e-3)
+
+        # final storage content at least the initial storage content
+        init = self.data['storage']['init']
+        content = result['e_sto_con'].xs(TIMESTEPS[-1], level='t')
+        for (sit, sto, com), value in content.items():
+            self.assertGreaterEqual(
+                value + 1e-3,
+                result['cap_sto_c'][(sit, sto, com)] * init[(sit, sto, com)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+"""Check that lazy result caches and saved results match eager extraction.
+
+Run from the repository root with: python -m unittest discover test
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from helpers import SolverTestCase, TIMESTEPS, urbs
+
+try:
+    from pyomo.opt.base import SolverFactory
+    from urbs.saveload import create_result_cache, result_entities
+except ImportError:
+    pass
+
+
+class ResultCacheTest(SolverTestCase):
+
+    def setUp(self):
+        super(ResultCacheTest, self).setUp()
+        self.prob = urbs.create_model(self.data, timesteps=TIMESTEPS)
+        SolverFactory(self.solver).solve(self.prob)
+
+    def assertSameCache(self, result, expected):
+        self.assertEqual(sorted(result.keys()), sorted(expected.keys()))
+        for name in expected:
+            self.assertTrue(result[name].equals(expected[name]), name)
+
+    def test_lazy_equals_eager(self):
+        eager = create_result_cache(self.prob)
+        lazy = create_result_cache(self.prob, lazy=True)
+        self.assertSameCache(lazy, eager)
+
+    def test_save_all_entities(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'result.h5')
+            urbs.save(self.prob, filename)
+            loaded = urbs.load(filename)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(sorted(loaded._result.keys()),
+                         sorted(result_entities(self.prob)))
+        costs = create_result_cache(self.prob, ['costs'])['costs']
+        self.assertTrue(loaded._result['costs'].equals(costs))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+"""Check that update_model reproduces a rebuilt model's objective.
+
+Run from the repository root with: python -m unittest discover test
+"""
+import copy
+import unittest
+from helpers import (SolverTestCase, TIMESTEPS, scenario_expensive_gas,
+                     solve_model, urbs)
+
+try:
+    import pyomo.environ
+    from pyomo.opt.base import SolverFactory
+except ImportError:
+    pass
+
+
+class UpdateModelTest(SolverTestCase):
+
+    def test_same_objective_as_rebuild(self):
+        prob = urbs.create_model(self.data, timesteps=TIMESTEPS,
+                                 mutable=True)
+        optim = SolverFactory(self.solver)
+        optim.solve(prob)
+        base = pyomo.environ.value(prob.obj)
+
+        data = scenario_expensive_gas(copy.deepcopy(self.data))
+        changed = urbs.update_model(prob, data)
+        self.assertIn('commodity_price', changed)
+        self.assertIn('process_ratio_in', changed)
+        self.assertIn('co2_limit', changed)
+
+        optim.solve(prob)
+        result = pyomo.environ.value(prob.obj)
+        expected = solve_model(data, TIMESTEPS)
+        self.assertGreater(result, base)
+        self.assertAlmostEqual(result / expected, 1.0, places=6)
+
+    def test_structural_change_rejected(self):
+        prob = urbs.create_model(self.data, timesteps=TIMESTEPS,
+                                 mutable=True)
+        data = copy.deepcopy(self.data)
+        data['process'] = data['process'].drop(data['process'].index[0])
+        with self.assertRaises(ValueError):
+            urbs.update_model(prob, data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+"""Check that input validation reports all violations at once.
+
+Run from the repository root with: python -m unittest discover test
+"""
+import unittest
+from helpers import INPUT_FILE, urbs
+
+
+@unittest.skipIf(urbs is None, 'urbs dependencies not available')
+class FindViolationsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = urbs.read_excel(INPUT_FILE, cache=False)
+
+    def break_data(self):
+        data = self.data
+        data['commodity'] = data['commodity'].drop(
+            ('Mid', 'Biomass', 'Stock'))
+        process = data['process']
+        process.loc[('Mid', 'Gas plant'), 'cap-lo'] = (
+            process.loc[('Mid', 'Gas plant'), 'cap-up'] + 1)
+        storage = data['storage']
+        storage.loc[('North', 'Hydrogen', 'Elec'), 'cap-up-c'] = (
+            storage.loc[('North', 'Hydrogen', 'Elec'), 'inst-cap-c'] - 1)
+        data['supim'].loc[data['supim'].index[0], ('Mid', 'Wind')] = 2
+        data['commodity'] = data['commodity'].rename(
+            columns={'maxperhour': 'maxperstep'})
+        return data
+
+    def test_consistent_input(self):
+        self.assertEqual(urbs.find_violations(self.data), [])
+        urbs.validate_input(self.data)
+
+    def test_all_violations(self):
+        violations = urbs.find_violations(self.break_data())
+        self.assertEqual(
+            sorted((v.check, v.table, v.index) for v in violations),
+            [('capacity', 'process', ('Mid', 'Gas plant')),
+             ('capacity', 'storage', ('North', 'Hydrogen', 'Elec')),
+             ('maxperstep', 'commodity', 'maxperstep'),
+             ('supim', 'supim', ('Mid', 'Wind')),
+             ('vertex_rule', 'commodity', ('Mid', 'Biomass'))])
+
+    def test_validate_lists_all(self):
+        data = self.break_data()
+        with self.assertRaises(ValueError) as context:
+            urbs.validate_input(data)
+        message = str(context.exception)
+        self.assertTrue(message.startswith('5 input errors'))
+        for violation in urbs.find_violations(data):
+            self.assertIn(violation.message, message)
+
+
+if __name__ == '__main__':
+    unittest.main()
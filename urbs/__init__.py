@@ -10,12 +10,22 @@ commodities.
 
 """
 
+from .admm import run_admm
+from .aggregation import aggregate_timeseries, segment_timeseries
+from .benders import run_benders
 from .data import COLORS
 from .model import create_model
-from .input import read_excel, get_input
-from .validation import validate_input
+from .input import read_excel, read_columnar, convert_excel, get_input
+from .matrix import create_matrix_model
+from .validation import find_violations, validate_input
 from .output import get_constants, get_timeseries
+from .persistent import ScenarioSolver
 from .plot import plot, result_figures, to_color
+from .profiler import get_build_profile, write_build_profile
 from .pyomoio import get_entity, get_entities, list_entities
 from .report import report
+from .rolling import run_rolling_horizon
+from .runfunctions import (prepare_result_directory, setup_solver,
+                           run_scenario, run_scenarios)
 from .saveload import load, save
+from .scenario import update_model
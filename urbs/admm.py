@@ -0,0 +1,527 @@
+"""Spatial decomposition by the alternating direction method of multipliers.
+
+The sites are grouped into regions, each one a urbs model created by
+create_model from the input data of its sites and the transmission lines
+within. Transmission lines crossing a region border appear in both adjacent
+regions as flow (e_tra_border) and capacity (cap_tra_border) variables that
+enter the vertex rules of their respective end. Costs of a border line are
+borne by the region of its input site. The global CO2 limit is split into
+regional budgets (co2_budget).
+
+ADMM iterations coordinate the regions: each region minimises its costs plus
+the augmented Lagrangian terms lambda * (x - z) + rho / 2 * (x - z) ** 2 of
+its coupling variables x, then the consensus values z are the averages of
+both copies of each border variable, and the CO2 budgets are projected onto
+the global limit. Regions are solved in local worker processes, each of
+which always solves the same regions and keeps their models (see
+urbs.parallel); distribution over several machines is not supported. The
+augmented Lagrangian makes the subproblems quadratic, so the solver must
+support QPs.
+"""
+import math
+import multiprocessing
+import pandas as pd
+import pyomo.core as pyomo
+from pyomo.opt import TerminationCondition
+from pyomo.opt.base import SolverFactory
+from .encoding import require_labels
+from .model import create_model
+from .parallel import PinnedPool
+from .modelhelper import annuity_factor, commodity_balance
+from .saveload import ResultContainer, create_result_cache
+from .scenario import co2_limit_active
+from .store import ParamStore
+
+# input tables with a site level in their index
+SITE_LEVELS = {
+    'commodity': 'Site',
+    'process': 'Site',
+    'storage': 'Site',
+    'dsm': 'Site',
+}
+
+# timeseries tables with sites in the first column level
+SITE_COLUMNS = ['demand', 'supim']
+
+# index level names of transmission result entities (without 't')
+TRANSMISSION_LEVELS = ['sit', 'sit_', 'tra', 'com']
+
+# state of a worker process: input data, solver and built regions
+_worker = {}
+
+
+def run_admm(data, timesteps, regions=None, solver='gurobi', dt=1, rho=1.0,
+             processes=None, max_iter=100, tol=1e-3, **model_kwds):
+    """Solve an urbs model by spatial ADMM decomposition.
+
+    Args:
+        data: a dict of DataFrames, as returned by read_excel
+        timesteps: list of timesteps, the first being the initial timestep
+        regions: optional dict of region name -> list of sites; default: one
+            region per site
+        solver: a solver name for the regional (quadratic) problems
+        dt: timestep duration in hours (default: 1)
+        rho: penalty parameter of the augmented Lagrangian
+        processes: number of local worker processes (at most one per
+            region); default: number of CPUs; 1 solves the regions in this
+            process
+        max_iter: maximum number of iterations
+        tol: relative tolerance of primal and dual residual
+        **model_kwds: keyword arguments forwarded to create_model
+
+    Returns:
+        a ResultContainer with input data and the merged regional results,
+        usable with report, result_figures and save; flows and capacities
+        of border lines are the entities e_tra_border and cap_tra_border,
+        and are included in e_tra_in, e_tra_out, cap_tra and cap_tra_new.
+        Its attribute residuals is a DataFrame of primal and dual residual
+        per iteration.
+
+    Example:
+        >>> data = read_excel('mimo-example.xlsx')
+        >>> prob = run_admm(data, range(0, 169), processes=3)
+        >>> report(prob, 'report.xlsx')
+    """
+    require_labels('run_admm', model_kwds)
+    if regions is None:
+        regions = {sit: [sit] for sit in data['site'].index}
+    co2_limit = data['global_prop'].loc['CO2 limit', 'value']
+    if not co2_limit_active(co2_limit):
+        co2_limit = None
+    args = (data, list(timesteps), dt, rho, solver, co2_limit, model_kwds)
+
+    if processes == 1:
+        pool = None
+        _init_worker(*args)
+    else:
+        pool = PinnedPool(
+            min(processes or multiprocessing.cpu_count(), len(regions)),
+            initializer=_init_worker, initargs=args)
+
+    names = sorted(regions)
+    consensus = {name: {} for name in names}
+    multipliers = {name: {} for name in names}
+    try:
+        residuals = []
+        for _ in range(max_iter):
+            tasks = [(name, regions[name], consensus[name],
+                      multipliers[name], False) for name in names]
+            values = dict(zip(names, [x for x, _ in
+                                      _map(pool, _solve_region, tasks)]))
+
+            previous = consensus
+            consensus = update_consensus(values, multipliers, rho, co2_limit)
+            primal, dual = 0, 0
+            for name in names:
+                for key, value in values[name].items():
+                    z = consensus[name][key]
+                    multipliers[name][key] = (
+                        multipliers[name].get(key, 0) + rho * (value - z))
+                    primal += (value - z) ** 2
+                    dual += (z - previous[name].get(key, 0)) ** 2
+            primal, dual = math.sqrt(primal), rho * math.sqrt(dual)
+            residuals.append((primal, dual))
+
+            scale_x = math.sqrt(sum(value ** 2 for x in values.values()
+                                    for value in x.values()))
+            scale_y = math.sqrt(sum(value ** 2 for y in multipliers.values()
+                                    for value in y.values()))
+            if (primal <= tol * max(scale_x, 1) and
+                    dual <= tol * max(scale_y, 1)):
+                break
+
+        # regional results at the final consensus
+        tasks = [(name, regions[name], consensus[name], multipliers[name],
+                  True) for name in names]
+        caches = [result for _, result in _map(pool, _solve_region, tasks)]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    prob = ResultContainer(data, merge_caches(caches))
+    prob.residuals = pd.DataFrame(residuals, columns=['primal', 'dual'])
+    prob.residuals.index.name = 'iteration'
+    return prob
+
+
+def regional_data(data, sites):
+    """Input data restricted to given sites.
+
+    Args:
+        data: a dict of DataFrames, as returned by read_excel
+        sites: list of sites
+
+    Returns:
+        a new dict of DataFrames with the entries of the given sites and the
+        transmission lines between them
+    """
+    regional = dict(data)
+    regional['site'] = data['site'][data['site'].index.isin(sites)].copy()
+    for name, level in SITE_LEVELS.items():
+        table = data[name]
+        if not table.empty:
+            regional[name] = table[
+                table.index.get_level_values(level).isin(sites)].copy()
+    for name in SITE_COLUMNS:
+        table = data[name]
+        if len(table.columns):
+            regional[name] = table.loc[
+                :, table.columns.get_level_values(0).isin(sites)].copy()
+    tra = data['transmission']
+    regional['transmission'] = tra[
+        tra.index.get_level_values('Site In').isin(sites) &
+        tra.index.get_level_values('Site Out').isin(sites)].copy()
+    return regional
+
+
+def border_lines(transmission, sites):
+    """Transmission lines with exactly one end in the given sites.
+
+    Args:
+        transmission: the transmission input DataFrame
+        sites: list of sites
+
+    Returns:
+        DataFrame of border lines, with the column 'annuity-factor'
+    """
+    site_in = transmission.index.get_level_values('Site In').isin(sites)
+    site_out = transmission.index.get_level_values('Site Out').isin(sites)
+    border = transmission[site_in != site_out].copy()
+    border['annuity-factor'] = annuity_factor(border['depreciation'],
+                                              border['wacc'])
+    return border
+
+
+def create_region(data, sites, timesteps, dt=1, rho=1.0, co2_limit=None,
+                  **model_kwds):
+    """Create the model of a region with border lines and ADMM terms.
+
+    Args:
+        data: a dict of DataFrames, as returned by read_excel
+        sites: list of the sites of the region
+        timesteps: list of timesteps, the first being the initial timestep
+        dt: timestep duration in hours (default: 1)
+        rho: penalty parameter of the augmented Lagrangian
+        co2_limit: global CO2 limit to be shared, or None
+        **model_kwds: keyword arguments forwarded to create_model
+
+    Returns:
+        a pyomo ConcreteModel object with the objective obj_admm; the
+        consensus values and multipliers of each coupling variable <name>
+        are the mutable Params z_<name> and lambda_<name>
+    """
+    m = create_model(regional_data(data, sites), dt, timesteps, **model_kwds)
+    m.res_global_co2_limit.deactivate()
+    m.region_sites = list(sites)
+
+    border = border_lines(data['transmission'], sites)
+    m.border_dict = ParamStore(border)
+    m.sit_border = pyomo.Set(
+        initialize=sorted(
+            set(border.index.get_level_values('Site In')) |
+            set(border.index.get_level_values('Site Out'))),
+        doc='Set of sites connected by border transmission lines')
+    m.tra_border = pyomo.Set(
+        initialize=border.index.get_level_values('Transmission').unique(),
+        doc='Set of border transmission technologies')
+    m.tra_border_tuples = pyomo.Set(
+        within=m.sit_border*m.sit_border*m.tra_border*m.com,
+        initialize=border.index,
+        doc='Combinations of border transmissions, e.g. '
+            '(South,Mid,hvac,Elec)')
+
+    m.e_tra_border = pyomo.Var(
+        m.tm, m.tra_border_tuples,
+        within=pyomo.NonNegativeReals,
+        doc='Power flow into border transmission line (MW) per timestep')
+    m.cap_tra_border = pyomo.Var(
+        m.tra_border_tuples,
+        within=pyomo.NonNegativeReals,
+        doc='Total border transmission capacity (MW)')
+
+    m.res_border_input_by_capacity = pyomo.Constraint(
+        m.tm, m.tra_border_tuples,
+        rule=res_border_input_by_capacity_rule,
+        doc='border transmission input <= border transmission capacity')
+    m.res_border_capacity = pyomo.Constraint(
+        m.tra_border_tuples,
+        rule=res_border_capacity_rule,
+        doc='max(cap-lo, inst-cap) <= border capacity <= cap-up')
+    m.res_border_symmetry = pyomo.Constraint(
+        m.tra_border_tuples,
+        rule=res_border_symmetry_rule,
+        doc='border capacity from A to B == border capacity from B to A')
+    add_border_terms(m)
+
+    coupled = ['e_tra_border', 'cap_tra_border']
+    if co2_limit is not None:
+        m.co2_budget = pyomo.Var(
+            within=pyomo.Reals,
+            doc='Regional share of the global CO2 limit (t)')
+        m.res_co2_budget = pyomo.Constraint(
+            rule=res_co2_budget_rule,
+            doc='total regional co2 commodity output <= CO2 budget')
+        coupled.append('co2_budget')
+    m.coupled = coupled
+
+    m.rho = pyomo.Param(
+        initialize=rho,
+        doc='Penalty parameter of the augmented Lagrangian')
+    penalty = 0
+    for name in coupled:
+        var = getattr(m, name)
+        index = [var.index_set()] if var.is_indexed() else []
+        m.add_component('z_' + name, pyomo.Param(
+            *index, initialize=0, mutable=True,
+            doc='Consensus value of {}'.format(name)))
+        m.add_component('lambda_' + name, pyomo.Param(
+            *index, initialize=0, mutable=True,
+            doc='Multiplier of {}'.format(name)))
+        z = getattr(m, 'z_' + name)
+        multiplier = getattr(m, 'lambda_' + name)
+        for idx, x in var.iteritems():
+            penalty += (multiplier[idx] * (x - z[idx]) +
+                        m.rho / 2 * (x - z[idx]) ** 2)
+
+    m.obj.deactivate()
+    m.obj_admm = pyomo.Objective(
+        expr=pyomo.summation(m.costs) + penalty,
+        sense=pyomo.minimize,
+        doc='minimize(regional costs + augmented Lagrangian terms)')
+    return m
+
+
+# border transmission input <= border transmission capacity
+def res_border_input_by_capacity_rule(m, tm, sin, sout, tra, com):
+    return (m.e_tra_border[tm, sin, sout, tra, com] <=
+            m.duration[tm] * m.cap_tra_border[sin, sout, tra, com])
+
+
+# lower bound (and installed capacity) <= capacity <= upper bound
+def res_border_capacity_rule(m, sin, sout, tra, com):
+    idx = (sin, sout, tra, com)
+    return (max(m.border_dict['cap-lo'][idx], m.border_dict['inst-cap'][idx]),
+            m.cap_tra_border[idx],
+            m.border_dict['cap-up'][idx])
+
+
+# border capacity from A to B == border capacity from B to A, once per pair
+def res_border_symmetry_rule(m, sin, sout, tra, com):
+    if (sout, sin, tra, com) in m.tra_border_tuples and sin < sout:
+        return (m.cap_tra_border[sin, sout, tra, com] ==
+                m.cap_tra_border[sout, sin, tra, com])
+    return pyomo.Constraint.Skip
+
+
+# total regional CO2 output <= regional CO2 budget
+def res_co2_budget_rule(m):
+    co2_output_sum = 0
+    for tm in m.tm:
+        for sit in m.sit:
+            co2_output_sum += (- commodity_balance(m, tm, sit, 'CO2') *
+                               m.weight_t[tm])
+    return co2_output_sum <= m.co2_budget
+
+
+def add_border_terms(m):
+    """Add border flows to the vertex rules and border costs to def_costs.
+
+    A border line's input flow is consumed at its input site, its output
+    (input flow * efficiency) provided at its output site. Investment, fixed
+    and variable costs of a border line are added to the region that
+    contains its input site.
+
+    Args:
+        m: a region model with the border line variables
+
+    Returns:
+        None
+    """
+    com_type = dict(((sit, com), typ) for sit, com, typ
+                    in m.com_vertex_tuples)
+    invest, fixed, variable = 0, 0, 0
+    for idx in m.tra_border_tuples:
+        sin, sout, tra, com = idx
+        eff = m.border_dict['eff'][idx]
+        owner = sin in m.region_sites
+        sit = sin if owner else sout
+        for tm in m.tm:
+            flow = m.e_tra_border[(tm,) + idx]
+            vertex = m.res_vertex[tm, sit, com, com_type[sit, com]]
+            term = -flow if owner else eff * flow
+            vertex.set_value(vertex.body + term == vertex.upper)
+            if owner:
+                variable += (flow * m.weight_t[tm] *
+                             m.border_dict['var-cost'][idx])
+        if owner:
+            cap = m.cap_tra_border[idx]
+            invest += ((cap - m.border_dict['inst-cap'][idx]) *
+                       m.border_dict['inv-cost'][idx] *
+                       m.border_dict['annuity-factor'][idx])
+            fixed += cap * m.border_dict['fix-cost'][idx]
+
+    # costs[cost_type] == cost terms + border costs
+    for cost_type, term in [('Invest', invest), ('Fixed', fixed),
+                            ('Variable', variable)]:
+        con = m.def_costs[cost_type]
+        con.set_value(con.body - term == con.upper)
+
+
+def add_border_results(m, cache):
+    """Add the border lines of a region to its transmission results.
+
+    Each border line is added by the region that contains its input site,
+    i.e. bears its costs: its flow to e_tra_in, flow * efficiency to
+    e_tra_out and its capacity to cap_tra and cap_tra_new.
+
+    Args:
+        m: a solved region model
+        cache: result cache of m, modified in place
+
+    Returns:
+        None
+    """
+    lines = [idx for idx in m.tra_border_tuples if idx[0] in m.region_sites]
+    if not lines:
+        return
+    flow_index, flows, outputs = [], [], []
+    for idx in lines:
+        eff = m.border_dict['eff'][idx]
+        for tm in m.tm:
+            flow = m.e_tra_border[(tm,) + idx].value
+            flow_index.append((tm,) + idx)
+            flows.append(flow)
+            outputs.append(None if flow is None else eff * flow)
+    caps = [m.cap_tra_border[idx].value for idx in lines]
+    new_caps = [None if cap is None else cap - m.border_dict['inst-cap'][idx]
+                for cap, idx in zip(caps, lines)]
+
+    flow_index = pd.MultiIndex.from_tuples(
+        flow_index, names=['t'] + TRANSMISSION_LEVELS)
+    cap_index = pd.MultiIndex.from_tuples(lines, names=TRANSMISSION_LEVELS)
+    for name, index, values in [('e_tra_in', flow_index, flows),
+                                ('e_tra_out', flow_index, outputs),
+                                ('cap_tra', cap_index, caps),
+                                ('cap_tra_new', cap_index, new_caps)]:
+        border = pd.Series(values, index=index, name=name, dtype=float)
+        if name in cache and not cache[name].empty:
+            border = pd.concat([cache[name], border])
+        cache[name] = border
+
+
+def update_consensus(values, multipliers, rho, co2_limit=None):
+    """Consensus values of the coupling variables of all regions.
+
+    Copies of a border variable are averaged (including their scaled
+    multipliers). Regional CO2 budgets are projected onto the global limit,
+    i.e. shifted evenly if their sum exceeds it.
+
+    Args:
+        values: dict of region -> dict of (name, index) -> value
+        multipliers: dict of region -> dict of (name, index) -> multiplier
+        rho: penalty parameter of the augmented Lagrangian
+        co2_limit: global CO2 limit, or None
+
+    Returns:
+        dict of region -> dict of (name, index) -> consensus value
+    """
+    copies = {}
+    for region, x in values.items():
+        for key, value in x.items():
+            copies.setdefault(key, []).append(
+                (region, value + multipliers[region].get(key, 0) / rho))
+
+    consensus = {region: {} for region in values}
+    for key, items in copies.items():
+        if key[0] == 'co2_budget':
+            continue
+        mean = sum(value for _, value in items) / len(items)
+        for region, _ in items:
+            consensus[region][key] = mean
+
+    budgets = copies.get(('co2_budget', None), [])
+    if budgets:
+        excess = max(0, sum(value for _, value in budgets) - co2_limit)
+        for region, value in budgets:
+            consensus[region][('co2_budget', None)] = (
+                value - excess / len(budgets))
+    return consensus
+
+
+def merge_caches(caches):
+    """Merge result caches of regions into one.
+
+    Costs are summed; all other entities are concatenated, keeping the first
+    value of entries present in several regions (e.g. border variables).
+
+    Args:
+        caches: list of result caches (dict of entity name -> Series)
+
+    Returns:
+        a result cache
+    """
+    merged = {}
+    for name in sorted(set().union(*caches)):
+        parts = [cache[name] for cache in caches if name in cache]
+        if name == 'costs':
+            merged[name] = sum(parts[1:], parts[0])
+        else:
+            combined = pd.concat(parts)
+            merged[name] = combined[~combined.index.duplicated()]
+    return merged
+
+
+def _map(pool, function, tasks):
+    """Map function over tasks, in the pool if given. """
+    if pool is None:
+        return [function(task) for task in tasks]
+    return pool.map(function, tasks)
+
+
+def _init_worker(data, timesteps, dt, rho, solver, co2_limit, model_kwds):
+    """Initialise the state of a worker process. """
+    _worker.clear()
+    _worker.update(data=data, timesteps=timesteps, dt=dt, rho=rho,
+                   solver=SolverFactory(solver), co2_limit=co2_limit,
+                   model_kwds=model_kwds, models={})
+
+
+def _solve_region(task):
+    """Solve a region at given consensus values and multipliers.
+
+    Raises RuntimeError if the region is not solved to optimality, as its
+    values would be those of the previous iteration.
+
+    Returns:
+        (dict of (name, index) -> value, result cache or None) tuple
+    """
+    name, sites, consensus, multipliers, cache = task
+    m = _worker['models'].get(name)
+    if m is None:
+        m = create_region(_worker['data'], sites, _worker['timesteps'],
+                          _worker['dt'], _worker['rho'],
+                          _worker['co2_limit'], **_worker['model_kwds'])
+        _worker['models'][name] = m
+
+    for var_name in m.coupled:
+        z = getattr(m, 'z_' + var_name)
+        multiplier = getattr(m, 'lambda_' + var_name)
+        for idx, _ in getattr(m, var_name).iteritems():
+            z[idx] = consensus.get((var_name, idx), 0)
+            multiplier[idx] = multipliers.get((var_name, idx), 0)
+    result = _worker['solver'].solve(m)
+    condition = result.solver.termination_condition
+    if condition != TerminationCondition.optimal:
+        raise RuntimeError("Region {} (sites {}) not solved to optimality: "
+                           "{}.".format(name, ', '.join(sites), condition))
+
+    values = {(var_name, idx): pyomo.value(x)
+              for var_name in m.coupled
+              for idx, x in getattr(m, var_name).iteritems()}
+    result = None
+    if cache:
+        result = create_result_cache(m)
+        add_border_results(m, result)
+        del _worker['models'][name]
+    return values, result
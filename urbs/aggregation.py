@@ -0,0 +1,290 @@
+"""Time series aggregation into representative periods and segments.
+
+aggregate_timeseries clusters the periods (e.g. days or weeks) of the
+timeseries tables 'demand', 'supim' and 'buy_sell_price' into k groups by
+k-medoids on normalised profiles. The medoid periods replace the full
+timeseries. Their timesteps are weighted with the number of periods they
+represent, given in the additional input table 'timestep' (columns 'weight'
+and 'period'), which create_model uses for per-timestep cost and emission
+weights and for cyclic storage and ramping within each period.
+
+segment_timeseries merges consecutive timesteps with similar profiles into
+segments of variable duration (column 'duration' of table 'timestep').
+"""
+import numpy as np
+import pandas as pd
+
+TIMESERIES = ['demand', 'supim', 'buy_sell_price']
+
+
+def aggregate_timeseries(data, k, period_length=24, timesteps=None,
+                         max_iter=100):
+    """Reduce the timeseries to k representative periods.
+
+    Args:
+        data: a dict of DataFrames, as returned by read_excel
+        k: number of representative periods
+        period_length: number of timesteps per period (default: 24)
+        timesteps: optional list of timesteps (the first being the initial
+            timestep), default: demand timeseries; trailing timesteps that
+            do not fill a whole period are ignored
+        max_iter: maximum number of k-medoids iterations
+
+    Returns:
+        a new dict of DataFrames with reduced timeseries, consecutively
+        numbered from the initial timestep on, and the table 'timestep'
+        with the columns 'weight' (number of represented periods) and
+        'period' (number of the representative period)
+
+    Example:
+        >>> data = read_excel('mimo-example.xlsx')
+        >>> data = aggregate_timeseries(data, 12, period_length=24)
+        >>> prob = create_model(data)
+    """
+    if timesteps is None:
+        timesteps = data['demand'].index.tolist()
+    timesteps = list(timesteps)
+    t0 = timesteps[0]
+    n_periods = (len(timesteps) - 1) // period_length
+    if not 0 < k <= n_periods:
+        raise ValueError("k must be between 1 and the number of periods "
+                         "({}).".format(n_periods))
+    modelled = timesteps[1:n_periods * period_length + 1]
+
+    features = period_features(data, modelled, n_periods, period_length)
+    medoids, labels = k_medoids(features, k, max_iter)
+
+    # representative timesteps, in order of the original timesteps
+    medoids = sorted(medoids)
+    steps = [t0]
+    for medoid in medoids:
+        start = medoid * period_length
+        steps.extend(modelled[start:start + period_length])
+    new_index = pd.Index(range(t0, t0 + len(steps)), name='t')
+
+    aggregated = dict(data)
+    for name in TIMESERIES:
+        if name in data and not data[name].empty:
+            table = data[name].loc[steps].copy()
+            table.index = new_index
+            aggregated[name] = table
+
+    weight = [np.sum(labels == medoid) for medoid in medoids]
+    aggregated['timestep'] = pd.DataFrame(
+        {'weight': [1.0] + list(np.repeat(weight, period_length)),
+         'period': [-1] + list(np.repeat(range(len(medoids)),
+                                         period_length))},
+        index=new_index, columns=['weight', 'period'])
+    return aggregated
+
+
+def period_features(data, modelled, n_periods, period_length):
+    """Normalised timeseries profiles as one feature vector per period.
+
+    Each timeseries column is scaled to the range [0, 1]; constant columns
+    are omitted.
+
+    Args:
+        data: a dict of DataFrames, as returned by read_excel
+        modelled: list of modelled timesteps, n_periods * period_length
+        n_periods: number of periods
+        period_length: number of timesteps per period
+
+    Returns:
+        array of shape (n_periods, period_length * number of columns)
+    """
+    values = normalised_profiles(data, modelled)
+    # (timestep, column) -> (period, timestep within period * column)
+    return values.reshape(n_periods, period_length * values.shape[1])
+
+
+def normalised_profiles(data, steps):
+    """Timeseries values, each column scaled to the range [0, 1].
+
+    Args:
+        data: a dict of DataFrames, as returned by read_excel
+        steps: list of timesteps
+
+    Returns:
+        array of shape (len(steps), number of non-constant columns), at least
+        one column of zeros if all columns are constant
+    """
+    columns = []
+    for name in TIMESERIES:
+        if name not in data or data[name].empty:
+            continue
+        values = data[name].loc[steps].values.astype(float)
+        span = values.max(axis=0) - values.min(axis=0)
+        varying = span > 0
+        columns.append((values[:, varying] - values.min(axis=0)[varying]) /
+                       span[varying])
+    if not columns:
+        return np.zeros((len(steps), 1))
+    return np.hstack(columns)
+
+
+def segment_timeseries(data, n_segments, timesteps=None, dt=1):
+    """Merge consecutive timesteps with similar profiles into segments.
+
+    Adjacent timesteps (or segments) are merged greedily, always the pair
+    with the smallest increase of the duration-weighted squared deviation
+    from the segment means (Ward criterion) on normalised profiles, until
+    n_segments remain. Segments never cross period boundaries of a
+    previous aggregate_timeseries. The demand of a segment is the sum of
+    the demand of its timesteps, as demand is energy per timestep; supim
+    and buy/sell prices of a segment are the duration-weighted means.
+
+    Args:
+        data: a dict of DataFrames, as returned by read_excel (optionally
+            aggregated by aggregate_timeseries)
+        n_segments: number of modelled timesteps after segmentation
+        timesteps: optional list of timesteps (the first being the initial
+            timestep), default: demand timeseries
+        dt: timestep duration in hours (default: 1), unless given by the
+            column 'duration' of table 'timestep'
+
+    Returns:
+        a new dict of DataFrames with segmented timeseries, consecutively
+        numbered from the initial timestep on, and the table 'timestep' with
+        the column 'duration' (and 'weight', 'period' if present before)
+
+    Example:
+        >>> data = read_excel('mimo-example.xlsx')
+        >>> data = segment_timeseries(data, 2000)
+        >>> prob = create_model(data)
+    """
+    if timesteps is None:
+        timesteps = data['demand'].index.tolist()
+    timesteps = list(timesteps)
+    t0 = timesteps[0]
+    modelled = timesteps[1:]
+    if not 0 < n_segments <= len(modelled):
+        raise ValueError("n_segments must be between 1 and the number of "
+                         "modelled timesteps ({}).".format(len(modelled)))
+
+    prop = data.get('timestep', pd.DataFrame())
+    if 'duration' in prop.columns:
+        duration = prop['duration'].loc[modelled].values.astype(float)
+    else:
+        duration = np.full(len(modelled), float(dt))
+    if 'period' in prop.columns:
+        period = prop['period'].loc[modelled].values
+    else:
+        period = np.zeros(len(modelled), dtype=int)
+
+    # segments: first timestep position, total duration, weighted sums
+    values = normalised_profiles(data, modelled)
+    first = np.arange(len(modelled))
+    weight = duration.copy()
+    sums = values * duration[:, None]
+
+    def merge_cost(i):
+        # increase of weighted squared deviation if segments i, i+1 merge
+        if period[first[i]] != period[first[i + 1]]:
+            return np.inf
+        diff = sums[i] / weight[i] - sums[i + 1] / weight[i + 1]
+        return (weight[i] * weight[i + 1] / (weight[i] + weight[i + 1]) *
+                diff.dot(diff))
+
+    cost = np.array([merge_cost(i) for i in range(len(first) - 1)])
+    while len(first) > n_segments and len(cost):
+        i = int(np.argmin(cost))
+        if np.isinf(cost[i]):
+            break
+        weight[i] += weight[i + 1]
+        sums[i] += sums[i + 1]
+        first = np.delete(first, i + 1)
+        weight = np.delete(weight, i + 1)
+        sums = np.delete(sums, i + 1, axis=0)
+        cost = np.delete(cost, i)
+        for j in (i - 1, i):
+            if 0 <= j < len(cost):
+                cost[j] = merge_cost(j)
+
+    # segment number of each timestep
+    segment = np.zeros(len(modelled), dtype=int)
+    segment[first[1:]] = 1
+    segment = np.cumsum(segment)
+    new_index = pd.Index(range(t0, t0 + len(first) + 1), name='t')
+
+    segmented = dict(data)
+    for name in TIMESERIES:
+        if name in data and not data[name].empty:
+            table = data[name]
+            if name == 'demand':
+                merged = table.loc[modelled].groupby(segment).sum()
+            else:
+                merged = table.loc[modelled].mul(duration, axis=0)
+                merged = merged.groupby(segment).sum().div(weight, axis=0)
+            table = pd.concat([table.loc[[t0]], merged])
+            table.index = new_index
+            segmented[name] = table
+
+    timestep = pd.DataFrame(index=new_index)
+    timestep['duration'] = np.concatenate([[dt], weight])
+    for column in ('weight', 'period'):
+        if column in prop.columns:
+            timestep[column] = np.concatenate(
+                [prop[column].loc[[t0]].values,
+                 prop[column].loc[modelled].values[first]])
+    segmented['timestep'] = timestep
+    return segmented
+
+
+def k_medoids(features, k, max_iter=100):
+    """Cluster feature vectors by k-medoids (alternating assignment).
+
+    Initial medoids are chosen deterministically: the period closest to the
+    mean, followed by the periods farthest from all medoids chosen so far.
+
+    Args:
+        features: array of shape (number of periods, number of features)
+        k: number of clusters
+        max_iter: maximum number of iterations
+
+    Returns:
+        (medoids, labels) tuple; medoids is a list of k period numbers,
+        labels is an array assigning each period its medoid
+    """
+    # pairwise euclidean distances, without a (periods x periods x features)
+    # intermediate array
+    squared = (features ** 2).sum(axis=1)
+    distance = np.sqrt(np.maximum(
+        squared[:, None] + squared[None, :] - 2 * features.dot(features.T),
+        0))
+
+    centre = np.argmin(((features - features.mean(axis=0)) ** 2).sum(axis=1))
+    medoids = [int(centre)]
+    while len(medoids) < k:
+        farthest = distance[:, medoids].min(axis=1)
+        farthest[medoids] = -1  # never choose a medoid twice
+        medoids.append(int(np.argmax(farthest)))
+
+    for _ in range(max_iter):
+        labels = np.array(medoids)[np.argmin(distance[:, medoids], axis=1)]
+        new_medoids = []
+        for medoid in medoids:
+            members = np.flatnonzero(labels == medoid)
+            if len(members) == 0:
+                # medoid identical to another one; reseeded below
+                new_medoids.append(None)
+                continue
+            cost = distance[np.ix_(members, members)].sum(axis=1)
+            new_medoids.append(int(members[np.argmin(cost)]))
+
+        # reseed empty clusters and medoids chosen twice with the period
+        # farthest from all other medoids, so that each period is the medoid
+        # of at most one cluster and no weight is counted twice
+        chosen = [medoid for i, medoid in enumerate(new_medoids)
+                  if medoid is not None and medoid not in new_medoids[:i]]
+        for i, medoid in enumerate(new_medoids):
+            if medoid is None or new_medoids.index(medoid) != i:
+                farthest = distance[:, chosen].min(axis=1)
+                farthest[chosen] = -1
+                new_medoids[i] = int(np.argmax(farthest))
+                chosen.append(new_medoids[i])
+        if new_medoids == medoids:
+            break
+        medoids = new_medoids
+    labels = np.array(medoids)[np.argmin(distance[:, medoids], axis=1)]
+    return medoids, labels
@@ -0,0 +1,512 @@
+"""Benders decomposition of capacity expansion and dispatch.
+
+The master problem holds the capacities (cap_pro, cap_tra, cap_sto_c,
+cap_sto_p) with their bounds, symmetry and area constraints and the
+investment and fixed costs. Dispatch subproblems cover consecutive blocks of
+timesteps with capacities fixed by linking constraints; their objective
+values and the duals of the linking constraints become optimality cuts on
+the dispatch cost estimate of each block in the master problem.
+
+Subproblems are solved in local worker processes, each of which always
+solves the same blocks (see urbs.parallel). It keeps the subproblems it has
+built and only updates their fixed capacities in later iterations. To keep
+subproblems feasible for any capacities, demand commodities get unserved
+and excess energy slacks, the final storage content a deficit slack and
+the minimum throughput of partial load processes a shortfall slack, all
+penalised with the value of lost load.
+"""
+import multiprocessing
+import warnings
+import pandas as pd
+import pyomo.core as pyomo
+from pyomo.opt import TerminationCondition
+from pyomo.opt.base import SolverFactory
+from .encoding import require_labels
+from .model import create_model
+from .parallel import PinnedPool
+from .rolling import TIME_DEPENDENT_COSTS, rolling_windows, stitch_caches
+from .saveload import ResultContainer, create_result_cache
+
+# total capacities, fixed in the subproblems
+CAPACITIES = ['cap_pro', 'cap_tra', 'cap_sto_c', 'cap_sto_p']
+
+# constraints on capacities only, part of the master problem
+MASTER_CONSTRAINTS = [
+    'def_process_capacity', 'res_process_capacity', 'res_area',
+    'res_sell_buy_symmetry', 'def_transmission_capacity',
+    'res_transmission_capacity', 'res_transmission_symmetry',
+    'def_storage_power', 'def_storage_capacity', 'res_storage_power',
+    'res_storage_capacity']
+
+# master problem constraints that fixed capacities satisfy anyway and that
+# are left out of the subproblems
+SATISFIED_CONSTRAINTS = [
+    'res_process_capacity', 'res_area', 'res_sell_buy_symmetry',
+    'res_transmission_capacity', 'res_transmission_symmetry',
+    'res_storage_power', 'res_storage_capacity']
+
+# penalised slack variables of the demand commodities' vertex rules, of the
+# final storage content and of the minimum process throughput
+SLACKS = ['e_co_unserved', 'e_co_excess', 'e_sto_deficit',
+          'tau_pro_shortfall']
+
+# slack energy per timestep (MWh) above which the final dispatch is reported
+# as deficient
+SLACK_TOLERANCE = 1e-6
+
+# state of a worker process: input data, solver and built subproblems
+_worker = {}
+
+
+def run_benders(data, timesteps, block, solver='glpk', dt=1, processes=None,
+                max_iter=50, tol=1e-4, voll=1e5, **model_kwds):
+    """Solve an urbs model by Benders decomposition.
+
+    The timesteps are split into blocks of consecutive timesteps, each one a
+    dispatch subproblem. Like in run_rolling_horizon, storage content of each
+    block starts at its initial value and annual limits (commodity max,
+    global CO2 limit) apply to each block after scaling with its weight.
+    The total dispatch costs are the share-weighted sum of the block costs.
+
+    Args:
+        data: a dict of DataFrames, as returned by read_excel
+        timesteps: list of timesteps, the first being the initial timestep
+        block: number of modelled timesteps per subproblem
+        solver: a solver name (e.g. 'glpk'), used for master and
+            subproblems
+        dt: timestep duration in hours (default: 1)
+        processes: number of local worker processes (at most one per
+            block); default: number of CPUs; 1 solves the subproblems in
+            this process
+        max_iter: maximum number of iterations
+        tol: relative gap between upper and lower bound at convergence
+        voll: value of lost load (EUR/MWh), penalty of unserved or excess
+            demand commodity energy, storage deficit and throughput
+            shortfall in the subproblems
+        **model_kwds: keyword arguments forwarded to create_model
+
+    Returns:
+        a ResultContainer with input data and stitched subproblem results
+        at the best capacities found, usable with report, result_figures
+        and save; its attribute bounds is a DataFrame of lower and upper
+        bound per iteration, its attribute penalty the penalty of the
+        subproblem slacks (EUR/a), which is not part of the costs. A
+        warning is issued if the final dispatch uses any of the slacks.
+
+    Example:
+        >>> data = read_excel('mimo-example.xlsx')
+        >>> prob = run_benders(data, range(0, 8761), 168, 'glpk',
+        ...                    processes=8)
+        >>> report(prob, 'report.xlsx')
+    """
+    require_labels('run_benders', model_kwds)
+    timesteps = list(timesteps)
+    blocks = [steps for steps, _ in rolling_windows(timesteps, block, 0)]
+    shares = [float(len(steps) - 1) / (len(timesteps) - 1)
+              for steps in blocks]
+
+    master = create_master(data, timesteps, shares, dt, **model_kwds)
+    optim = SolverFactory(solver)
+
+    if processes == 1:
+        pool = None
+        _init_worker(data, dt, solver, voll, model_kwds)
+    else:
+        pool = PinnedPool(
+            min(processes or multiprocessing.cpu_count(), len(blocks)),
+            initializer=_init_worker,
+            initargs=(data, dt, solver, voll, model_kwds))
+
+    try:
+        # dispatch costs of each block for free capacities bound theta from
+        # below, so that the master problem is bounded from the first cut on
+        for k, value in enumerate(_solve_blocks(pool, blocks, None)):
+            master.theta[k].setlb(value)
+
+        bounds = []
+        lower, upper = -float('inf'), float('inf')
+        best = None
+        for iteration in range(max_iter):
+            if iteration == 0:
+                # capacities without dispatch cost estimate
+                for k in master.block:
+                    master.theta[k].fix(master.theta[k].lb)
+            else:
+                master.theta.unfix()
+            check_termination(optim.solve(master), 'Benders master problem')
+            if iteration > 0:
+                lower = pyomo.value(master.obj_benders)
+            capacities = get_capacities(master)
+
+            solutions = _solve_blocks(pool, blocks, capacities)
+            total = (pyomo.value(master.costs['Invest']) +
+                     pyomo.value(master.costs['Fixed']) +
+                     sum(share * objective for share, (objective, _, _)
+                         in zip(shares, solutions)))
+            if total < upper:
+                upper, best = total, capacities
+            bounds.append((lower, upper))
+
+            for k, (objective, duals, _) in enumerate(solutions):
+                master.cuts.add(optimality_cut(
+                    master, k, objective, duals, capacities))
+            if upper - lower <= tol * max(abs(upper), 1):
+                break
+
+        # results of all blocks at the best capacities
+        solutions = _solve_blocks(pool, blocks, best, cache=True)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    caches = [(result, steps[1:])
+              for (_, _, result), steps in zip(solutions, blocks)]
+    # objective = time-dependent costs + penalised slacks
+    penalty = sum(share * (objective - sum(cache['costs'][cost_type]
+                                           for cost_type
+                                           in TIME_DEPENDENT_COSTS))
+                  for share, (objective, _, cache) in zip(shares, solutions))
+    # block costs are annual values of the block; their share-weighted sum
+    # is the annual value of the whole horizon, like in the master problem
+    for share, (cache, _) in zip(shares, caches):
+        costs = cache['costs'].copy()
+        for cost_type in TIME_DEPENDENT_COSTS:
+            costs[cost_type] *= share
+        cache['costs'] = costs
+    result = stitch_caches(caches, timesteps)
+    check_slacks(result, penalty)
+    prob = ResultContainer(data, result)
+    prob.penalty = penalty
+    prob.bounds = pd.DataFrame(bounds, columns=['lower', 'upper'])
+    prob.bounds.index.name = 'iteration'
+    return prob
+
+
+def create_master(data, timesteps, shares, dt=1, **model_kwds):
+    """Create the Benders master problem.
+
+    The master problem is a urbs model of the first modelled timestep in
+    which only the constraints on capacities and the investment and fixed
+    costs are active. Its objective adds the estimated dispatch costs theta
+    of each block, weighted with the block's share of the timesteps.
+
+    Args:
+        data: a dict of DataFrames, as returned by read_excel
+        timesteps: list of timesteps, the first being the initial timestep
+        shares: list of the shares of all blocks in the modelled timesteps
+        dt: timestep duration in hours (default: 1)
+        **model_kwds: keyword arguments forwarded to create_model
+
+    Returns:
+        a pyomo ConcreteModel object
+    """
+    m = create_model(data, dt, timesteps[:2], **model_kwds)
+    for constraint in m.component_objects(pyomo.Constraint):
+        if constraint.name not in MASTER_CONSTRAINTS + ['def_costs']:
+            constraint.deactivate()
+    for cost_type in m.cost_type:
+        if cost_type in TIME_DEPENDENT_COSTS:
+            m.def_costs[cost_type].deactivate()
+    m.obj.deactivate()
+
+    m.block = pyomo.Set(
+        initialize=range(len(shares)),
+        ordered=True,
+        doc='Set of dispatch subproblems')
+    m.share = pyomo.Param(
+        m.block,
+        initialize=dict(enumerate(shares)),
+        doc='Share of modelled timesteps per subproblem')
+    m.theta = pyomo.Var(
+        m.block,
+        within=pyomo.Reals,
+        doc='Estimated dispatch costs (EUR/a) per subproblem; bounded from '
+            'below by run_benders')
+    m.cuts = pyomo.ConstraintList(
+        doc='Benders optimality cuts')
+    m.obj_benders = pyomo.Objective(
+        expr=m.costs['Invest'] + m.costs['Fixed'] +
+        sum(m.share[k] * m.theta[k] for k in m.block),
+        sense=pyomo.minimize,
+        doc='minimize(investment + fixed + estimated dispatch costs)')
+    return m
+
+
+def create_subproblem(data, steps, dt=1, voll=1e5, **model_kwds):
+    """Create a dispatch subproblem with capacities fixed by constraints.
+
+    For each capacity variable name in CAPACITIES, a mutable Param
+    benders_<name> holds the fixed value and a Constraint res_benders_<name>
+    links the variable to it; the duals of the latter are the marginal
+    dispatch costs of capacity. The objective comprises the time-dependent
+    costs, the penalised slacks e_co_unserved and e_co_excess of the
+    demand commodities' vertex rules and the penalised slacks e_sto_deficit
+    of the final storage content and tau_pro_shortfall of the minimum
+    process throughput, which may otherwise be unreachable, e.g. for storage
+    content capacity without storage power or for a partial load process
+    whose minimum throughput exceeds the commodity or emission limits.
+
+    Args:
+        data: a dict of DataFrames, as returned by read_excel
+        steps: timesteps of the block, the first being the initial timestep
+        dt: timestep duration in hours (default: 1)
+        voll: value of lost load (EUR/MWh)
+        **model_kwds: keyword arguments forwarded to create_model
+
+    Returns:
+        a pyomo ConcreteModel object with dual suffix
+    """
+    m = create_model(data, dt, steps, dual=True, **model_kwds)
+    for name in SATISFIED_CONSTRAINTS:
+        if hasattr(m, name):
+            getattr(m, name).deactivate()
+
+    for name in CAPACITIES:
+        var = getattr(m, name)
+        m.add_component('benders_' + name, pyomo.Param(
+            var.index_set(),
+            initialize=0,
+            mutable=True,
+            doc='Fixed {} from the master problem'.format(name)))
+        m.add_component('res_benders_' + name, pyomo.Constraint(
+            var.index_set(),
+            rule=_link_rule(name),
+            doc='{0} == benders_{0}'.format(name)))
+
+    m.demand_tuples = pyomo.Set(
+        within=m.sit*m.com,
+        initialize=[(sit, com) for (sit, com, com_type)
+                    in m.com_vertex_tuples if com_type == 'Demand'],
+        doc='Combinations of demand commodities, e.g. (Mid,Elec)')
+    m.e_co_unserved = pyomo.Var(
+        m.tm, m.demand_tuples,
+        within=pyomo.NonNegativeReals,
+        doc='Unserved demand commodity energy (MWh) per timestep')
+    m.e_co_excess = pyomo.Var(
+        m.tm, m.demand_tuples,
+        within=pyomo.NonNegativeReals,
+        doc='Excess demand commodity energy (MWh) per timestep')
+    for tm in m.tm:
+        for sit, com in m.demand_tuples:
+            vertex = m.res_vertex[tm, sit, com, 'Demand']
+            vertex.set_value(vertex.body + m.e_co_unserved[tm, sit, com] -
+                             m.e_co_excess[tm, sit, com] == vertex.upper)
+
+    t_last = m.t[len(m.t)]  # Pyomo uses 1-based indexing
+    m.sto_final_tuples = pyomo.Set(
+        within=m.t*m.sto_tuples,
+        initialize=[] if m.periodic else
+        [(t_last,) + s for s in m.sto_tuples],
+        doc='Final timestep and storage, e.g. (12,Mid,Bat,Elec)')
+    m.e_sto_deficit = pyomo.Var(
+        m.sto_final_tuples,
+        within=pyomo.NonNegativeReals,
+        doc='Final storage content (MWh) missing to the initial content')
+    for idx in m.sto_final_tuples:
+        m.res_initial_and_final_storage_state[idx].deactivate()
+    m.res_benders_final_storage = pyomo.Constraint(
+        m.sto_final_tuples,
+        rule=_final_storage_rule,
+        doc='storage content final + deficit >= storage.init * capacity')
+
+    m.tau_pro_shortfall = pyomo.Var(
+        m.tm, m.pro_partial_tuples,
+        within=pyomo.NonNegativeReals,
+        doc='Process throughput (MWh) missing to the minimum throughput')
+    m.res_throughput_by_capacity_min.deactivate()
+    m.res_benders_throughput_min = pyomo.Constraint(
+        m.tm, m.pro_partial_tuples,
+        rule=_throughput_min_rule,
+        doc='tau_pro + shortfall >= cap_pro * min-fraction')
+
+    m.obj.deactivate()
+    m.obj_benders = pyomo.Objective(
+        expr=sum(m.costs[cost_type] for cost_type in TIME_DEPENDENT_COSTS) +
+        voll * sum(m.weight_t[tm] *
+                   (m.e_co_unserved[tm, sit, com] +
+                    m.e_co_excess[tm, sit, com])
+                   for tm in m.tm for sit, com in m.demand_tuples) +
+        voll * m.weight * sum(m.e_sto_deficit[idx]
+                              for idx in m.sto_final_tuples) +
+        voll * sum(m.weight_t[tm] * m.tau_pro_shortfall[tm, sit, pro]
+                   for tm in m.tm for sit, pro in m.pro_partial_tuples),
+        sense=pyomo.minimize,
+        doc='minimize(dispatch costs + penalised slacks)')
+    return m
+
+
+def _final_storage_rule(m, t, sit, sto, com):
+    """Final storage content plus deficit at least the initial content. """
+    return (m.e_sto_con[t, sit, sto, com] +
+            m.e_sto_deficit[t, sit, sto, com] >=
+            m.cap_sto_c[sit, sto, com] *
+            m.storage_dict['init'][(sit, sto, com)])
+
+
+def _throughput_min_rule(m, tm, sit, pro):
+    """Process throughput plus shortfall at least the minimum throughput. """
+    return (m.tau_pro[tm, sit, pro] + m.tau_pro_shortfall[tm, sit, pro] >=
+            m.cap_pro[sit, pro] *
+            m.process_dict['min-fraction'][(sit, pro)] * m.duration[tm])
+
+
+def _link_rule(name):
+    """Constraint rule fixing capacity variable name to its parameter. """
+    def link_rule(m, *idx):
+        return getattr(m, name)[idx] == getattr(m, 'benders_' + name)[idx]
+    return link_rule
+
+
+def get_capacities(m):
+    """Capacity values of a solved model.
+
+    Args:
+        m: a solved master problem (or urbs model)
+
+    Returns:
+        dict of capacity name -> dict of index -> value
+    """
+    return {name: {idx: pyomo.value(entity)
+                   for idx, entity in getattr(m, name).iteritems()}
+            for name in CAPACITIES}
+
+
+def optimality_cut(master, k, objective, duals, capacities):
+    """Optimality cut for block k at given capacities.
+
+    Args:
+        master: the master problem
+        k: block number
+        objective: subproblem objective value at capacities
+        duals: dict of capacity name -> dict of index -> linking dual
+        capacities: dict of capacity name -> dict of index -> value
+
+    Returns:
+        a constraint expression theta[k] >= objective + duals * (x - x_k)
+    """
+    return master.theta[k] >= objective + sum(
+        dual * (getattr(master, name)[idx] - capacities[name][idx])
+        for name in CAPACITIES
+        for idx, dual in duals[name].items()
+        if dual != 0)
+
+
+def check_slacks(result, penalty, tol=SLACK_TOLERANCE):
+    """Warn if a result has unserved or excess demand or other slacks.
+
+    Args:
+        result: a result cache with the entities e_co_unserved,
+            e_co_excess, e_sto_deficit and tau_pro_shortfall
+        penalty: penalty of the slacks (EUR/a), for the warning message
+        tol: largest slack energy per timestep (MWh) that is not reported
+
+    Returns:
+        None
+    """
+    largest = max([result[name].max() for name in SLACKS
+                   if not result[name].empty] or [0])
+    if largest > tol:
+        warnings.warn(
+            "Unserved or excess demand, storage deficit or throughput "
+            "shortfall of up to {:g} MWh per timestep at the final "
+            "capacities, penalised with {:g} EUR/a; increase max_iter or "
+            "check the capacity bounds.".format(largest, penalty))
+
+
+def check_termination(result, name):
+    """Raise RuntimeError unless a solver result is optimal.
+
+    Args:
+        result: results object returned by a solver's solve method
+        name: name of the solved problem, for the error message
+
+    Returns:
+        None
+    """
+    condition = result.solver.termination_condition
+    if condition != TerminationCondition.optimal:
+        raise RuntimeError("{} not solved to optimality: {}.".format(
+            name, condition))
+
+
+def _solve_blocks(pool, blocks, capacities, cache=False):
+    """Solve all subproblems, in the pool if given.
+
+    Without capacities (None), each subproblem is solved for free
+    capacities within their bounds, and only its objective is returned.
+    """
+    tasks = [(k, steps, capacities, cache) for k, steps in enumerate(blocks)]
+    if pool is None:
+        return [_solve_block(task) for task in tasks]
+    return pool.map(_solve_block, tasks)
+
+
+def _init_worker(data, dt, solver, voll, model_kwds):
+    """Initialise the state of a worker process. """
+    _worker.clear()
+    _worker.update(data=data, dt=dt, solver=SolverFactory(solver), voll=voll,
+                   model_kwds=model_kwds, models={})
+
+
+def _solve_block(task):
+    """Solve subproblem k at the given capacities (in a worker process).
+
+    Returns:
+        (objective value, linking duals, result cache or None) tuple; only
+        the objective value for free capacities (capacities None)
+    """
+    k, steps, capacities, cache = task
+    m = _worker['models'].get(k)
+    if m is None:
+        m = create_subproblem(_worker['data'], steps, _worker['dt'],
+                              _worker['voll'], **_worker['model_kwds'])
+        _worker['models'][k] = m
+
+    problem = 'Benders subproblem {} (timesteps {} to {})'.format(
+        k + 1, steps[1], steps[-1])
+    if capacities is None:
+        return _solve_relaxed(m, problem)
+
+    for name in CAPACITIES:
+        param = getattr(m, 'benders_' + name)
+        for idx, value in capacities[name].items():
+            param[idx] = value
+    check_termination(_worker['solver'].solve(m), problem)
+
+    objective = pyomo.value(m.obj_benders)
+    duals = {name: {idx: m.dual.get(con, 0) for idx, con
+                    in getattr(m, 'res_benders_' + name).iteritems()}
+             for name in CAPACITIES}
+    result = None
+    if cache:
+        # duals of deactivated constraints are missing; cache values only
+        m.del_component(m.dual)
+        result = create_result_cache(m)
+        del _worker['models'][k]
+    return objective, duals, result
+
+
+def _solve_relaxed(m, problem):
+    """Objective of subproblem m for free capacities within their bounds.
+
+    The linking constraints are replaced by the capacity constraints of the
+    master problem for this solve, so that the objective is a lower bound
+    of the subproblem's objective for any feasible capacities.
+    """
+    linked = [getattr(m, 'res_benders_' + cap) for cap in CAPACITIES]
+    bounds = [getattr(m, con) for con in SATISFIED_CONSTRAINTS
+              if hasattr(m, con)]
+    for con in linked:
+        con.deactivate()
+    for con in bounds:
+        con.activate()
+    try:
+        check_termination(_worker['solver'].solve(m),
+                          problem + ' for free capacities')
+        return pyomo.value(m.obj_benders)
+    finally:
+        for con in bounds:
+            con.deactivate()
+        for con in linked:
+            con.activate()
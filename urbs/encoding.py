@@ -0,0 +1,172 @@
+"""Integer codes for the labels of sites, commodities and technologies.
+
+With create_model(data, encode=True), the input data is encoded before the
+model is built: all site, commodity, commodity type, process, transmission
+and storage names in the table indexes and timeseries columns are replaced
+by dense integer codes (0, 1, 2, ... per domain, in sorted label order).
+Model sets and indexes then consist of small ints instead of string
+tuples. The codebook is kept in the model attribute _codebook; get_entity
+decodes the result indexes, and the input DataFrames of the model are
+decoded after construction, so that reporting works with labels.
+"""
+import pandas as pd
+
+# index level name -> domain (name of the model set)
+LEVEL_DOMAINS = {
+    'Name': 'sit',
+    'Site': 'sit',
+    'Site In': 'sit',
+    'Site Out': 'sit',
+    'Commodity': 'com',
+    'Type': 'com_type',
+    'Process': 'pro',
+    'Transmission': 'tra',
+    'Storage': 'sto',
+}
+
+# timeseries table -> domains of its column levels
+COLUMN_DOMAINS = {
+    'demand': ['sit', 'com'],
+    'supim': ['sit', 'com'],
+    'buy_sell_price': ['com'],
+}
+
+
+def encode_data(data):
+    """Replace labels in input data by integer codes.
+
+    Args:
+        data: a dict of DataFrames, as returned by read_excel
+
+    Returns:
+        (coded data, codebook) tuple; the codebook maps each domain ('sit',
+        'com', 'com_type', 'pro', 'tra', 'sto') to the list of its labels,
+        so that codebook[domain][code] is the label of a code
+    """
+    labels = {}
+    for key, df in data.items():
+        for name, values in _labelled_levels(key, df.index, df.columns):
+            labels.setdefault(LEVEL_DOMAINS.get(name, name), set()).update(
+                values)
+    codebook = dict((domain, sorted(values, key=str))
+                    for domain, values in labels.items())
+    codes = dict((domain, dict((label, code)
+                               for code, label in enumerate(values)))
+                 for domain, values in codebook.items())
+
+    coded = {}
+    for key, df in data.items():
+        if key in COLUMN_DOMAINS or any(_index_domains(df.index)):
+            # shallow copy: new index, shared values
+            df = df.copy(deep=False)
+            df.index = _map_index(df.index, _index_domains(df.index), codes)
+            if key in COLUMN_DOMAINS and len(df.columns):
+                df.columns = _map_index(df.columns, COLUMN_DOMAINS[key],
+                                        codes)
+            if isinstance(df.index, pd.MultiIndex):
+                df.sort_index(inplace=True)
+        coded[key] = df
+    return coded, codebook
+
+
+def decode_frame(df, codebook, columns=None):
+    """Replace integer codes in a DataFrame or Series index by labels.
+
+    Args:
+        df: DataFrame or Series with coded index; levels are identified by
+            their names (input level names like 'Site' or model set names
+            like 'sit', 'sit_')
+        codebook: codebook as returned by encode_data
+        columns: (optional) list of domains of the column levels
+
+    Returns:
+        a copy of df with decoded index (and columns)
+    """
+    domains = [_domain(name, codebook) for name in df.index.names]
+    if not any(domains) and not columns:
+        return df
+    df = df.copy()
+    if any(domains):
+        df.index = _map_index(df.index, domains, codebook)
+    if columns and len(df.columns):
+        df.columns = _map_index(df.columns, columns, codebook)
+    return df
+
+
+def label_code(m, domain, label):
+    """Code of a label in an encoded model, else the label itself.
+
+    Args:
+        m: a urbs model instance
+        domain: a domain name, e.g. 'com_type'
+        label: a label of that domain, e.g. 'Stock'
+
+    Returns:
+        the integer code of label, or label if the model is not encoded or
+        the label does not occur in the input
+    """
+    codebook = getattr(m, '_codebook', None)
+    if not codebook or label not in codebook.get(domain, []):
+        return label
+    return codebook[domain].index(label)
+
+
+def require_labels(caller, model_kwds):
+    """Raise ValueError if model keyword arguments ask for encoding.
+
+    Functions that modify built models with labelled data (rolling horizon,
+    decompositions) call this for their create_model keyword arguments.
+    """
+    if model_kwds.get('encode'):
+        raise ValueError("{} modifies models with labelled data and does "
+                         "not support encode=True.".format(caller))
+
+
+def _labelled_levels(key, index, columns):
+    """(domain or level name, labels) pairs of a table to be encoded. """
+    for name, domain in zip(index.names, _index_domains(index)):
+        if domain:
+            yield name, index.get_level_values(name)
+    if key in COLUMN_DOMAINS and len(columns):
+        for k, domain in enumerate(COLUMN_DOMAINS[key]):
+            yield domain, columns.get_level_values(k)
+
+
+def _index_domains(index):
+    """Domain of each index level (None for levels without labels). """
+    return [LEVEL_DOMAINS.get(name) for name in index.names]
+
+
+def _domain(name, codebook):
+    """Domain of a result index level, e.g. 'sit_' -> 'sit'. """
+    if name is None:
+        return None
+    name = LEVEL_DOMAINS.get(name, name.rstrip('_'))
+    return name if name in codebook else None
+
+
+def _map_index(index, domains, mappings):
+    """Map the values of index levels by a dict or list per domain.
+
+    Args:
+        index: Index or MultiIndex
+        domains: list of domains (or None) per level
+        mappings: dict of domain -> mapping, a dict (encode) or a list
+            (decode) that is indexed by the value
+
+    Returns:
+        a new Index or MultiIndex with the same names
+    """
+    if not isinstance(index, pd.MultiIndex):
+        if not domains[0]:
+            return index
+        mapping = mappings[domains[0]]
+        return pd.Index([mapping[v] for v in index], name=index.name)
+
+    levels = []
+    for level, domain in zip(index.levels, domains):
+        if domain:
+            mapping = mappings[domain]
+            level = [mapping[v] for v in level]
+        levels.append(level)
+    return index.set_levels(levels)
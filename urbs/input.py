@@ -1,10 +1,15 @@
+import os
+import warnings
 import pandas as pd
 from xlrd import XLRDError
 import pyomo.core as pyomo
+from .inputcache import cache_key, load_cached, store_cached
 from .modelhelper import *
+from .profiler import ProfiledModel
+from .store import ParamStore, TimeSeriesStore
 
 
-def read_excel(filename):
+def read_excel(filename, cache=True):
     """Read Excel input file and prepare URBS input dict.
 
     Reads an Excel spreadsheet that adheres to the structure shown in
@@ -14,10 +19,18 @@ def read_excel(filename):
     2. The attribute 'annuity-factor' is derived here from the columns 'wacc'
     and 'depreciation' for 'Process', 'Transmission' and 'Storage'.
 
+    The prepared data is cached under the hash of the file content (see
+    urbs.inputcache), so reading an unchanged file again skips parsing.
+    If the cache cannot be used (e.g. its directory cannot be created or
+    written), a warning is issued and the parsed data is returned
+    nonetheless.
+
     Args:
         filename: filename to an Excel spreadsheet with the required sheets
             'Commodity', 'Process', 'Transmission', 'Storage', 'Demand' and
             'SupIm'.
+        cache: (optional) if False, always parse the spreadsheet and leave
+            the cache untouched
 
     Returns:
         a dict of 6 DataFrames
@@ -27,46 +40,171 @@ def read_excel(filename):
         >>> data['global_prop'].loc['CO2 limit', 'value']
         150000000
     """
+    if not cache:
+        return parse_excel(filename)
+
+    key = cache_key(filename)
+    try:
+        data = load_cached(key)
+    except Exception as err:
+        warnings.warn("Could not read input cache for {}: {}".format(
+            filename, err))
+        return parse_excel(filename)
+    if data is None:
+        data = parse_excel(filename)
+        try:
+            store_cached(key, data)
+        except Exception as err:
+            warnings.warn("Could not cache input data of {}: {}".format(
+                filename, err))
+    return data
+
+
+# input tables: (sheet name, data dict key, index columns)
+SHEETS = [
+    ('Global', 'global_prop', ['Property']),
+    ('Site', 'site', ['Name']),
+    ('Commodity', 'commodity', ['Site', 'Commodity', 'Type']),
+    ('Process', 'process', ['Site', 'Process']),
+    ('Process-Commodity', 'process_commodity',
+     ['Process', 'Commodity', 'Direction']),
+    ('Transmission', 'transmission',
+     ['Site In', 'Site Out', 'Transmission', 'Commodity']),
+    ('Storage', 'storage', ['Site', 'Storage', 'Commodity']),
+    ('Demand', 'demand', ['t']),
+    ('SupIm', 'supim', ['t']),
+    ('Buy-Sell-Price', 'buy_sell_price', ['t']),
+    ('DSM', 'dsm', ['Site', 'Commodity']),
+]
+
+# timeseries tables with 'Site.Commodity' column titles
+SPLIT_COLUMN_TABLES = ['demand', 'supim', 'buy_sell_price']
+
+
+def parse_excel(filename):
+    """Parse Excel input file into URBS input dict, bypassing the cache.
+
+    Args:
+        filename: filename to an Excel spreadsheet (c.f. read_excel)
+
+    Returns:
+        a dict of DataFrames
+    """
+    with pd.ExcelFile(filename) as xls:
+        tables = {sheet: xls.parse(sheet) for sheet, _, _ in SHEETS}
+    return prepare_data(tables)
+
+
+def read_columnar(path):
+    """Read input tables from CSV/Parquet files or an HDF5 store.
+
+    Reads the same tables as read_excel, one per spreadsheet sheet, from
+    either
+    1. a directory with one file '<sheet>.csv' or '<sheet>.parquet' per
+       sheet (e.g. 'Process-Commodity.csv'), or
+    2. an HDF5 store file (extension .h5 or .hdf5) with one key per sheet.
+    The tables are flat, i.e. the index columns are ordinary columns, like
+    the sheets of the spreadsheet. The result equals that of read_excel.
+    Parquet files require pyarrow or fastparquet, HDF5 stores PyTables.
+
+    Args:
+        path: directory name or HDF5 store filename, e.g. as written by
+            convert_excel
+
+    Returns:
+        a dict of DataFrames (c.f. read_excel)
+
+    Example:
+        >>> convert_excel('mimo-example.xlsx', 'mimo-example')
+        >>> data = read_columnar('mimo-example')
+    """
+    if is_hdf5(path):
+        with pd.HDFStore(path, mode='r') as store:
+            tables = {sheet: store[sheet] for sheet, _, _ in SHEETS}
+        return prepare_data(tables)
+
+    tables = {}
+    for sheet, _, _ in SHEETS:
+        filename = os.path.join(path, sheet + '.csv')
+        if os.path.exists(filename):
+            tables[sheet] = pd.read_csv(filename)
+            continue
+        filename = os.path.join(path, sheet + '.parquet')
+        if os.path.exists(filename):
+            tables[sheet] = pd.read_parquet(filename)
+            continue
+        raise IOError("No file {0}.csv or {0}.parquet in directory "
+                      "'{1}'.".format(sheet, path))
+    return prepare_data(tables)
+
+
+def convert_excel(filename, path, fmt='csv'):
+    """Convert an Excel input file to CSV/Parquet files or an HDF5 store.
+
+    Args:
+        filename: filename to an Excel spreadsheet (c.f. read_excel)
+        path: output directory (created if not existent), or HDF5 store
+            filename (extension .h5 or .hdf5)
+        fmt: (optional) file format in a directory, 'csv' or 'parquet'
+
+    Returns:
+        None
+    """
+    if fmt not in ['csv', 'parquet']:
+        raise ValueError("Unknown format '{}'; choose 'csv' or "
+                         "'parquet'.".format(fmt))
     with pd.ExcelFile(filename) as xls:
-        site = xls.parse('Site').set_index(['Name'])
-        commodity = (
-            xls.parse('Commodity').set_index(['Site', 'Commodity', 'Type']))
-        process = xls.parse('Process').set_index(['Site', 'Process'])
-        process_commodity = (
-            xls.parse('Process-Commodity')
-               .set_index(['Process', 'Commodity', 'Direction']))
-        transmission = (
-            xls.parse('Transmission')
-               .set_index(['Site In', 'Site Out',
-                           'Transmission', 'Commodity']))
-        storage = (
-            xls.parse('Storage').set_index(['Site', 'Storage', 'Commodity']))
-        demand = xls.parse('Demand').set_index(['t'])
-        supim = xls.parse('SupIm').set_index(['t'])
-        buy_sell_price = xls.parse('Buy-Sell-Price').set_index(['t'])
-        dsm = xls.parse('DSM').set_index(['Site', 'Commodity'])
-        global_prop = xls.parse('Global').set_index(['Property'])
+        tables = [(sheet, xls.parse(sheet)) for sheet, _, _ in SHEETS]
+
+    if is_hdf5(path):
+        import tables as pytables
+        # sheet names like 'Process-Commodity' are valid keys, but no
+        # valid Python identifiers
+        warnings.filterwarnings('ignore',
+                                category=pytables.NaturalNameWarning)
+        warnings.filterwarnings('ignore',
+                                category=pd.io.pytables.PerformanceWarning)
+        with pd.HDFStore(path, mode='w') as store:
+            for sheet, table in tables:
+                store[sheet] = table
+        return
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+    for sheet, table in tables:
+        filename = os.path.join(path, '{}.{}'.format(sheet, fmt))
+        if fmt == 'csv':
+            table.to_csv(filename, index=False)
+        else:
+            table.to_parquet(filename, index=False)
+
+
+def is_hdf5(path):
+    """True if path is an HDF5 store filename (by extension). """
+    return os.path.splitext(path)[1].lower() in ['.h5', '.hdf5']
+
+
+def prepare_data(tables):
+    """Create URBS input dict from flat input tables.
+
+    Sets the index columns of each table, splits the column titles of the
+    timeseries tables and sorts nested indexes.
+
+    Args:
+        tables: dict of sheet name -> DataFrame, as read from a spreadsheet
+
+    Returns:
+        a dict of DataFrames (c.f. read_excel)
+    """
+    data = {}
+    for sheet, key, index in SHEETS:
+        data[key] = tables[sheet].set_index(index)
 
     # prepare input data
     # split columns by dots '.', so that 'DE.Elec' becomes the two-level
     # column index ('DE', 'Elec')
-    demand.columns = split_columns(demand.columns, '.')
-    supim.columns = split_columns(supim.columns, '.')
-    buy_sell_price.columns = split_columns(buy_sell_price.columns, '.')
-
-    data = {
-        'global_prop': global_prop,
-        'site': site,
-        'commodity': commodity,
-        'process': process,
-        'process_commodity': process_commodity,
-        'transmission': transmission,
-        'storage': storage,
-        'demand': demand,
-        'supim': supim,
-        'buy_sell_price': buy_sell_price,
-        'dsm': dsm
-        }
+    for key in SPLIT_COLUMN_TABLES:
+        data[key].columns = split_columns(data[key].columns, '.')
 
     # sort nested indexes to make direct assignments work
     for key in data:
@@ -76,8 +214,8 @@ def read_excel(filename):
 
 
 # preparing the pyomo model
-def pyomo_model_prep(data, timesteps):
-    m = pyomo.ConcreteModel()
+def pyomo_model_prep(data, timesteps, profile=False):
+    m = ProfiledModel() if profile else pyomo.ConcreteModel()
 
     # Preparations
     # ============
@@ -99,12 +237,21 @@ def pyomo_model_prep(data, timesteps):
     m.timesteps = timesteps
     m.dsm = data['dsm']
 
-    # Converting Data frames to dict
-    m.commodity_dict = m.commodity.to_dict()  # Changed
-    m.demand_dict = m.demand.to_dict()  # Changed
-    m.supim_dict = m.supim.to_dict()  # Changed
-    m.dsm_dict = m.dsm.to_dict()  # Changed
-    m.buy_sell_price_dict = m.buy_sell_price.to_dict()
+    # optional timestep properties, e.g. weight and period of representative
+    # periods (cf. aggregate_timeseries)
+    if 'timestep' in data:
+        m.timestep_prop = data['timestep']
+    else:
+        m.timestep_prop = pd.DataFrame()
+
+    # column-wise access to properties, c.f. store.py
+    m.commodity_dict = ParamStore(m.commodity)
+    m.dsm_dict = ParamStore(m.dsm)
+
+    # timeseries as arrays with (column, timestep) lookup, c.f. store.py
+    m.demand_ts = TimeSeriesStore(m.demand)
+    m.supim_ts = TimeSeriesStore(m.supim)
+    m.buy_sell_price_ts = TimeSeriesStore(m.buy_sell_price)
 
     # process input/output ratios
     m.r_in = m.process_commodity.xs('In', level='Direction')['ratio']
@@ -145,11 +292,16 @@ def pyomo_model_prep(data, timesteps):
         m.storage['depreciation'],
         m.storage['wacc'])
 
-    # Converting Data frames to dictionaries
-    #
-    m.process_dict = m.process.to_dict()  # Changed
-    m.transmission_dict = m.transmission.to_dict()  # Changed
-    m.storage_dict = m.storage.to_dict()  # Changed
+    # column-wise access to properties (incl. annuity factor), c.f. store.py
+    m.process_dict = ParamStore(m.process)
+    m.transmission_dict = ParamStore(m.transmission)
+    m.storage_dict = ParamStore(m.storage)
+
+    # incidence index of (site, commodity) tuples with adjacent process
+    # inputs/outputs, transmission exports/imports and storages; used by
+    # commodity_balance to only touch existing terms
+    m.balance_index = commodity_incidence(
+        m.process, m.r_in, m.r_out, m.transmission, m.storage)
     return m
 
 
@@ -0,0 +1,158 @@
+"""Cache of parsed input workbooks.
+
+read_excel stores the prepared input data dict of a workbook in a pickle
+file named after the SHA-1 hash of the workbook's content. Reading an
+unchanged workbook again loads this file instead of parsing all sheets.
+A modified workbook has a different hash, so stale entries are never
+returned; they are removed once the cache exceeds its size limit, least
+recently used first.
+
+The cache directory is ~/.cache/urbs, or the directory given by the
+environment variable URBS_CACHE_DIR.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import pandas as pd
+
+# increase whenever read_excel changes the prepared data, so that entries
+# written by older versions are not used
+CACHE_VERSION = 1
+
+# maximum total size of the cache directory (unit: bytes)
+MAX_CACHE_SIZE = 2 * 1024 ** 3
+
+CACHE_SUFFIX = '.pkl'
+
+
+def cache_dir():
+    """Directory of the input cache (created if not existent). """
+    directory = os.environ.get(
+        'URBS_CACHE_DIR',
+        os.path.join(os.path.expanduser('~'), '.cache', 'urbs'))
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # created by a concurrent process in the meantime
+            if not os.path.isdir(directory):
+                raise
+    return directory
+
+
+def cache_key(filename, chunk_size=2 ** 20):
+    """Key of a workbook: hash of its content, cache and pandas version.
+
+    Args:
+        filename: filename of the input workbook
+        chunk_size: number of bytes read at once
+
+    Returns:
+        hex digest string
+    """
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    # pickled DataFrames are only readable with compatible pandas versions
+    sha.update('{}-{}'.format(CACHE_VERSION, pd.__version__).encode())
+    return sha.hexdigest()
+
+
+def load_cached(key):
+    """Load cached input data.
+
+    Args:
+        key: cache key, as returned by cache_key
+
+    Returns:
+        the input data dict, or None if not cached (or unreadable)
+    """
+    path = os.path.join(cache_dir(), key + CACHE_SUFFIX)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+    except Exception:
+        # truncated or incompatible entry: parse the workbook again
+        return None
+    # mark entry as recently used
+    try:
+        os.utime(path, None)
+    except OSError:
+        # removed by a concurrent process in the meantime
+        pass
+    return data
+
+
+def store_cached(key, data, max_size=MAX_CACHE_SIZE):
+    """Store input data in the cache and prune old entries.
+
+    The entry is written to a temporary file first and then renamed, so
+    that concurrent readers (e.g. parallel scenario runs) never see a
+    partially written file.
+
+    Args:
+        key: cache key, as returned by cache_key
+        data: input data dict
+        max_size: maximum total size of the cache directory in bytes
+
+    Returns:
+        None
+    """
+    directory = cache_dir()
+    path = os.path.join(directory, key + CACHE_SUFFIX)
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
+    except OSError:
+        # on Windows, rename fails if a concurrent process stored the same
+        # entry in the meantime; that entry is just as good
+        if not os.path.exists(path):
+            raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    prune_cache(max_size)
+
+
+def prune_cache(max_size=MAX_CACHE_SIZE):
+    """Remove least recently used entries until the cache fits max_size.
+
+    Args:
+        max_size: maximum total size of the cache directory in bytes; 0
+            clears the cache
+
+    Returns:
+        list of removed filenames
+    """
+    directory = cache_dir()
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith(CACHE_SUFFIX):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # removed by a concurrent process in the meantime
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            # already removed by a concurrent process
+            pass
+        total -= size
+        removed.append(path)
+    return removed
@@ -0,0 +1,990 @@
+"""Direct sparse matrix builder for the urbs linear program.
+
+Builds the same variables, constraints and objective as urbs.create_model,
+but straight from the input DataFrames of read_excel into scipy.sparse
+coefficient matrices, without constructing a Pyomo model. The problem can be
+written to an MPS file or solved directly, and the solution is mapped back
+into the Series layout of get_entity, so that report, result_figures and save
+work unchanged on the returned MatrixModel.
+
+"""
+import math
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from collections import OrderedDict
+from .modelhelper import annuity_factor, commodity_incidence
+
+COST_TYPES = ['Invest', 'Fixed', 'Variable', 'Fuel', 'Revenue', 'Purchase',
+              'Environmental']
+
+
+class _VarBlock(object):
+    """ Contiguous block of columns belonging to one model variable. """
+    def __init__(self, name, labels, tuples, start, time=None, t_offset=0):
+        self.name = name
+        self.labels = labels
+        self.tuples = tuples
+        self.n = len(tuples)
+        self.start = start
+        self.time = time
+        self.t_offset = t_offset
+        self.pos = {tup: j for j, tup in enumerate(tuples)}
+
+    @property
+    def size(self):
+        if self.time is None:
+            return self.n
+        return self.n * len(self.time)
+
+
+class MatrixModel(object):
+    """ urbs linear program in coefficient matrix form.
+
+    Variables are stored as named blocks of columns, constraints as named
+    blocks of rows with lower and upper row bounds. After the solution has
+    been loaded (see load_solution), the attributes _data and _result make
+    the object usable with get_entity, report, result_figures and save.
+    """
+    def __init__(self, data, dt, timesteps):
+        self.name = 'urbs'
+        self._data = data
+        self.dt = dt
+        self.t = list(timesteps)
+        self.tm = self.t[1:]
+        self.weight = float(8760) / (len(self.t) * dt)
+
+        self.blocks = OrderedDict()
+        self.n_cols = 0
+        self.row_blocks = OrderedDict()
+        self.n_rows = 0
+
+        self._lb = []
+        self._ub = []
+        self._row_lo = []
+        self._row_hi = []
+        self._rows = []
+        self._cols = []
+        self._vals = []
+        self._obj = []
+
+        self.A = None
+        self.c = None
+        self.col_lb = None
+        self.col_ub = None
+        self.row_lo = None
+        self.row_hi = None
+
+    # variables
+
+    def add_var(self, name, labels, tuples, time=None, lb=0.0, ub=np.inf):
+        """Add a block of variables, optionally repeated for each timestep.
+
+        Args:
+            name: variable name, as in create_model
+            labels: index level names, as returned by get_entity
+            tuples: list of index tuples (excluding timestep)
+            time: None, 't' (all timesteps) or 'tm' (modelled timesteps)
+            lb, ub: scalar or array of lower/upper bounds
+
+        Returns:
+            the new variable block
+        """
+        if time is None:
+            steps, t_offset = None, 0
+        elif time == 't':
+            steps, t_offset = self.t, 1
+        else:
+            steps, t_offset = self.tm, 0
+        block = _VarBlock(name, labels, list(tuples), self.n_cols,
+                          steps, t_offset)
+        self.blocks[name] = block
+        self.n_cols += block.size
+        self._lb.append(np.broadcast_to(np.asarray(lb, dtype=float),
+                                        (block.size,)))
+        self._ub.append(np.broadcast_to(np.asarray(ub, dtype=float),
+                                        (block.size,)))
+        return block
+
+    def col(self, name, j, lag=0):
+        """Column positions of variable entries.
+
+        Args:
+            name: variable name
+            j: array of tuple positions within the variable block
+            lag: for time-dependent variables, 1 refers to the previous
+                timestep
+
+        Returns:
+            an array of column positions; of shape (len(tm), len(j)) for
+            time-dependent variables, of shape (len(j),) otherwise
+        """
+        block = self.blocks[name]
+        j = np.asarray(j, dtype=int)
+        if block.time is None:
+            return block.start + j
+        steps = np.arange(len(self.tm))[:, None] + block.t_offset - lag
+        return block.start + steps * block.n + j[None, :]
+
+    # constraints
+
+    def add_rows(self, name, n, lo=-np.inf, hi=np.inf, timed=False):
+        """Add a block of rows, optionally repeated for each modelled step.
+
+        Args:
+            name: constraint name, as in create_model
+            n: number of rows (per modelled timestep, if timed)
+            lo, hi: lower/upper row bounds, broadcastable to (n,) or to
+                (len(tm), n) if timed
+            timed: True if the rows exist for each modelled timestep
+
+        Returns:
+            position of the first row of the block
+        """
+        size = n * len(self.tm) if timed else n
+        shape = (len(self.tm), n) if timed else (n,)
+        start = self.n_rows
+        self.row_blocks[name] = (start, size)
+        self.n_rows += size
+        self._row_lo.append(
+            np.broadcast_to(np.asarray(lo, dtype=float), shape).ravel())
+        self._row_hi.append(
+            np.broadcast_to(np.asarray(hi, dtype=float), shape).ravel())
+        return start
+
+    def add_coefs(self, rows, cols, vals):
+        """Add coefficients; all arguments are broadcast to a common shape.
+        """
+        rows, cols, vals = np.broadcast_arrays(rows, cols, vals)
+        self._rows.append(rows.ravel())
+        self._cols.append(cols.ravel())
+        self._vals.append(vals.astype(float).ravel())
+
+    def add_pattern(self, start, n, pattern, timed=True):
+        """Add coefficients of a row pattern repeated for each modelled step.
+
+        Args:
+            start: first row of the row block (cf. add_rows)
+            n: number of rows per modelled timestep
+            pattern: a _Pattern of (row, variable, position, coefficient)
+                entries; coefficients are scalars or arrays over tm
+            timed: True if the row block is timed, False if the rows sum
+                the pattern over all modelled timesteps
+        """
+        tm = np.arange(len(self.tm))[:, None]
+        for (name, lag), (rj, vj, coefs) in pattern.entries.items():
+            rj = np.asarray(rj, dtype=int)
+            if timed:
+                rows = start + tm * n + rj[None, :]
+            else:
+                rows = start + rj[None, :]
+            cols = self.col(name, vj, lag=lag)
+            self.add_coefs(rows, cols, _coef_matrix(coefs, len(self.tm)))
+
+    def add_objective(self, name, j, vals):
+        """Add objective coefficients for entries of a variable. """
+        self._obj.append((self.col(name, j), np.asarray(vals, dtype=float)))
+
+    def finalize(self):
+        """Assemble matrix, drop rows without finite bounds. """
+        rows = np.concatenate(self._rows) if self._rows else np.zeros(0, int)
+        cols = np.concatenate(self._cols) if self._cols else np.zeros(0, int)
+        vals = (np.concatenate(self._vals) if self._vals
+                else np.zeros(0, float))
+        A = sp.coo_matrix((vals, (rows, cols)),
+                          shape=(self.n_rows, self.n_cols)).tocsr()
+        A.sum_duplicates()
+        A.eliminate_zeros()
+        row_lo = np.concatenate(self._row_lo)
+        row_hi = np.concatenate(self._row_hi)
+
+        # rows like 'x <= inf' restrict nothing
+        keep = ~(np.isneginf(row_lo) & np.isposinf(row_hi))
+        self.row_names = np.arange(self.n_rows)[keep]
+        self.A = A[keep]
+        self.row_lo = row_lo[keep]
+        self.row_hi = row_hi[keep]
+
+        self.col_lb = np.concatenate(self._lb)
+        self.col_ub = np.concatenate(self._ub)
+        self.c = np.zeros(self.n_cols)
+        for cols, vals in self._obj:
+            np.add.at(self.c, cols, vals)
+
+        self._rows = self._cols = self._vals = None
+        return self
+
+    # solution
+
+    def write_mps(self, filename):
+        """Write the linear program to a (free format) MPS file.
+
+        Columns are named x0, x1, ... and rows r0, r1, ... by their position
+        in the variable and constraint blocks.
+
+        Args:
+            filename: MPS file to be written
+        """
+        A = self.A.tocsc()
+        lo, hi = self.row_lo, self.row_hi
+        names = ['r{}'.format(i) for i in self.row_names]
+
+        eq = lo == hi
+        le = ~eq & np.isneginf(lo)
+        ge = ~eq & ~le
+        ranged = ge & ~np.isposinf(hi)
+        kind = np.where(eq, 'E', np.where(le, 'L', 'G'))
+        rhs = np.where(le, hi, lo)
+
+        with open(filename, 'w') as f:
+            f.write('NAME {}\nROWS\n N obj\n'.format(self.name))
+            f.writelines(' {} {}\n'.format(k, r)
+                         for k, r in zip(kind, names))
+
+            f.write('COLUMNS\n')
+            for j in range(self.n_cols):
+                col = 'x{}'.format(j)
+                if self.c[j] != 0:
+                    f.write(' {} obj {:.17g}\n'.format(col, self.c[j]))
+                begin, end = A.indptr[j], A.indptr[j+1]
+                f.writelines(
+                    ' {} {} {:.17g}\n'.format(col, names[i], v)
+                    for i, v in zip(A.indices[begin:end], A.data[begin:end]))
+
+            f.write('RHS\n')
+            f.writelines(' rhs {} {:.17g}\n'.format(names[i], rhs[i])
+                         for i in np.flatnonzero(rhs))
+
+            if ranged.any():
+                f.write('RANGES\n')
+                f.writelines(' rng {} {:.17g}\n'.format(names[i],
+                                                        hi[i] - lo[i])
+                             for i in np.flatnonzero(ranged))
+
+            f.write('BOUNDS\n')
+            for j, (lb, ub) in enumerate(zip(self.col_lb, self.col_ub)):
+                col = 'x{}'.format(j)
+                if lb == ub:
+                    f.write(' FX bnd {} {:.17g}\n'.format(col, lb))
+                    continue
+                if np.isneginf(lb):
+                    f.write(' {} bnd {}\n'.format(
+                        'FR' if np.isposinf(ub) else 'MI', col))
+                elif lb != 0:
+                    f.write(' LO bnd {} {:.17g}\n'.format(col, lb))
+                if not np.isposinf(ub):
+                    f.write(' UP bnd {} {:.17g}\n'.format(col, ub))
+            f.write('ENDATA\n')
+
+    def solve(self, **options):
+        """Solve the linear program with HiGHS via scipy.optimize.linprog.
+
+        Args:
+            **options: solver options, forwarded to linprog
+
+        Returns:
+            the scipy OptimizeResult; if successful, the solution is loaded
+        """
+        from scipy.optimize import linprog
+        eq = self.row_lo == self.row_hi
+        ub = ~eq & ~np.isposinf(self.row_hi)
+        lb = ~eq & ~np.isneginf(self.row_lo)
+        A_ub = sp.vstack([self.A[ub], -self.A[lb]]).tocsr()
+        b_ub = np.concatenate([self.row_hi[ub], -self.row_lo[lb]])
+        bounds = np.column_stack([self.col_lb, self.col_ub])
+        bounds = [(None if np.isneginf(l) else l,
+                   None if np.isposinf(u) else u) for l, u in bounds]
+        result = linprog(self.c, A_ub=A_ub, b_ub=b_ub,
+                         A_eq=self.A[eq], b_eq=self.row_lo[eq],
+                         bounds=bounds, method='highs', options=options)
+        if result.status == 0:
+            self.load_solution(result.x)
+        return result
+
+    def load_solution(self, x):
+        """Map a solution vector to the result cache of get_entity.
+
+        Args:
+            x: array of column values, or a dict of column names ('x0',
+               'x1', ...) to values (missing entries count as zero)
+
+        Returns:
+            the model itself, containing the result cache _result
+        """
+        if isinstance(x, dict):
+            values = np.zeros(self.n_cols)
+            for name, value in x.items():
+                values[int(name[1:])] = value
+            x = values
+        x = np.asarray(x, dtype=float)
+
+        result = self._sets_and_params()
+        for name, block in self.blocks.items():
+            result[name] = self._block_series(block, x)
+        self._result = result
+        return self
+
+    def _block_series(self, block, x):
+        """Series of variable values in the layout of get_entity. """
+        if block.size == 0:
+            return pd.Series(name=block.name)
+        values = x[block.start:block.start + block.size]
+        if block.time is None:
+            index = _index(block.tuples, block.labels)
+        else:
+            levels = list(zip(*block.tuples))
+            arrays = [np.repeat(block.time, block.n)]
+            arrays.extend(np.tile(np.asarray(level, dtype=object),
+                                  len(block.time))
+                          for level in levels)
+            index = pd.MultiIndex.from_arrays(arrays, names=block.labels)
+        return pd.Series(values, index=index, name=block.name)
+
+    def _sets_and_params(self):
+        """Sets and params needed by get_timeseries, report and plot. """
+        result = {}
+        result['t'] = pd.Series(1, index=pd.Index(self.t, name='t'),
+                                name='t_')
+        result['tm'] = pd.Series(1, index=pd.Index(self.tm, name='t'),
+                                 name='tm')
+        for name, tuples, labels in self._sets:
+            result[name] = pd.Series(1, index=_index(tuples, labels),
+                                     name=name)
+        for name, value in (('dt', self.dt), ('weight', self.weight)):
+            result[name] = pd.Series([value],
+                                     index=pd.Index([None], name='None'),
+                                     name=name)
+        return result
+
+
+class _Pattern(object):
+    """ Sparse row pattern: (row, variable, position, coefficient) entries.
+    """
+    def __init__(self):
+        self.entries = OrderedDict()
+
+    def add(self, row, name, j, coef, lag=0):
+        rj, vj, coefs = self.entries.setdefault((name, lag), ([], [], []))
+        rj.append(row)
+        vj.append(j)
+        coefs.append(coef)
+
+
+def _coef_matrix(coefs, n_steps):
+    """Stack scalar or per-timestep coefficients to shape (n_steps, n). """
+    if all(np.ndim(c) == 0 for c in coefs):
+        return np.asarray(coefs, dtype=float)[None, :]
+    return np.column_stack([np.broadcast_to(np.asarray(c, dtype=float),
+                                            (n_steps,))
+                            for c in coefs])
+
+
+def _index(tuples, labels):
+    """Index of get_entity for given tuples and level names. """
+    if len(labels) == 1:
+        return pd.Index([t[0] if isinstance(t, tuple) else t
+                         for t in tuples], name=labels[0])
+    return pd.MultiIndex.from_tuples(tuples, names=labels)
+
+
+def _unique(items):
+    """Unique items in order of their first appearance. """
+    seen = set()
+    return [i for i in items if not (i in seen or seen.add(i))]
+
+
+def _timeseries(df, column, steps):
+    """Values of a timeseries column for given timesteps. """
+    try:
+        series = df[column]
+    except KeyError:
+        series = df[column[0]]
+    if isinstance(series, pd.DataFrame):
+        series = series.iloc[:, 0]
+    return series.loc[steps].values.astype(float)
+
+
+def create_matrix_model(data, dt=1, timesteps=None):
+    """Create the urbs linear program as sparse coefficient matrices.
+
+    Mirrors the variables, constraints and objective of create_model, but
+    builds them without Pyomo from the input DataFrames. Only a uniform
+    timestep duration dt is supported; input with a table 'timestep'
+    (durations, weights or periods, e.g. from aggregate_timeseries or
+    segment_timeseries) raises a ValueError.
+
+    Args:
+        data: a dict of DataFrames, as returned by read_excel
+        dt: timestep duration in hours (default: 1)
+        timesteps: optional list of timesteps, default: demand timeseries
+
+    Returns:
+        a MatrixModel object
+
+    Example:
+        >>> data = read_excel('mimo-example.xlsx')
+        >>> prob = create_matrix_model(data, timesteps=range(1, 25))
+        >>> prob.write_mps('urbs.mps')
+        >>> result = prob.solve()
+        >>> report(prob, 'report.xlsx')
+    """
+    if 'timestep' in data and not data['timestep'].empty:
+        raise ValueError("create_matrix_model does not support timestep "
+                         "properties (table 'timestep'); use create_model "
+                         "for aggregated or segmented input.")
+    if not timesteps:
+        timesteps = data['demand'].index.tolist()
+    m = MatrixModel(data, dt, timesteps)
+    nT = len(m.tm)
+
+    # Preparations
+    # ============
+    global_prop = data['global_prop']
+    commodity = data['commodity']
+    process = data['process']
+    process_commodity = data['process_commodity']
+    transmission = data['transmission']
+    storage = data['storage']
+    demand = data['demand']
+    supim = data['supim']
+    buy_sell_price = data['buy_sell_price']
+    dsm = data['dsm']
+
+    r_in = process_commodity.xs('In', level='Direction')['ratio']
+    r_out = process_commodity.xs('Out', level='Direction')['ratio']
+    r_in_min_fraction = (process_commodity.xs('In', level='Direction')
+                                          ['ratio-min'])
+    r_in_min_fraction = r_in_min_fraction[r_in_min_fraction > 0]
+    r_out_min_fraction = (process_commodity.xs('Out', level='Direction')
+                                           ['ratio-min'])
+    r_out_min_fraction = r_out_min_fraction[r_out_min_fraction > 0]
+
+    pro_annuity = annuity_factor(process['depreciation'], process['wacc'])
+    tra_annuity = annuity_factor(transmission['depreciation'],
+                                 transmission['wacc'])
+    sto_annuity = annuity_factor(storage['depreciation'], storage['wacc'])
+
+    # Sets
+    # ====
+    com_tuples = list(commodity.index)
+    pro_tuples = list(process.index)
+    tra_tuples = list(transmission.index)
+    sto_tuples = list(storage.index)
+    dsm_tuples = list(dsm.index)
+    sites = _unique(commodity.index.get_level_values('Site'))
+
+    pro_input_tuples = [(sit, pro, com) for (sit, pro) in pro_tuples
+                        for (p, com) in r_in.index if p == pro]
+    pro_output_tuples = [(sit, pro, com) for (sit, pro) in pro_tuples
+                         for (p, com) in r_out.index if p == pro]
+    pro_partial_tuples = _unique(
+        (sit, pro) for (sit, pro) in pro_tuples
+        for (p, _) in r_in_min_fraction.index if p == pro)
+    pro_partial_input_tuples = [
+        (sit, pro, com) for (sit, pro) in pro_partial_tuples
+        for (p, com) in r_in_min_fraction.index if p == pro]
+    pro_partial_output_tuples = [
+        (sit, pro, com) for (sit, pro) in pro_partial_tuples
+        for (p, com) in r_out_min_fraction.index if p == pro]
+    pro_maxgrad_tuples = [p for p in pro_tuples
+                          if process.loc[p, 'max-grad'] < 1.0 / dt]
+
+    def com_type_subset(type_name):
+        return set(com for (sit, com, com_type) in com_tuples
+                   if com_type == type_name)
+    com_supim = com_type_subset('SupIm')
+    com_stock = com_type_subset('Stock')
+    com_sell = com_type_subset('Sell')
+    com_buy = com_type_subset('Buy')
+    com_demand = com_type_subset('Demand')
+    com_env = com_type_subset('Env')
+
+    m._sets = [
+        ('sit', sites, ['sit']),
+        ('com', _unique(c for (_, c, _) in com_tuples), ['com']),
+        ('com_type', _unique(t for (_, _, t) in com_tuples), ['com_type']),
+        ('pro', _unique(p for (_, p) in pro_tuples), ['pro']),
+        ('tra', _unique(t[2] for t in tra_tuples), ['tra']),
+        ('sto', _unique(s[1] for s in sto_tuples), ['sto']),
+        ('cost_type', COST_TYPES, ['cost_type']),
+        ('com_tuples', com_tuples, ['sit', 'com', 'com_type']),
+        ('pro_tuples', pro_tuples, ['sit', 'pro']),
+        ('tra_tuples', tra_tuples, ['sit', 'sit_', 'tra', 'com']),
+        ('sto_tuples', sto_tuples, ['sit', 'sto', 'com']),
+        ('dsm_site_tuples', dsm_tuples, ['sit', 'com']),
+        ('pro_input_tuples', pro_input_tuples, ['sit', 'pro', 'com']),
+        ('pro_output_tuples', pro_output_tuples, ['sit', 'pro', 'com'])]
+    m._sets = [s for s in m._sets if s[1]]
+
+    # DSM downshift tuples (t, tt, site, commodity) and windows
+    tm = np.array(m.tm)
+    lb, ub = (tm.min(), tm.max()) if nT else (0, -1)
+    dsm_down_tuples = []
+    dsm_down_pos = []  # (t position, tt position, dsm tuple position)
+    recovery_window = []
+    for d, (sit, com) in enumerate(dsm_tuples):
+        delay = max(int(dsm.loc[(sit, com), 'delay'] / dt), 1)
+        recov = max(int(dsm.loc[(sit, com), 'recov'] / dt), 1)
+        shift = np.arange(-delay, delay + 1)
+        step2 = tm[:, None] + shift[None, :]
+        step1 = np.broadcast_to(tm[:, None], step2.shape)
+        valid = (step2 >= lb) & (step2 <= ub)
+        step1, step2 = step1[valid], step2[valid]
+        dsm_down_tuples.extend(zip(step1.tolist(), step2.tolist(),
+                                   [sit] * len(step1), [com] * len(step1)))
+        dsm_down_pos.append((np.searchsorted(tm, step1),
+                             np.searchsorted(tm, step2),
+                             np.full(len(step1), d)))
+        recovery_window.append(np.minimum(tm + recov, ub + 1))
+    if dsm_down_pos:
+        dsm_t, dsm_tt, dsm_d = (np.concatenate(a) for a in zip(*dsm_down_pos))
+    else:
+        dsm_t = dsm_tt = dsm_d = np.zeros(0, dtype=int)
+
+    # Variables
+    # =========
+    m.add_var('costs', ['cost_type'], [(c,) for c in COST_TYPES],
+              lb=-np.inf)
+    for name in ('e_co_stock', 'e_co_sell', 'e_co_buy'):
+        m.add_var(name, ['t', 'sit', 'com', 'com_type'], com_tuples, 'tm')
+    m.add_var('cap_pro', ['sit', 'pro'], pro_tuples)
+    m.add_var('cap_pro_new', ['sit', 'pro'], pro_tuples)
+    m.add_var('tau_pro', ['t', 'sit', 'pro'], pro_tuples, 't')
+    m.add_var('e_pro_in', ['t', 'sit', 'pro', 'com'], pro_input_tuples, 'tm')
+    m.add_var('e_pro_out', ['t', 'sit', 'pro', 'com'], pro_output_tuples,
+              'tm')
+    m.add_var('cap_tra', ['sit', 'sit_', 'tra', 'com'], tra_tuples)
+    m.add_var('cap_tra_new', ['sit', 'sit_', 'tra', 'com'], tra_tuples)
+    m.add_var('e_tra_in', ['t', 'sit', 'sit_', 'tra', 'com'], tra_tuples,
+              'tm')
+    m.add_var('e_tra_out', ['t', 'sit', 'sit_', 'tra', 'com'], tra_tuples,
+              'tm')
+    for name in ('cap_sto_c', 'cap_sto_c_new', 'cap_sto_p', 'cap_sto_p_new'):
+        m.add_var(name, ['sit', 'sto', 'com'], sto_tuples)
+    m.add_var('e_sto_in', ['t', 'sit', 'sto', 'com'], sto_tuples, 'tm')
+    m.add_var('e_sto_out', ['t', 'sit', 'sto', 'com'], sto_tuples, 'tm')
+    m.add_var('e_sto_con', ['t', 'sit', 'sto', 'com'], sto_tuples, 't')
+    m.add_var('dsm_up', ['t', 'sit', 'com'], dsm_tuples, 'tm')
+    m.add_var('dsm_down', ['t', 't_', 'sit', 'com'], dsm_down_tuples)
+
+    pos = {name: block.pos for name, block in m.blocks.items()}
+    incidence = commodity_incidence(process, r_in, r_out, transmission,
+                                    storage)
+
+    def add_balance(pattern, row, sit, com, coef):
+        """Add coef * commodity_balance(sit, com) to a row pattern. """
+        terms = incidence.get((sit, com))
+        if terms is None:
+            return
+        for p in terms['pro_in']:
+            pattern.add(row, 'e_pro_in', pos['e_pro_in'][p], coef)
+        for p in terms['pro_out']:
+            pattern.add(row, 'e_pro_out', pos['e_pro_out'][p], -coef)
+        for t in terms['tra_in']:
+            pattern.add(row, 'e_tra_in', pos['e_tra_in'][t], coef)
+        for t in terms['tra_out']:
+            pattern.add(row, 'e_tra_out', pos['e_tra_out'][t], -coef)
+        for s in terms['sto']:
+            pattern.add(row, 'e_sto_in', pos['e_sto_in'][s], coef)
+            pattern.add(row, 'e_sto_out', pos['e_sto_out'][s], -coef)
+
+    # Constraints
+    # ===========
+
+    # commodity
+    vertex_tuples = [c for c in com_tuples
+                     if c[1] not in com_env and c[1] not in com_supim]
+    rhs = np.zeros((nT, len(vertex_tuples)))
+    pattern = _Pattern()
+    for k, (sit, com, com_type) in enumerate(vertex_tuples):
+        j = pos['e_co_stock'][(sit, com, com_type)]
+        add_balance(pattern, k, sit, com, -1)
+        if com in com_stock:
+            pattern.add(k, 'e_co_stock', j, 1)
+        if com in com_sell:
+            pattern.add(k, 'e_co_sell', j, -1)
+        if com in com_buy:
+            pattern.add(k, 'e_co_buy', j, 1)
+        if com in com_demand and (sit, com) in demand.columns:
+            rhs[:, k] = _timeseries(demand, (sit, com), m.tm)
+        if (sit, com) in pos['dsm_up']:
+            pattern.add(k, 'dsm_up', pos['dsm_up'][(sit, com)], -1)
+    start = m.add_rows('res_vertex', len(vertex_tuples), rhs, rhs,
+                       timed=True)
+    m.add_pattern(start, len(vertex_tuples), pattern)
+    # downshifted demand of all upshift timesteps t in the window of tt
+    vertex_pos = {}
+    for k, (sit, com, _) in enumerate(vertex_tuples):
+        vertex_pos.setdefault((sit, com), []).append(k)
+    for d, sit_com in enumerate(dsm_tuples):
+        select = dsm_d == d
+        for k in vertex_pos.get(sit_com, []):
+            m.add_coefs(start + dsm_tt[select] * len(vertex_tuples) + k,
+                        m.col('dsm_down', np.flatnonzero(select)), 1)
+
+    # stock, sell and buy limits
+    for kind, com_set, var in (('stock', com_stock, 'e_co_stock'),
+                               ('sell', com_sell, 'e_co_sell'),
+                               ('buy', com_buy, 'e_co_buy')):
+        tuples = [c for c in com_tuples if c[1] in com_set]
+        j = [pos[var][c] for c in tuples]
+        maxperhour = np.array([commodity.loc[c, 'maxperhour']
+                               for c in tuples], dtype=float)
+        maximum = np.array([commodity.loc[c, 'max'] for c in tuples],
+                           dtype=float)
+        rj = np.arange(len(tuples))
+
+        start = m.add_rows('res_{}_step'.format(kind), len(tuples),
+                           hi=dt * maxperhour, timed=True)
+        m.add_coefs(start + np.arange(nT)[:, None] * len(tuples) + rj,
+                    m.col(var, j), 1)
+        start = m.add_rows('res_{}_total'.format(kind), len(tuples),
+                           hi=maximum)
+        m.add_coefs(start + rj[None, :], m.col(var, j), m.weight)
+
+    # environmental limits
+    env_tuples = [c for c in com_tuples if c[1] in com_env]
+    pattern = _Pattern()
+    for k, (sit, com, _) in enumerate(env_tuples):
+        add_balance(pattern, k, sit, com, -1)
+    maxperhour = np.array([commodity.loc[c, 'maxperhour']
+                           for c in env_tuples], dtype=float)
+    maximum = np.array([commodity.loc[c, 'max'] for c in env_tuples],
+                       dtype=float)
+    start = m.add_rows('res_env_step', len(env_tuples), hi=dt * maxperhour,
+                       timed=True)
+    m.add_pattern(start, len(env_tuples), pattern)
+    pattern = _Pattern()
+    for k, (sit, com, _) in enumerate(env_tuples):
+        add_balance(pattern, k, sit, com, -m.weight)
+    start = m.add_rows('res_env_total', len(env_tuples), hi=maximum)
+    m.add_pattern(start, len(env_tuples), pattern, timed=False)
+
+    # process
+    n_pro = len(pro_tuples)
+    j_pro = np.arange(n_pro)
+    start = m.add_rows('def_process_capacity', n_pro,
+                       process['inst-cap'].values, process['inst-cap'].values)
+    m.add_coefs(start + j_pro, m.col('cap_pro', j_pro), 1)
+    m.add_coefs(start + j_pro, m.col('cap_pro_new', j_pro), -1)
+
+    for kind, tuples, partial, ratio in (
+            ('input', pro_input_tuples, pro_partial_input_tuples, r_in),
+            ('output', pro_output_tuples, pro_partial_output_tuples, r_out)):
+        var = 'e_pro_in' if kind == 'input' else 'e_pro_out'
+        partial = set(partial)
+        tuples = [p for p in tuples if p not in partial]
+        rj = np.arange(len(tuples))
+        start = m.add_rows('def_process_{}'.format(kind), len(tuples), 0, 0,
+                           timed=True)
+        pattern = _Pattern()
+        for k, (sit, pro, com) in enumerate(tuples):
+            pattern.add(k, var, pos[var][(sit, pro, com)], 1)
+            pattern.add(k, 'tau_pro', pos['tau_pro'][(sit, pro)],
+                        -ratio.loc[(pro, com)])
+        m.add_pattern(start, len(tuples), pattern)
+
+    supim_tuples = [p for p in pro_input_tuples if p[2] in com_supim]
+    start = m.add_rows('def_intermittent_supply', len(supim_tuples), 0, 0,
+                       timed=True)
+    pattern = _Pattern()
+    for k, (sit, pro, com) in enumerate(supim_tuples):
+        pattern.add(k, 'e_pro_in', pos['e_pro_in'][(sit, pro, com)], 1)
+        pattern.add(k, 'cap_pro', pos['cap_pro'][(sit, pro)],
+                    -dt * _timeseries(supim, (sit, com), m.tm))
+    m.add_pattern(start, len(supim_tuples), pattern)
+
+    start = m.add_rows('res_process_throughput_by_capacity', n_pro, hi=0,
+                       timed=True)
+    rows = start + np.arange(nT)[:, None] * n_pro + j_pro[None, :]
+    m.add_coefs(rows, m.col('tau_pro', j_pro), 1)
+    m.add_coefs(rows, m.col('cap_pro', j_pro)[None, :], -dt)
+
+    j = np.array([pos['tau_pro'][p] for p in pro_maxgrad_tuples], dtype=int)
+    max_grad = np.array([process.loc[p, 'max-grad']
+                         for p in pro_maxgrad_tuples], dtype=float)
+    for name, sign in (('res_process_maxgrad_lower', 1),
+                       ('res_process_maxgrad_upper', -1)):
+        start = m.add_rows(name, len(j), hi=0, timed=True)
+        rows = start + np.arange(nT)[:, None] * len(j) + np.arange(len(j))
+        m.add_coefs(rows, m.col('tau_pro', j, lag=1), sign)
+        m.add_coefs(rows, m.col('tau_pro', j), -sign)
+        m.add_coefs(rows, m.col('cap_pro', j)[None, :], -max_grad * dt)
+
+    start = m.add_rows('res_process_capacity', n_pro,
+                       process['cap-lo'].values, process['cap-up'].values)
+    m.add_coefs(start + j_pro, m.col('cap_pro', j_pro), 1)
+
+    site_area = data['site']['area']
+    area_per_cap = process['area-per-cap']
+    area_tuples = [p for p in pro_tuples if area_per_cap[p] >= 0]
+    area_sites = [sit for sit in sites
+                  if site_area[sit] >= 0 and
+                  sum(area_per_cap[p] for p in area_tuples if p[0] == sit) > 0]
+    start = m.add_rows('res_area', len(area_sites),
+                       hi=[site_area[sit] for sit in area_sites])
+    for k, sit in enumerate(area_sites):
+        tuples = [p for p in area_tuples if p[0] == sit]
+        m.add_coefs(start + k, m.col('cap_pro', [pos['cap_pro'][p]
+                                                 for p in tuples]),
+                    [area_per_cap[p] for p in tuples])
+
+    symmetry = []
+    for (sit, pro, com) in pro_input_tuples:
+        if com not in com_buy:
+            continue
+        sell_pro = _search_sell_buy_tuple(pro_input_tuples,
+                                          pro_output_tuples, com_sell, pro)
+        if sell_pro is not None:
+            symmetry.append((pos['cap_pro'][(sit, pro)],
+                             pos['cap_pro'][(sit, sell_pro)]))
+    start = m.add_rows('res_sell_buy_symmetry', len(symmetry), 0, 0)
+    for k, (j_buy, j_sell) in enumerate(symmetry):
+        m.add_coefs(start + k, m.col('cap_pro', [j_buy, j_sell]), [1, -1])
+
+    min_fraction = process['min-fraction']
+    j = np.array([pos['tau_pro'][p] for p in pro_partial_tuples], dtype=int)
+    start = m.add_rows('res_throughput_by_capacity_min', len(j), lo=0,
+                       timed=True)
+    rows = start + np.arange(nT)[:, None] * len(j) + np.arange(len(j))
+    m.add_coefs(rows, m.col('tau_pro', j), 1)
+    m.add_coefs(rows, m.col('cap_pro', j)[None, :],
+                -dt * np.array([min_fraction[p] for p in pro_partial_tuples],
+                               dtype=float))
+
+    for kind, tuples, ratio, ratio_min in (
+            ('input', pro_partial_input_tuples, r_in, r_in_min_fraction),
+            ('output', pro_partial_output_tuples, r_out, r_out_min_fraction)):
+        var = 'e_pro_in' if kind == 'input' else 'e_pro_out'
+        start = m.add_rows('def_partial_process_{}'.format(kind),
+                           len(tuples), 0, 0, timed=True)
+        pattern = _Pattern()
+        for k, (sit, pro, com) in enumerate(tuples):
+            R = ratio.loc[(pro, com)]
+            r = ratio_min.loc[(pro, com)]
+            mf = min_fraction[(sit, pro)]
+            online_factor = mf * (r - R) / (1 - mf)
+            throughput_factor = (R - mf * r) / (1 - mf)
+            pattern.add(k, var, pos[var][(sit, pro, com)], 1)
+            pattern.add(k, 'tau_pro', pos['tau_pro'][(sit, pro)],
+                        -throughput_factor)
+            pattern.add(k, 'cap_pro', pos['cap_pro'][(sit, pro)],
+                        -dt * online_factor)
+        m.add_pattern(start, len(tuples), pattern)
+
+    # transmission
+    n_tra = len(tra_tuples)
+    j_tra = np.arange(n_tra)
+    start = m.add_rows('def_transmission_capacity', n_tra,
+                       transmission['inst-cap'].values,
+                       transmission['inst-cap'].values)
+    m.add_coefs(start + j_tra, m.col('cap_tra', j_tra), 1)
+    m.add_coefs(start + j_tra, m.col('cap_tra_new', j_tra), -1)
+
+    start = m.add_rows('def_transmission_output', n_tra, 0, 0, timed=True)
+    rows = start + np.arange(nT)[:, None] * n_tra + j_tra[None, :]
+    m.add_coefs(rows, m.col('e_tra_out', j_tra), 1)
+    m.add_coefs(rows, m.col('e_tra_in', j_tra),
+                -transmission['eff'].values.astype(float))
+
+    start = m.add_rows('res_transmission_input_by_capacity', n_tra, hi=0,
+                       timed=True)
+    rows = start + np.arange(nT)[:, None] * n_tra + j_tra[None, :]
+    m.add_coefs(rows, m.col('e_tra_in', j_tra), 1)
+    m.add_coefs(rows, m.col('cap_tra', j_tra)[None, :], -dt)
+
+    start = m.add_rows('res_transmission_capacity', n_tra,
+                       transmission['cap-lo'].values,
+                       transmission['cap-up'].values)
+    m.add_coefs(start + j_tra, m.col('cap_tra', j_tra), 1)
+
+    start = m.add_rows('res_transmission_symmetry', n_tra, 0, 0)
+    reverse = [pos['cap_tra'][(sout, sin, tra, com)]
+               for (sin, sout, tra, com) in tra_tuples]
+    m.add_coefs(start + j_tra, m.col('cap_tra', j_tra), 1)
+    m.add_coefs(start + j_tra, m.col('cap_tra', reverse), -1)
+
+    # storage
+    n_sto = len(sto_tuples)
+    j_sto = np.arange(n_sto)
+    rows_sto = np.arange(nT)[:, None] * n_sto + j_sto[None, :]
+    start = m.add_rows('def_storage_state', n_sto, 0, 0, timed=True)
+    m.add_coefs(start + rows_sto, m.col('e_sto_con', j_sto), 1)
+    m.add_coefs(start + rows_sto, m.col('e_sto_con', j_sto, lag=1),
+                -(1 - storage['discharge'].values.astype(float)) ** dt)
+    m.add_coefs(start + rows_sto, m.col('e_sto_in', j_sto),
+                -storage['eff-in'].values.astype(float))
+    m.add_coefs(start + rows_sto, m.col('e_sto_out', j_sto),
+                1 / storage['eff-out'].values.astype(float))
+
+    for kind, suffix in (('power', 'p'), ('capacity', 'c')):
+        inst_cap = storage['inst-cap-{}'.format(suffix)].values
+        start = m.add_rows('def_storage_{}'.format(kind), n_sto,
+                           inst_cap, inst_cap)
+        m.add_coefs(start + j_sto, m.col('cap_sto_' + suffix, j_sto), 1)
+        m.add_coefs(start + j_sto, m.col('cap_sto_{}_new'.format(suffix),
+                                         j_sto), -1)
+
+    for name, var in (('res_storage_input_by_power', 'e_sto_in'),
+                      ('res_storage_output_by_power', 'e_sto_out')):
+        start = m.add_rows(name, n_sto, hi=0, timed=True)
+        m.add_coefs(start + rows_sto, m.col(var, j_sto), 1)
+        m.add_coefs(start + rows_sto, m.col('cap_sto_p', j_sto)[None, :],
+                    -dt)
+
+    # over all timesteps t, i.e. including the initial one
+    start = m.add_rows('res_storage_state_by_capacity', n_sto * len(m.t),
+                       hi=0)
+    rows = start + np.arange(len(m.t))[:, None] * n_sto + j_sto[None, :]
+    m.add_coefs(rows, m.blocks['e_sto_con'].start + rows - start, 1)
+    m.add_coefs(rows, m.col('cap_sto_c', j_sto)[None, :], -1)
+
+    for kind, suffix in (('power', 'p'), ('capacity', 'c')):
+        start = m.add_rows('res_storage_{}'.format(kind), n_sto,
+                           storage['cap-lo-{}'.format(suffix)].values,
+                           storage['cap-up-{}'.format(suffix)].values)
+        m.add_coefs(start + j_sto, m.col('cap_sto_' + suffix, j_sto), 1)
+
+    # initial (==) and final (>=) storage content
+    init = storage['init'].values.astype(float)
+    start = m.add_rows('res_initial_and_final_storage_state', 2 * n_sto,
+                       lo=0, hi=np.concatenate([np.zeros(n_sto),
+                                                np.full(n_sto, np.inf)]))
+    con = m.blocks['e_sto_con']
+    m.add_coefs(start + j_sto, con.start + j_sto, 1)
+    m.add_coefs(start + n_sto + j_sto,
+                con.start + (len(m.t) - 1) * n_sto + j_sto, 1)
+    for offset in (0, n_sto):
+        m.add_coefs(start + offset + j_sto, m.col('cap_sto_c', j_sto), -init)
+
+    # demand side management
+    n_dsm = len(dsm_tuples)
+    j_dsm = np.arange(n_dsm)
+    rows_dsm = np.arange(nT)[:, None] * n_dsm + j_dsm[None, :]
+    j_down = np.arange(len(dsm_down_tuples))
+    dsm_prop = {col: np.array([dsm.loc[d, col] for d in dsm_tuples],
+                              dtype=float)
+                for col in ('eff', 'cap-max-up', 'cap-max-do', 'delay')}
+
+    start = m.add_rows('def_dsm_variables', n_dsm, 0, 0, timed=True)
+    m.add_coefs(start + dsm_t * n_dsm + dsm_d, m.col('dsm_down', j_down), 1)
+    m.add_coefs(start + rows_dsm, m.col('dsm_up', j_dsm), -dsm_prop['eff'])
+
+    start = m.add_rows('res_dsm_upward', n_dsm,
+                       hi=dt * dsm_prop['cap-max-up'], timed=True)
+    m.add_coefs(start + rows_dsm, m.col('dsm_up', j_dsm), 1)
+
+    start = m.add_rows('res_dsm_downward', n_dsm,
+                       hi=dt * dsm_prop['cap-max-do'], timed=True)
+    m.add_coefs(start + dsm_tt * n_dsm + dsm_d, m.col('dsm_down', j_down), 1)
+
+    start = m.add_rows('res_dsm_maximum', n_dsm,
+                       hi=dt * np.maximum(dsm_prop['cap-max-up'],
+                                          dsm_prop['cap-max-do']),
+                       timed=True)
+    m.add_coefs(start + rows_dsm, m.col('dsm_up', j_dsm), 1)
+    m.add_coefs(start + dsm_tt * n_dsm + dsm_d, m.col('dsm_down', j_down), 1)
+
+    start = m.add_rows('res_dsm_recovery', n_dsm,
+                       hi=dsm_prop['cap-max-up'] * dsm_prop['delay'],
+                       timed=True)
+    up = m.blocks['dsm_up']
+    for d in range(n_dsm):
+        # row (tm, d) sums dsm_up over [tm, stop)
+        stop = np.searchsorted(tm, recovery_window[d])
+        first = np.arange(nT)
+        length = stop - first
+        rows = np.repeat(start + first * n_dsm + d, length)
+        steps = np.concatenate([np.arange(a, b) for a, b in zip(first, stop)])
+        m.add_coefs(rows, up.start + steps * n_dsm + d, 1)
+
+    # global CO2 limit
+    co2_limit = global_prop.loc['CO2 limit', 'value']
+    if not math.isinf(co2_limit) and co2_limit >= 0:
+        start = m.add_rows('res_global_co2_limit', 1, hi=co2_limit)
+        pattern = _Pattern()
+        for sit in sites:
+            add_balance(pattern, 0, sit, 'CO2', -m.weight)
+        m.add_pattern(start, 1, pattern, timed=False)
+
+    # costs
+    start = m.add_rows('def_costs', len(COST_TYPES), 0, 0)
+    row = {cost_type: start + k for k, cost_type in enumerate(COST_TYPES)}
+    m.add_coefs(start + np.arange(len(COST_TYPES)),
+                m.col('costs', np.arange(len(COST_TYPES))), 1)
+
+    m.add_coefs(row['Invest'], m.col('cap_pro_new', j_pro),
+                -(process['inv-cost'] * pro_annuity).values)
+    m.add_coefs(row['Invest'], m.col('cap_tra_new', j_tra),
+                -(transmission['inv-cost'] * tra_annuity).values)
+    m.add_coefs(row['Invest'], m.col('cap_sto_p_new', j_sto),
+                -(storage['inv-cost-p'] * sto_annuity).values)
+    m.add_coefs(row['Invest'], m.col('cap_sto_c_new', j_sto),
+                -(storage['inv-cost-c'] * sto_annuity).values)
+
+    m.add_coefs(row['Fixed'], m.col('cap_pro', j_pro),
+                -process['fix-cost'].values)
+    m.add_coefs(row['Fixed'], m.col('cap_tra', j_tra),
+                -transmission['fix-cost'].values)
+    m.add_coefs(row['Fixed'], m.col('cap_sto_p', j_sto),
+                -storage['fix-cost-p'].values)
+    m.add_coefs(row['Fixed'], m.col('cap_sto_c', j_sto),
+                -storage['fix-cost-c'].values)
+
+    # tau_pro and e_sto_con also exist for the initial timestep, which is
+    # not part of the variable costs; col() only addresses modelled steps
+    m.add_coefs(row['Variable'], m.col('tau_pro', j_pro),
+                -m.weight * process['var-cost'].values)
+    m.add_coefs(row['Variable'], m.col('e_tra_in', j_tra),
+                -m.weight * transmission['var-cost'].values)
+    m.add_coefs(row['Variable'], m.col('e_sto_con', j_sto),
+                -m.weight * storage['var-cost-c'].values)
+    for var in ('e_sto_in', 'e_sto_out'):
+        m.add_coefs(row['Variable'], m.col(var, j_sto),
+                    -m.weight * storage['var-cost-p'].values)
+
+    price = commodity['price']
+    tuples = [c for c in com_tuples if c[1] in com_stock]
+    m.add_coefs(row['Fuel'], m.col('e_co_stock',
+                                   [pos['e_co_stock'][c] for c in tuples]),
+                -m.weight * np.array([price[c] for c in tuples], dtype=float))
+
+    for cost_type, com_set, var, sign in (
+            ('Revenue', com_sell, 'e_co_sell', 1),
+            ('Purchase', com_buy, 'e_co_buy', -1)):
+        tuples = [c for c in com_tuples if c[1] in com_set]
+        if not tuples:
+            continue
+        coefs = np.column_stack([
+            sign * m.weight * price[c] *
+            _timeseries(buy_sell_price, (c[1],), m.tm) for c in tuples])
+        m.add_coefs(row[cost_type],
+                    m.col(var, [pos[var][c] for c in tuples]), coefs)
+
+    pattern = _Pattern()
+    for (sit, com, com_type) in env_tuples:
+        add_balance(pattern, row['Environmental'], sit, com,
+                    m.weight * price[(sit, com, com_type)])
+    m.add_pattern(0, 0, pattern, timed=False)
+
+    # objective: sum of all cost types
+    m.add_objective('costs', np.arange(len(COST_TYPES)), 1)
+
+    return m.finalize()
+
+
+def _search_sell_buy_tuple(pro_input_tuples, pro_output_tuples, com_sell,
+                           pro_in):
+    """ Return the equivalent sell-process for a given buy-process.
+
+    Same as modelhelper.search_sell_buy_tuple, but operating on plain lists
+    of process input/output tuples instead of a model instance.
+    """
+    buy_out = set((x[0], x[2]) for x in pro_output_tuples if x[1] == pro_in)
+    for sell_output in (x for x in pro_output_tuples if x[2] in com_sell):
+        sell_pro = sell_output[1]
+        sell_in = set((x[0], x[2]) for x in pro_input_tuples
+                      if x[1] == sell_pro)
+        if not sell_in.isdisjoint(buy_out):
+            return sell_pro
+    return None
@@ -1,11 +1,15 @@
-import math
 import pyomo.core as pyomo
 from datetime import datetime
 from .modelhelper import *
 from .input import *
+from .encoding import decode_frame, encode_data, label_code, COLUMN_DOMAINS
+from .profiler import start_memory_tracing, stop_memory_tracing
+from .scenario import co2_limit_active, declare_mutable_params
 
 
-def create_model(data, dt=1, timesteps=None, dual=False):
+def create_model(data, dt=1, timesteps=None, dual=False, shared_balance=False,
+                 profile=False, presolve=False, compact=False, mutable=False,
+                 encode=False):
     """Create a pyomo ConcreteModel urbs object from given input data.
 
     Args:
@@ -14,36 +18,102 @@ def create_model(data, dt=1, timesteps=None, dual=False):
         dt: timestep duration in hours (default: 1)
         timesteps: optional list of timesteps, default: demand timeseries
         dual: set True to add dual variables to model (slower); default: False
+        shared_balance: set True to build each commodity balance only once
+            as expression e_co_balance, shared by all constraints and costs
+            that refer to it; default: False
+        profile: set True to record a build profile (time, memory, rule
+            calls, skips and nonzeros per component), retrievable with
+            get_build_profile; default: False
+        presolve: set True to express capacity ranges and fixed capacities
+            as variable bounds instead of constraints, and to bound flows by
+            the maximal capacities; default: False
+        compact: set True to substitute e_pro_in, e_pro_out, e_tra_out and
+            cap_tra by expressions instead of variables with equality
+            constraints; default: False
+        mutable: set True to declare prices, commodity limits, capacity
+            bounds, efficiencies, process ratios and the global CO2 limit as
+            mutable parameters that update_model can change in place;
+            cannot be combined with presolve; default: False
+        encode: set True to replace site, commodity, commodity type,
+            process, transmission and storage names by integer codes within
+            the model; get_entity returns labels as usual; cannot be
+            combined with mutable; default: False
 
     Returns:
         a pyomo ConcreteModel object
     """
 
+    # memory tracing is stopped even if the model build fails
+    tracing = profile and start_memory_tracing()
+    try:
+        return _create_model(data, dt, timesteps, dual, shared_balance,
+                             profile, presolve, compact, mutable, encode)
+    finally:
+        if tracing:
+            stop_memory_tracing()
+
+
+def _create_model(data, dt, timesteps, dual, shared_balance, profile,
+                  presolve, compact, mutable, encode):
+    """Build the model; see create_model for the arguments. """
+
+    if presolve and mutable:
+        raise ValueError("presolve and mutable cannot be combined, as "
+                         "presolved bounds would not follow parameter "
+                         "updates.")
+
+    if encode and mutable:
+        raise ValueError("encode and mutable cannot be combined, as "
+                         "update_model applies labelled input data.")
+
     # Optional
     if not timesteps:
         timesteps = data['demand'].index.tolist()
-    m = pyomo_model_prep(data, timesteps)  # preparing pyomo model
+    if encode:
+        labelled_data = data
+        data, codebook = encode_data(data)
+    m = pyomo_model_prep(data, timesteps, profile)  # preparing pyomo model
     m.name = 'urbs'
     m.created = datetime.now().strftime('%Y%m%dT%H%M')
     m._data = data
+    m._codebook = codebook if encode else None
+    m.shared_balance = shared_balance
+    m.presolve = presolve
+    m.compact = compact
+    m.mutable = mutable
+    m.periodic = 'period' in m.timestep_prop.columns
 
     # Parameters
 
+    # dt = spacing between timesteps. Required for storage equation that
+    # converts between energy (storage content, e_sto_con) and power (all other
+    # quantities that start with "e_")
+    m.dt = pyomo.Param(
+        initialize=dt,
+        doc='Time step duration (in hours), default: 1')
+
+    # duration of each modelled timestep: dt, unless timestep durations are
+    # given (e.g. by segment_timeseries)
+    m.duration_dict = timestep_durations(m)
+
     # weight = length of year (hours) / length of simulation (hours)
     # weight scales costs and emissions from length of simulation to a full
     # year, making comparisons among cost types (invest is annualized, fixed
     # costs are annual by default, variable costs are scaled by weight) and
-    # among different simulation durations meaningful.
+    # among different simulation durations meaningful. The simulation length
+    # is len(timesteps) * dt, or the total duration of all timesteps if
+    # durations are given (c.f. annual_weight).
     m.weight = pyomo.Param(
-        initialize=float(8760) / (len(m.timesteps) * dt),
+        initialize=annual_weight(m.timestep_prop, m.timesteps, dt),
         doc='Pre-factor for variable costs and emissions for an annual result')
 
-    # dt = spacing between timesteps. Required for storage equation that
-    # converts between energy (storage content, e_sto_con) and power (all other
-    # quantities that start with "e_")
-    m.dt = pyomo.Param(
-        initialize=dt,
-        doc='Time step duration (in hours), default: 1')
+    # preceding timestep and (first, last) timestep of the period for each
+    # modelled timestep; periods of representative timeseries are cyclic
+    m.predecessor, m.period_bounds = timestep_periods(m)
+
+    # DSM delay and recovery windows (lookup tables per (site, commodity)
+    # and timestep), used by the dsm_down tuples and the DSM rules
+    m.dsm_delay_window, m.dsm_recovery_window = dsm_windows(m)
 
     # Sets
     # ====
@@ -124,6 +194,14 @@ def create_model(data, dt=1, timesteps=None, dual=False):
         initialize=m.transmission.index,
         doc='Combinations of possible transmissions, e.g. '
             '(South,Mid,hvac,Elec)')
+    if compact:
+        # one representative per pair of opposite transmission directions
+        m.tra_bi_dict = bidirectional_tuples(m.transmission.index)
+        m.tra_bi_tuples = pyomo.Set(
+            within=m.sit*m.sit*m.tra*m.com,
+            initialize=sorted(set(m.tra_bi_dict.values())),
+            doc='Combinations of transmissions, one per pair of opposite '
+                'directions, e.g. (Mid,South,hvac,Elec)')
     m.sto_tuples = pyomo.Set(
         within=m.sit*m.sto*m.com,
         initialize=m.storage.index,
@@ -142,6 +220,14 @@ def create_model(data, dt=1, timesteps=None, dual=False):
         doc='Combinations of possible dsm_down combinations, e.g. '
             '(5001,5003,Mid,Elec)')
 
+    # commodity balance tuples, i.e. defined commodities with at least one
+    # adjacent process, transmission or storage
+    m.balance_tuples = pyomo.Set(
+        within=m.sit*m.com,
+        initialize=sorted(set((sit, com) for (sit, com, _) in m.com_tuples
+                              if (sit, com) in m.balance_index)),
+        doc='Combinations of commodities with a balance, e.g. (Mid,Elec)')
+
     # process tuples for area rule
     m.pro_area_tuples = pyomo.Set(
         within=m.sit*m.pro,
@@ -169,7 +255,8 @@ def create_model(data, dt=1, timesteps=None, dual=False):
         within=m.sit*m.pro,
         initialize=[(sit, pro)
                     for (sit, pro) in m.pro_tuples
-                    if m.process.loc[sit, pro]['max-grad'] < 1.0 / dt],
+                    if m.process.loc[sit, pro]['max-grad'] <
+                    1.0 / min(m.duration_dict.values())],
         doc='Processes with maximum gradient smaller than timestep length')
 
     # process tuples for partial feature
@@ -197,32 +284,85 @@ def create_model(data, dt=1, timesteps=None, dual=False):
                     if process == pro],
         doc='Commodities with partial input ratio, e.g. (Mid,Coal PP,CO2)')
 
-    # commodity type subsets
+    # commodity type subsets (type names are coded in an encoded model)
+    com_type = dict((name, label_code(m, 'com_type', name))
+                    for name in ['SupIm', 'Stock', 'Sell', 'Buy', 'Demand',
+                                 'Env'])
     m.com_supim = pyomo.Set(
         within=m.com,
-        initialize=commodity_subset(m.com_tuples, 'SupIm'),
+        initialize=commodity_subset(m.com_tuples, com_type['SupIm']),
         doc='Commodities that have intermittent (timeseries) input')
     m.com_stock = pyomo.Set(
         within=m.com,
-        initialize=commodity_subset(m.com_tuples, 'Stock'),
+        initialize=commodity_subset(m.com_tuples, com_type['Stock']),
         doc='Commodities that can be purchased at some site(s)')
     m.com_sell = pyomo.Set(
         within=m.com,
-        initialize=commodity_subset(m.com_tuples, 'Sell'),
+        initialize=commodity_subset(m.com_tuples, com_type['Sell']),
         doc='Commodities that can be sold')
     m.com_buy = pyomo.Set(
         within=m.com,
-        initialize=commodity_subset(m.com_tuples, 'Buy'),
+        initialize=commodity_subset(m.com_tuples, com_type['Buy']),
         doc='Commodities that can be purchased')
     m.com_demand = pyomo.Set(
         within=m.com,
-        initialize=commodity_subset(m.com_tuples, 'Demand'),
+        initialize=commodity_subset(m.com_tuples, com_type['Demand']),
         doc='Commodities that have a demand (implies timeseries)')
     m.com_env = pyomo.Set(
         within=m.com,
-        initialize=commodity_subset(m.com_tuples, 'Env'),
+        initialize=commodity_subset(m.com_tuples, com_type['Env']),
         doc='Commodities that (might) have a maximum creation limit')
 
+    # commodity tuple subsets by type, used as constraint domains so that
+    # rules are only invoked for the commodities they apply to
+    m.com_stock_tuples = pyomo.Set(
+        within=m.sit*m.com*m.com_type,
+        initialize=commodity_subset(m.com_tuples, m.com_stock),
+        doc='Combinations of stock commodities, e.g. (Mid,Coal,Stock)')
+    m.com_sell_tuples = pyomo.Set(
+        within=m.sit*m.com*m.com_type,
+        initialize=commodity_subset(m.com_tuples, m.com_sell),
+        doc='Combinations of sell commodities, e.g. (Mid,Elec sell,Sell)')
+    m.com_buy_tuples = pyomo.Set(
+        within=m.sit*m.com*m.com_type,
+        initialize=commodity_subset(m.com_tuples, m.com_buy),
+        doc='Combinations of buy commodities, e.g. (Mid,Elec buy,Buy)')
+    m.com_env_tuples = pyomo.Set(
+        within=m.sit*m.com*m.com_type,
+        initialize=commodity_subset(m.com_tuples, m.com_env),
+        doc='Combinations of environmental commodities, e.g. (Mid,CO2,Env)')
+    m.com_vertex_tuples = pyomo.Set(
+        within=m.sit*m.com*m.com_type,
+        initialize=[c for c in m.com_tuples
+                    if c[1] not in m.com_env and c[1] not in m.com_supim],
+        doc='Combinations of commodities with a vertex rule, i.e. neither '
+            'environmental nor intermittent, e.g. (Mid,Elec,Demand)')
+    m.pro_supim_input_tuples = pyomo.Set(
+        within=m.sit*m.pro*m.com,
+        initialize=[p for p in m.pro_input_tuples if p[2] in m.com_supim],
+        doc='Intermittent commodities consumed by process by site, e.g. '
+            '(Mid,PV,Solar)')
+
+    # per-timestep duration (in hours), used instead of m.dt in all rules
+    # that convert between power and energy
+    m.duration = pyomo.Param(
+        m.tm,
+        initialize=m.duration_dict,
+        doc='Time step duration (in hours) per timestep, default: dt')
+
+    # per-timestep weight, equal to m.weight unless timestep weights are
+    # given (e.g. by aggregate_timeseries); scales costs and emissions of
+    # each timestep to an annual result
+    m.weight_t = pyomo.Param(
+        m.tm,
+        initialize=timestep_weights(m),
+        doc='Pre-factor for variable costs and emissions per timestep')
+
+    # scenario data as mutable parameters (cf. update_model); they replace
+    # the entries of the input dicts, so that the rules refer to them
+    if mutable:
+        declare_mutable_params(m)
+
     # Variables
 
     # costs
@@ -258,20 +398,43 @@ def create_model(data, dt=1, timesteps=None, dual=False):
         m.t, m.pro_tuples,
         within=pyomo.NonNegativeReals,
         doc='Power flow (MW) through process')
-    m.e_pro_in = pyomo.Var(
-        m.tm, m.pro_tuples, m.com,
-        within=pyomo.NonNegativeReals,
-        doc='Power flow of commodity into process (MW) per timestep')
-    m.e_pro_out = pyomo.Var(
-        m.tm, m.pro_tuples, m.com,
-        within=pyomo.NonNegativeReals,
-        doc='Power flow out of process (MW) per timestep')
+    if compact:
+        # process flows as fixed multiples of throughput (and capacity, for
+        # partial load processes) instead of variables and equalities
+        m.e_pro_in = pyomo.Expression(
+            m.tm, m.pro_input_tuples,
+            rule=def_process_input_expression_rule,
+            doc='Power flow of commodity into process (MW) per timestep')
+        m.e_pro_out = pyomo.Expression(
+            m.tm, m.pro_output_tuples,
+            rule=def_process_output_expression_rule,
+            doc='Power flow out of process (MW) per timestep')
+    else:
+        m.e_pro_in = pyomo.Var(
+            m.tm, m.pro_input_tuples,
+            within=pyomo.NonNegativeReals,
+            doc='Power flow of commodity into process (MW) per timestep')
+        m.e_pro_out = pyomo.Var(
+            m.tm, m.pro_output_tuples,
+            within=pyomo.NonNegativeReals,
+            doc='Power flow out of process (MW) per timestep')
 
     # transmission
-    m.cap_tra = pyomo.Var(
-        m.tra_tuples,
-        within=pyomo.NonNegativeReals,
-        doc='Total transmission capacity (MW)')
+    if compact:
+        # symmetric capacities share one variable per pair of directions
+        m.cap_tra_bi = pyomo.Var(
+            m.tra_bi_tuples,
+            within=pyomo.NonNegativeReals,
+            doc='Total transmission capacity of both directions (MW)')
+        m.cap_tra = pyomo.Expression(
+            m.tra_tuples,
+            rule=def_transmission_capacity_expression_rule,
+            doc='Total transmission capacity (MW)')
+    else:
+        m.cap_tra = pyomo.Var(
+            m.tra_tuples,
+            within=pyomo.NonNegativeReals,
+            doc='Total transmission capacity (MW)')
     m.cap_tra_new = pyomo.Var(
         m.tra_tuples,
         within=pyomo.NonNegativeReals,
@@ -280,10 +443,16 @@ def create_model(data, dt=1, timesteps=None, dual=False):
         m.tm, m.tra_tuples,
         within=pyomo.NonNegativeReals,
         doc='Power flow into transmission line (MW) per timestep')
-    m.e_tra_out = pyomo.Var(
-        m.tm, m.tra_tuples,
-        within=pyomo.NonNegativeReals,
-        doc='Power flow out of transmission line (MW) per timestep')
+    if compact:
+        m.e_tra_out = pyomo.Expression(
+            m.tm, m.tra_tuples,
+            rule=def_transmission_output_expression_rule,
+            doc='Power flow out of transmission line (MW) per timestep')
+    else:
+        m.e_tra_out = pyomo.Var(
+            m.tm, m.tra_tuples,
+            within=pyomo.NonNegativeReals,
+            doc='Power flow out of transmission line (MW) per timestep')
 
     # storage
     m.cap_sto_c = pyomo.Var(
@@ -325,45 +494,64 @@ def create_model(data, dt=1, timesteps=None, dual=False):
         within=pyomo.NonNegativeReals,
         doc='DSM downshift')
 
+    # Presolve
+
+    # capacity ranges and fixed capacities as bounds of capacity variables,
+    # flows bounded by maximal capacities; the corresponding constraint
+    # rules return Constraint.Skip
+    if presolve:
+        presolve_bounds(m)
+
+    # Expressions
+
+    # commodity balance, built once per timestep, site and commodity and
+    # referenced by vertex rule, environmental limits and costs
+    if shared_balance:
+        m.e_co_balance = pyomo.Expression(
+            m.tm, m.balance_tuples,
+            rule=def_commodity_balance_rule,
+            doc='Commodity balance (MW) per timestep; consumed (positive) '
+                'minus provided (negative) commodity flow')
+
     # Equation declarations
     # equation bodies are defined in separate functions, referred to here by
     # their name in the "rule" keyword.
 
     # commodity
     m.res_vertex = pyomo.Constraint(
-        m.tm, m.com_tuples,
+        m.tm, m.com_vertex_tuples,
         rule=res_vertex_rule,
         doc='storage + transmission + process + source + buy - sell == demand')
     m.res_stock_step = pyomo.Constraint(
-        m.tm, m.com_tuples,
+        m.tm, m.com_stock_tuples,
         rule=res_stock_step_rule,
         doc='stock commodity input per step <= commodity.maxperstep')
     m.res_stock_total = pyomo.Constraint(
-        m.com_tuples,
+        m.com_stock_tuples,
         rule=res_stock_total_rule,
         doc='total stock commodity input <= commodity.max')
     m.res_sell_step = pyomo.Constraint(
-        m.tm, m.com_tuples,
+        m.tm, m.com_sell_tuples,
         rule=res_sell_step_rule,
         doc='sell commodity output per step <= commodity.maxperstep')
     m.res_sell_total = pyomo.Constraint(
-        m.com_tuples,
+        m.com_sell_tuples,
         rule=res_sell_total_rule,
         doc='total sell commodity output <= commodity.max')
     m.res_buy_step = pyomo.Constraint(
-        m.tm, m.com_tuples,
+        m.tm, m.com_buy_tuples,
         rule=res_buy_step_rule,
         doc='buy commodity output per step <= commodity.maxperstep')
     m.res_buy_total = pyomo.Constraint(
-        m.com_tuples,
+        m.com_buy_tuples,
         rule=res_buy_total_rule,
         doc='total buy commodity output <= commodity.max')
     m.res_env_step = pyomo.Constraint(
-        m.tm, m.com_tuples,
+        m.tm, m.com_env_tuples,
         rule=res_env_step_rule,
         doc='environmental output per step <= commodity.maxperstep')
     m.res_env_total = pyomo.Constraint(
-        m.com_tuples,
+        m.com_env_tuples,
         rule=res_env_total_rule,
         doc='total environmental commodity output <= commodity.max')
 
@@ -372,16 +560,17 @@ def create_model(data, dt=1, timesteps=None, dual=False):
         m.pro_tuples,
         rule=def_process_capacity_rule,
         doc='total process capacity = inst-cap + new capacity')
-    m.def_process_input = pyomo.Constraint(
-        m.tm, m.pro_input_tuples - m.pro_partial_input_tuples,
-        rule=def_process_input_rule,
-        doc='process input = process throughput * input ratio')
-    m.def_process_output = pyomo.Constraint(
-        m.tm, m.pro_output_tuples - m.pro_partial_output_tuples,
-        rule=def_process_output_rule,
-        doc='process output = process throughput * output ratio')
+    if not compact:
+        m.def_process_input = pyomo.Constraint(
+            m.tm, m.pro_input_tuples - m.pro_partial_input_tuples,
+            rule=def_process_input_rule,
+            doc='process input = process throughput * input ratio')
+        m.def_process_output = pyomo.Constraint(
+            m.tm, m.pro_output_tuples - m.pro_partial_output_tuples,
+            rule=def_process_output_rule,
+            doc='process output = process throughput * output ratio')
     m.def_intermittent_supply = pyomo.Constraint(
-        m.tm, m.pro_input_tuples,
+        m.tm, m.pro_supim_input_tuples,
         rule=def_intermittent_supply_rule,
         doc='process output = process capacity * supim timeseries')
     m.res_process_throughput_by_capacity = pyomo.Constraint(
@@ -415,28 +604,30 @@ def create_model(data, dt=1, timesteps=None, dual=False):
         m.tm, m.pro_partial_tuples,
         rule=res_throughput_by_capacity_min_rule,
         doc='cap_pro * min-fraction <= tau_pro')
-    m.def_partial_process_input = pyomo.Constraint(
-        m.tm, m.pro_partial_input_tuples,
-        rule=def_partial_process_input_rule,
-        doc='e_pro_in = '
-            ' cap_pro * min_fraction * (r - R) / (1 - min_fraction)'
-            ' + tau_pro * (R - min_fraction * r) / (1 - min_fraction)')
-    m.def_partial_process_output = pyomo.Constraint(
-        m.tm, m.pro_partial_output_tuples,
-        rule=def_partial_process_output_rule,
-        doc='e_pro_out = '
-            ' cap_pro * min_fraction * (r - R) / (1 - min_fraction)'
-            ' + tau_pro * (R - min_fraction * r) / (1 - min_fraction)')
+    if not compact:
+        m.def_partial_process_input = pyomo.Constraint(
+            m.tm, m.pro_partial_input_tuples,
+            rule=def_partial_process_input_rule,
+            doc='e_pro_in = '
+                ' cap_pro * min_fraction * (r - R) / (1 - min_fraction)'
+                ' + tau_pro * (R - min_fraction * r) / (1 - min_fraction)')
+        m.def_partial_process_output = pyomo.Constraint(
+            m.tm, m.pro_partial_output_tuples,
+            rule=def_partial_process_output_rule,
+            doc='e_pro_out = '
+                ' cap_pro * min_fraction * (r - R) / (1 - min_fraction)'
+                ' + tau_pro * (R - min_fraction * r) / (1 - min_fraction)')
 
     # transmission
     m.def_transmission_capacity = pyomo.Constraint(
         m.tra_tuples,
         rule=def_transmission_capacity_rule,
         doc='total transmission capacity = inst-cap + new capacity')
-    m.def_transmission_output = pyomo.Constraint(
-        m.tm, m.tra_tuples,
-        rule=def_transmission_output_rule,
-        doc='transmission output = transmission input * efficiency')
+    if not compact:
+        m.def_transmission_output = pyomo.Constraint(
+            m.tm, m.tra_tuples,
+            rule=def_transmission_output_rule,
+            doc='transmission output = transmission input * efficiency')
     m.res_transmission_input_by_capacity = pyomo.Constraint(
         m.tm, m.tra_tuples,
         rule=res_transmission_input_by_capacity_rule,
@@ -446,10 +637,12 @@ def create_model(data, dt=1, timesteps=None, dual=False):
         rule=res_transmission_capacity_rule,
         doc='transmission.cap-lo <= total transmission capacity <= '
             'transmission.cap-up')
-    m.res_transmission_symmetry = pyomo.Constraint(
-        m.tra_tuples,
-        rule=res_transmission_symmetry_rule,
-        doc='total transmission capacity must be symmetric in both directions')
+    if not compact:
+        m.res_transmission_symmetry = pyomo.Constraint(
+            m.tra_tuples,
+            rule=res_transmission_symmetry_rule,
+            doc='total transmission capacity must be symmetric in both '
+                'directions')
 
     # storage
     m.def_storage_state = pyomo.Constraint(
@@ -528,12 +721,52 @@ def create_model(data, dt=1, timesteps=None, dual=False):
     m.res_global_co2_limit = pyomo.Constraint(
             rule=res_global_co2_limit_rule,
             doc='total co2 commodity output <= Global CO2 limit')
+    if mutable and not co2_limit_active(pyomo.value(m.co2_limit)):
+        m.res_global_co2_limit.deactivate()
 
     if dual:
         m.dual = pyomo.Suffix(direction=pyomo.Suffix.IMPORT)
+    if encode:
+        decode_model_data(m, labelled_data)
     return m
 
 
+def decode_model_data(m, data):
+    """Restore labelled input DataFrames of an encoded model.
+
+    After construction, the input DataFrames of the model are only read by
+    reporting functions, which expect labels. Derived columns (e.g.
+    'annuity-factor') are kept.
+
+    Args:
+        m: a urbs model instance created with encode=True
+        data: the (labelled) input data the model was created from
+
+    Returns:
+        None
+    """
+    m._data = dict(data)
+    for key in m._data:
+        if not hasattr(m, key):
+            continue
+        coded = getattr(m, key)
+        df = decode_frame(coded, m._codebook, COLUMN_DOMAINS.get(key))
+        if df is not coded:
+            # tables without labels (e.g. global_prop) stay as they are
+            setattr(m, key, df)
+            m._data[key] = df
+    for key in COLUMN_DOMAINS:
+        getattr(m, key + '_ts').relabel(getattr(m, key).columns)
+
+
+# Expressions
+
+# commodity balance: consumption by processes, exports and storage input minus
+# provision by processes, imports and storage output
+def def_commodity_balance_rule(m, tm, sit, com):
+    return commodity_balance_terms(m, tm, sit, com)
+
+
 # Constraints
 
 # commodity
@@ -543,11 +776,8 @@ def create_model(data, dt=1, timesteps=None, dual=False):
 # storage activity (calculated by function commodity_balance);
 # contains implicit constraint for stock commodity source term
 def res_vertex_rule(m, tm, sit, com, com_type):
-    # environmental or supim commodities don't have this constraint (yet)
-    if com in m.com_env:
-        return pyomo.Constraint.Skip
-    if com in m.com_supim:
-        return pyomo.Constraint.Skip
+    # environmental or supim commodities don't have this constraint (yet),
+    # they are excluded from its domain m.com_vertex_tuples
 
     # helper function commodity_balance calculates balance from input to
     # and output from processes, storage and transmission.
@@ -573,11 +803,11 @@ def res_vertex_rule(m, tm, sit, com, com_type):
         power_surplus += m.e_co_buy[tm, sit, com, com_type]
 
     # if com is a demand commodity, the power_surplus is reduced by the
-    # demand value; no scaling by m.dt or m.weight is needed here, as this
-    # constraint is about power (MW), not energy (MWh)
+    # demand value; like all other terms, demand is energy per timestep
+    # (MWh), so no scaling by m.duration is needed here
     if com in m.com_demand:
         try:
-            power_surplus -= m.demand_dict[(sit, com)][tm]
+            power_surplus -= m.demand_ts[(sit, com), tm]
         except KeyError:
             pass
     # if sit com is a dsm tuple, the power surplus is decreased by the
@@ -585,10 +815,7 @@ def res_vertex_rule(m, tm, sit, com, com_type):
     if (sit, com) in m.dsm_site_tuples:
         power_surplus -= m.dsm_up[tm, sit, com]
         power_surplus += sum(m.dsm_down[t, tm, sit, com]
-                             for t in dsm_time_tuples(
-                                 tm, m.timesteps[1:],
-                                 max(int(1 / m.dt *
-                                     m.dsm_dict['delay'][(sit, com)]), 1)))
+                             for t in m.dsm_delay_window[(sit, com)][tm])
     return power_surplus == 0
 
 # demand side management (DSM) constraints
@@ -597,10 +824,7 @@ def res_vertex_rule(m, tm, sit, com, com_type):
 # DSMup == DSMdo * efficiency factor n
 def def_dsm_variables_rule(m, tm, sit, com):
     dsm_down_sum = 0
-    for tt in dsm_time_tuples(tm,
-                              m.timesteps[1:],
-                              max(int(1 / m.dt *
-                                  m.dsm_dict['delay'][(sit, com)]), 1)):
+    for tt in m.dsm_delay_window[(sit, com)][tm]:
         dsm_down_sum += m.dsm_down[tm, tt, sit, com]
     return dsm_down_sum == (m.dsm_up[tm, sit, com] *
                             m.dsm_dict['eff'][(sit, com)])
@@ -608,42 +832,34 @@ def def_dsm_variables_rule(m, tm, sit, com):
 
 # DSMup <= Cup (threshold capacity of DSMup)
 def res_dsm_upward_rule(m, tm, sit, com):
-    return m.dsm_up[tm, sit, com] <= (m.dt *
+    return m.dsm_up[tm, sit, com] <= (m.duration[tm] *
                                       m.dsm_dict['cap-max-up'][(sit, com)])
 
 
 # DSMdo <= Cdo (threshold capacity of DSMdo)
 def res_dsm_downward_rule(m, tm, sit, com):
     dsm_down_sum = 0
-    for t in dsm_time_tuples(tm,
-                             m.timesteps[1:],
-                             max(int(1 / m.dt *
-                                 m.dsm_dict['delay'][(sit, com)]), 1)):
+    for t in m.dsm_delay_window[(sit, com)][tm]:
         dsm_down_sum += m.dsm_down[t, tm, sit, com]
-    return dsm_down_sum <= (m.dt * m.dsm_dict['cap-max-do'][(sit, com)])
+    return dsm_down_sum <= (m.duration[tm] *
+                            m.dsm_dict['cap-max-do'][(sit, com)])
 
 
 # DSMup + DSMdo <= max(Cup,Cdo)
 def res_dsm_maximum_rule(m, tm, sit, com):
     dsm_down_sum = 0
-    for t in dsm_time_tuples(tm,
-                             m.timesteps[1:],
-                             max(int(1 / m.dt *
-                                 m.dsm_dict['delay'][(sit, com)]), 1)):
+    for t in m.dsm_delay_window[(sit, com)][tm]:
         dsm_down_sum += m.dsm_down[t, tm, sit, com]
 
-    max_dsm_limit = m.dt * max(m.dsm_dict['cap-max-up'][(sit, com)],
-                               m.dsm_dict['cap-max-do'][(sit, com)])
+    max_dsm_limit = m.duration[tm] * max(m.dsm_dict['cap-max-up'][(sit, com)],
+                                         m.dsm_dict['cap-max-do'][(sit, com)])
     return m.dsm_up[tm, sit, com] + dsm_down_sum <= max_dsm_limit
 
 
 # DSMup(t, t + recovery time R) <= Cup * delay time L
 def res_dsm_recovery_rule(m, tm, sit, com):
     dsm_up_sum = 0
-    for t in dsm_recovery(tm,
-                          m.timesteps[1:],
-                          max(int(1 / m.dt *
-                              m.dsm_dict['recov'][(sit, com)]), 1)):
+    for t in m.dsm_recovery_window[(sit, com)][tm]:
         dsm_up_sum += m.dsm_up[t, sit, com]
     return dsm_up_sum <= (m.dsm_dict['cap-max-up'][(sit, com)] *
                           m.dsm_dict['delay'][(sit, com)])
@@ -653,77 +869,59 @@ def res_dsm_recovery_rule(m, tm, sit, com):
 # commodity_balance of current (time step, site, commodity);
 # limit stock commodity use per time step
 def res_stock_step_rule(m, tm, sit, com, com_type):
-    if com not in m.com_stock:
-        return pyomo.Constraint.Skip
-    else:
-        return (m.e_co_stock[tm, sit, com, com_type] <=
-                m.dt * m.commodity_dict['maxperhour'][(sit, com, com_type)])
+    return (m.e_co_stock[tm, sit, com, com_type] <=
+            m.duration[tm] *
+            m.commodity_dict['maxperhour'][(sit, com, com_type)])
 
 
 # limit stock commodity use in total (scaled to annual consumption, thanks
-# to m.weight)
+# to m.weight_t)
 def res_stock_total_rule(m, sit, com, com_type):
-    if com not in m.com_stock:
-        return pyomo.Constraint.Skip
-    else:
-        # calculate total consumption of commodity com
-        total_consumption = 0
-        for tm in m.tm:
-            total_consumption += (
-                m.e_co_stock[tm, sit, com, com_type])
-        total_consumption *= m.weight
-        return (total_consumption <=
-                m.commodity_dict['max'][(sit, com, com_type)])
+    # calculate total consumption of commodity com
+    total_consumption = 0
+    for tm in m.tm:
+        total_consumption += (
+            m.e_co_stock[tm, sit, com, com_type] * m.weight_t[tm])
+    return (total_consumption <=
+            m.commodity_dict['max'][(sit, com, com_type)])
 
 
 # limit sell commodity use per time step
 def res_sell_step_rule(m, tm, sit, com, com_type):
-    if com not in m.com_sell:
-        return pyomo.Constraint.Skip
-    else:
-        return (m.e_co_sell[tm, sit, com, com_type] <=
-                m.dt * m.commodity_dict['maxperhour'][(sit, com, com_type)])
+    return (m.e_co_sell[tm, sit, com, com_type] <=
+            m.duration[tm] *
+            m.commodity_dict['maxperhour'][(sit, com, com_type)])
 
 
 # limit sell commodity use in total (scaled to annual consumption, thanks
-# to m.weight)
+# to m.weight_t)
 def res_sell_total_rule(m, sit, com, com_type):
-    if com not in m.com_sell:
-        return pyomo.Constraint.Skip
-    else:
-        # calculate total sale of commodity com
-        total_consumption = 0
-        for tm in m.tm:
-            total_consumption += (
-                m.e_co_sell[tm, sit, com, com_type])
-        total_consumption *= m.weight
-        return (total_consumption <=
-                m.commodity_dict['max'][(sit, com, com_type)])
+    # calculate total sale of commodity com
+    total_consumption = 0
+    for tm in m.tm:
+        total_consumption += (
+            m.e_co_sell[tm, sit, com, com_type] * m.weight_t[tm])
+    return (total_consumption <=
+            m.commodity_dict['max'][(sit, com, com_type)])
 
 
 # limit buy commodity use per time step
 def res_buy_step_rule(m, tm, sit, com, com_type):
-    if com not in m.com_buy:
-        return pyomo.Constraint.Skip
-    else:
-        return (m.e_co_buy[tm, sit, com, com_type] <=
-                m.dt * m.commodity_dict['maxperhour'][(sit, com, com_type)])
+    return (m.e_co_buy[tm, sit, com, com_type] <=
+            m.duration[tm] *
+            m.commodity_dict['maxperhour'][(sit, com, com_type)])
 
 
 # limit buy commodity use in total (scaled to annual consumption, thanks
-# to m.weight)
+# to m.weight_t)
 def res_buy_total_rule(m, sit, com, com_type):
-    if com not in m.com_buy:
-        return pyomo.Constraint.Skip
-    else:
-        # calculate total sale of commodity com
-        total_consumption = 0
-        for tm in m.tm:
-            total_consumption += (
-                m.e_co_buy[tm, sit, com, com_type])
-        total_consumption *= m.weight
-        return (total_consumption <=
-                m.commodity_dict['max'][(sit, com, com_type)])
+    # calculate total sale of commodity com
+    total_consumption = 0
+    for tm in m.tm:
+        total_consumption += (
+            m.e_co_buy[tm, sit, com, com_type] * m.weight_t[tm])
+    return (total_consumption <=
+            m.commodity_dict['max'][(sit, com, com_type)])
 
 
 # environmental commodity creation == - commodity_balance of that commodity
@@ -731,33 +929,30 @@ def res_buy_total_rule(m, sit, com, com_type):
 # any process activity;
 # limit environmental commodity output per time step
 def res_env_step_rule(m, tm, sit, com, com_type):
-    if com not in m.com_env:
-        return pyomo.Constraint.Skip
-    else:
-        environmental_output = - commodity_balance(m, tm, sit, com)
-        return (environmental_output <=
-                m.dt * m.commodity_dict['maxperhour'][(sit, com, com_type)])
+    environmental_output = - commodity_balance(m, tm, sit, com)
+    return (environmental_output <=
+            m.duration[tm] *
+            m.commodity_dict['maxperhour'][(sit, com, com_type)])
 
 
 # limit environmental commodity output in total (scaled to annual
-# emissions, thanks to m.weight)
+# emissions, thanks to m.weight_t)
 def res_env_total_rule(m, sit, com, com_type):
-    if com not in m.com_env:
-        return pyomo.Constraint.Skip
-    else:
-        # calculate total creation of environmental commodity com
-        env_output_sum = 0
-        for tm in m.tm:
-            env_output_sum += (- commodity_balance(m, tm, sit, com))
-        env_output_sum *= m.weight
-        return (env_output_sum <=
-                m.commodity_dict['max'][(sit, com, com_type)])
+    # calculate total creation of environmental commodity com
+    env_output_sum = 0
+    for tm in m.tm:
+        env_output_sum += (- commodity_balance(m, tm, sit, com) *
+                           m.weight_t[tm])
+    return (env_output_sum <=
+            m.commodity_dict['max'][(sit, com, com_type)])
 
 # process
 
 
 # process capacity == new capacity + existing capacity
 def def_process_capacity_rule(m, sit, pro):
+    if m.presolve and m.cap_pro[sit, pro].fixed:
+        return pyomo.Constraint.Skip
     return (m.cap_pro[sit, pro] ==
             m.cap_pro_new[sit, pro] +
             m.process_dict['inst-cap'][(sit, pro)])
@@ -777,37 +972,51 @@ def def_process_output_rule(m, tm, sit, pro, co):
 
 # process input (for supim commodity) = process capacity * timeseries
 def def_intermittent_supply_rule(m, tm, sit, pro, coin):
-    if coin in m.com_supim:
-        return (m.e_pro_in[tm, sit, pro, coin] ==
-                m.cap_pro[sit, pro] * m.supim_dict[(sit, coin)][tm] * m.dt)
-    else:
-        return pyomo.Constraint.Skip
+    return (m.e_pro_in[tm, sit, pro, coin] ==
+            m.cap_pro[sit, pro] * m.supim_ts[(sit, coin), tm] *
+            m.duration[tm])
 
 
 # process throughput <= process capacity
 def res_process_throughput_by_capacity_rule(m, tm, sit, pro):
-    return (m.tau_pro[tm, sit, pro] <= m.dt * m.cap_pro[sit, pro])
+    return (m.tau_pro[tm, sit, pro] <= m.duration[tm] * m.cap_pro[sit, pro])
 
 
+# process throughput changes by at most capacity * max-grad * duration from
+# the preceding timestep; the preceding throughput is scaled to the duration
+# of timestep t, as consecutive timesteps may differ in duration
 def res_process_maxgrad_lower_rule(m, t, sit, pro):
-    return (m.tau_pro[t-1, sit, pro] -
+    ratio = m.duration[t] / predecessor_duration(m, t)
+    return (m.tau_pro[m.predecessor[t], sit, pro] * ratio -
             m.cap_pro[sit, pro] * m.process_dict['max-grad'][(sit, pro)] *
-            m.dt <= m.tau_pro[t, sit, pro])
+            m.duration[t] <= m.tau_pro[t, sit, pro])
 
 
 def res_process_maxgrad_upper_rule(m, t, sit, pro):
-    return (m.tau_pro[t-1, sit, pro] +
+    ratio = m.duration[t] / predecessor_duration(m, t)
+    return (m.tau_pro[m.predecessor[t], sit, pro] * ratio +
             m.cap_pro[sit, pro] * m.process_dict['max-grad'][(sit, pro)] *
-            m.dt >= m.tau_pro[t, sit, pro])
+            m.duration[t] >= m.tau_pro[t, sit, pro])
 
 
 def res_throughput_by_capacity_min_rule(m, tm, sit, pro):
     return (m.tau_pro[tm, sit, pro] >=
             m.cap_pro[sit, pro] *
-            m.process_dict['min-fraction'][(sit, pro)] * m.dt)
+            m.process_dict['min-fraction'][(sit, pro)] * m.duration[tm])
 
 
 def def_partial_process_input_rule(m, tm, sit, pro, coin):
+    return (m.e_pro_in[tm, sit, pro, coin] ==
+            partial_process_input(m, tm, sit, pro, coin))
+
+
+def def_partial_process_output_rule(m, tm, sit, pro, coo):
+    return (m.e_pro_out[tm, sit, pro, coo] ==
+            partial_process_output(m, tm, sit, pro, coo))
+
+
+# process input power at partial load, linear in throughput and capacity
+def partial_process_input(m, tm, sit, pro, coin):
     R = m.r_in_dict[(pro, coin)]  # input ratio at maximum operation point
     r = m.r_in_min_fraction[pro, coin]  # input ratio at lowest
     # operation point
@@ -816,26 +1025,41 @@ def def_partial_process_input_rule(m, tm, sit, pro, coin):
     online_factor = min_fraction * (r - R) / (1 - min_fraction)
     throughput_factor = (R - min_fraction * r) / (1 - min_fraction)
 
-    return (m.e_pro_in[tm, sit, pro, coin] ==
-            m.dt * m.cap_pro[sit, pro] * online_factor +
+    return (m.duration[tm] * m.cap_pro[sit, pro] * online_factor +
             m.tau_pro[tm, sit, pro] * throughput_factor)
 
 
-def def_partial_process_output_rule(m, tm, sit, pro, coo):
-    R = m.r_out.loc[pro, coo]  # input ratio at maximum operation point
+# process output power at partial load, linear in throughput and capacity
+def partial_process_output(m, tm, sit, pro, coo):
+    R = m.r_out_dict[(pro, coo)]  # input ratio at maximum operation point
     r = m.r_out_min_fraction[pro, coo]  # input ratio at lowest operation point
     min_fraction = m.process_dict['min-fraction'][(sit, pro)]
 
     online_factor = min_fraction * (r - R) / (1 - min_fraction)
     throughput_factor = (R - min_fraction * r) / (1 - min_fraction)
 
-    return (m.e_pro_out[tm, sit, pro, coo] ==
-            m.dt * m.cap_pro[sit, pro] * online_factor +
+    return (m.duration[tm] * m.cap_pro[sit, pro] * online_factor +
             m.tau_pro[tm, sit, pro] * throughput_factor)
 
 
+# compact formulation: process input power as expression of throughput
+def def_process_input_expression_rule(m, tm, sit, pro, coin):
+    if (sit, pro, coin) in m.pro_partial_input_tuples:
+        return partial_process_input(m, tm, sit, pro, coin)
+    return m.tau_pro[tm, sit, pro] * m.r_in_dict[(pro, coin)]
+
+
+# compact formulation: process output power as expression of throughput
+def def_process_output_expression_rule(m, tm, sit, pro, coo):
+    if (sit, pro, coo) in m.pro_partial_output_tuples:
+        return partial_process_output(m, tm, sit, pro, coo)
+    return m.tau_pro[tm, sit, pro] * m.r_out_dict[(pro, coo)]
+
+
 # lower bound <= process capacity <= upper bound
 def res_process_capacity_rule(m, sit, pro):
+    if m.presolve:
+        return pyomo.Constraint.Skip
     return (m.process_dict['cap-lo'][sit, pro],
             m.cap_pro[sit, pro],
             m.process_dict['cap-up'][sit, pro])
@@ -875,6 +1099,8 @@ def res_sell_buy_symmetry_rule(m, sit_in, pro_in, coin):
 
 # transmission capacity == new capacity + existing capacity
 def def_transmission_capacity_rule(m, sin, sout, tra, com):
+    if m.presolve and m.cap_tra_new[sin, sout, tra, com].fixed:
+        return pyomo.Constraint.Skip
     return (m.cap_tra[sin, sout, tra, com] ==
             m.cap_tra_new[sin, sout, tra, com] +
             m.transmission_dict['inst-cap'][(sin, sout, tra, com)])
@@ -887,14 +1113,27 @@ def def_transmission_output_rule(m, tm, sin, sout, tra, com):
             m.transmission_dict['eff'][(sin, sout, tra, com)])
 
 
+# compact formulation: transmission output as expression of input
+def def_transmission_output_expression_rule(m, tm, sin, sout, tra, com):
+    return (m.e_tra_in[tm, sin, sout, tra, com] *
+            m.transmission_dict['eff'][(sin, sout, tra, com)])
+
+
+# compact formulation: capacity of both directions is the same variable
+def def_transmission_capacity_expression_rule(m, sin, sout, tra, com):
+    return m.cap_tra_bi[m.tra_bi_dict[(sin, sout, tra, com)]]
+
+
 # transmission input <= transmission capacity
 def res_transmission_input_by_capacity_rule(m, tm, sin, sout, tra, com):
     return (m.e_tra_in[tm, sin, sout, tra, com] <=
-            m.dt * m.cap_tra[sin, sout, tra, com])
+            m.duration[tm] * m.cap_tra[sin, sout, tra, com])
 
 
 # lower bound <= transmission capacity <= upper bound
 def res_transmission_capacity_rule(m, sin, sout, tra, com):
+    if m.presolve:
+        return pyomo.Constraint.Skip
     return (m.transmission_dict['cap-lo'][(sin, sout, tra, com)],
             m.cap_tra[sin, sout, tra, com],
             m.transmission_dict['cap-up'][(sin, sout, tra, com)])
@@ -912,8 +1151,9 @@ def res_transmission_symmetry_rule(m, sin, sout, tra, com):
 # - retrieved energy / output efficiency
 def def_storage_state_rule(m, t, sit, sto, com):
     return (m.e_sto_con[t, sit, sto, com] ==
-            m.e_sto_con[t-1, sit, sto, com] *
-            (1 - m.storage_dict['discharge'][(sit, sto, com)]) ** m.dt.value +
+            m.e_sto_con[m.predecessor[t], sit, sto, com] *
+            (1 - m.storage_dict['discharge'][(sit, sto, com)]) **
+            m.duration[t] +
             m.e_sto_in[t, sit, sto, com] *
             m.storage_dict['eff-in'][(sit, sto, com)] -
             m.e_sto_out[t, sit, sto, com] /
@@ -922,6 +1162,8 @@ def def_storage_state_rule(m, t, sit, sto, com):
 
 # storage power == new storage power + existing storage power
 def def_storage_power_rule(m, sit, sto, com):
+    if m.presolve and m.cap_sto_p[sit, sto, com].fixed:
+        return pyomo.Constraint.Skip
     return (m.cap_sto_p[sit, sto, com] ==
             m.cap_sto_p_new[sit, sto, com] +
             m.storage_dict['inst-cap-p'][(sit, sto, com)])
@@ -929,6 +1171,8 @@ def def_storage_power_rule(m, sit, sto, com):
 
 # storage capacity == new storage capacity + existing storage capacity
 def def_storage_capacity_rule(m, sit, sto, com):
+    if m.presolve and m.cap_sto_c[sit, sto, com].fixed:
+        return pyomo.Constraint.Skip
     return (m.cap_sto_c[sit, sto, com] ==
             m.cap_sto_c_new[sit, sto, com] +
             m.storage_dict['inst-cap-c'][(sit, sto, com)])
@@ -936,12 +1180,14 @@ def def_storage_capacity_rule(m, sit, sto, com):
 
 # storage input <= storage power
 def res_storage_input_by_power_rule(m, t, sit, sto, com):
-    return m.e_sto_in[t, sit, sto, com] <= m.dt * m.cap_sto_p[sit, sto, com]
+    return (m.e_sto_in[t, sit, sto, com] <=
+            m.duration[t] * m.cap_sto_p[sit, sto, com])
 
 
 # storage output <= storage power
 def res_storage_output_by_power_rule(m, t, sit, sto, co):
-    return m.e_sto_out[t, sit, sto, co] <= m.dt * m.cap_sto_p[sit, sto, co]
+    return (m.e_sto_out[t, sit, sto, co] <=
+            m.duration[t] * m.cap_sto_p[sit, sto, co])
 
 
 # storage content <= storage capacity
@@ -951,6 +1197,8 @@ def res_storage_state_by_capacity_rule(m, t, sit, sto, com):
 
 # lower bound <= storage power <= upper bound
 def res_storage_power_rule(m, sit, sto, com):
+    if m.presolve:
+        return pyomo.Constraint.Skip
     return (m.storage_dict['cap-lo-p'][(sit, sto, com)],
             m.cap_sto_p[sit, sto, com],
             m.storage_dict['cap-up-p'][(sit, sto, com)])
@@ -958,6 +1206,8 @@ def res_storage_power_rule(m, sit, sto, com):
 
 # lower bound <= storage capacity <= upper bound
 def res_storage_capacity_rule(m, sit, sto, com):
+    if m.presolve:
+        return pyomo.Constraint.Skip
     return (m.storage_dict['cap-lo-c'][(sit, sto, com)],
             m.cap_sto_c[sit, sto, com],
             m.storage_dict['cap-up-c'][(sit, sto, com)])
@@ -966,12 +1216,13 @@ def res_storage_capacity_rule(m, sit, sto, com):
 # initialization of storage content in first timestep t[1]
 # forced minimun  storage content in final timestep t[len(m.t)]
 # content[t=1] == storage capacity * fraction <= content[t=final]
+# (no final condition for cyclic representative periods)
 def res_initial_and_final_storage_state_rule(m, t, sit, sto, com):
     if t == m.t[1]:  # first timestep (Pyomo uses 1-based indexing)
         return (m.e_sto_con[t, sit, sto, com] ==
                 m.cap_sto_c[sit, sto, com] *
                 m.storage_dict['init'][(sit, sto, com)])
-    elif t == m.t[len(m.t)]:  # last timestep
+    elif t == m.t[len(m.t)] and not m.periodic:  # last timestep
         return (m.e_sto_con[t, sit, sto, com] >=
                 m.cap_sto_c[sit, sto, com] *
                 m.storage_dict['init'][(sit, sto, com)])
@@ -980,20 +1231,23 @@ def res_initial_and_final_storage_state_rule(m, t, sit, sto, com):
 
 
 # total CO2 output <= Global CO2 limit
+# (always built with a mutable limit, deactivated while the limit is inactive)
 def res_global_co2_limit_rule(m):
-    if math.isinf(m.global_prop.loc['CO2 limit', 'value']):
-        return pyomo.Constraint.Skip
-    elif m.global_prop.loc['CO2 limit', 'value'] >= 0:
+    if m.mutable:
+        limit = m.co2_limit
+    else:
+        limit = m.global_prop.loc['CO2 limit', 'value']
+    if m.mutable or co2_limit_active(limit):
+        co2 = label_code(m, 'com', 'CO2')
         co2_output_sum = 0
         for tm in m.tm:
             for sit in m.sit:
                 # minus because negative commodity_balance represents creation
                 # of that commodity.
-                co2_output_sum += (- commodity_balance(m, tm, sit, 'CO2'))
-
-        # scaling to annual output (cf. definition of m.weight)
-        co2_output_sum *= m.weight
-        return (co2_output_sum <= m.global_prop.loc['CO2 limit', 'value'])
+                # scaling to annual output (cf. definition of m.weight_t)
+                co2_output_sum += (- commodity_balance(m, tm, sit, co2) *
+                                   m.weight_t[tm])
+        return (co2_output_sum <= limit)
     else:
         return pyomo.Constraint.Skip
 
@@ -1017,8 +1271,23 @@ def def_costs_rule(m, cost_type):
       - Fuel costs for stock commodity purchase.
 
     """
+    return m.costs[cost_type] == costs_expression(m, cost_type, m.tm)
+
+
+def costs_expression(m, cost_type, timesteps):
+    """Expression of the total costs of one cost type.
+
+    Args:
+        m: model instance
+        cost_type: a cost type, e.g. 'Variable'
+        timesteps: modelled timesteps over which time-dependent cost types
+            are summed, usually m.tm
+
+    Returns:
+        a pyomo expression
+    """
     if cost_type == 'Invest':
-        return m.costs[cost_type] == \
+        return \
             sum(m.cap_pro_new[p] *
                 m.process_dict['inv-cost'][p] *
                 m.process_dict['annuity-factor'][p]
@@ -1036,7 +1305,7 @@ def def_costs_rule(m, cost_type):
                 for s in m.sto_tuples)
 
     elif cost_type == 'Fixed':
-        return m.costs[cost_type] == \
+        return \
             sum(m.cap_pro[p] * m.process_dict['fix-cost'][p]
                 for p in m.pro_tuples) + \
             sum(m.cap_tra[t] * m.transmission_dict['fix-cost'][t]
@@ -1046,74 +1315,56 @@ def def_costs_rule(m, cost_type):
                 for s in m.sto_tuples)
 
     elif cost_type == 'Variable':
-        return m.costs[cost_type] == \
-            sum(m.tau_pro[(tm,) + p] * m.weight *
+        return \
+            sum(m.tau_pro[(tm,) + p] * m.weight_t[tm] *
                 m.process_dict['var-cost'][p]
-                for tm in m.tm
+                for tm in timesteps
                 for p in m.pro_tuples) + \
-            sum(m.e_tra_in[(tm,) + t] * m.weight *
+            sum(m.e_tra_in[(tm,) + t] * m.weight_t[tm] *
                 m.transmission_dict['var-cost'][t]
-                for tm in m.tm
+                for tm in timesteps
                 for t in m.tra_tuples) + \
-            sum(m.e_sto_con[(tm,) + s] * m.weight *
+            sum(m.e_sto_con[(tm,) + s] * m.weight_t[tm] *
                 m.storage_dict['var-cost-c'][s] +
-                m.weight *
+                m.weight_t[tm] *
                 (m.e_sto_in[(tm,) + s] + m.e_sto_out[(tm,) + s]) *
                 m.storage_dict['var-cost-p'][s]
-                for tm in m.tm
+                for tm in timesteps
                 for s in m.sto_tuples)
 
     elif cost_type == 'Fuel':
-        return m.costs[cost_type] == sum(
-            m.e_co_stock[(tm,) + c] * m.weight *
+        return sum(
+            m.e_co_stock[(tm,) + c] * m.weight_t[tm] *
             m.commodity_dict['price'][c]
-            for tm in m.tm for c in m.com_tuples
-            if c[1] in m.com_stock)
+            for tm in timesteps for c in m.com_stock_tuples)
 
     elif cost_type == 'Revenue':
-        sell_tuples = commodity_subset(m.com_tuples, m.com_sell)
+        sell_tuples = m.com_sell_tuples
 
-        try:
-            return m.costs[cost_type] == -sum(
-                m.e_co_sell[(tm,) + c] * m.weight *
-                m.buy_sell_price_dict[c[1], ][tm] *
-                m.commodity_dict['price'][c]
-                for tm in m.tm
-                for c in sell_tuples)
-        except KeyError:
-            return m.costs[cost_type] == -sum(
-                m.e_co_sell[(tm,) + c] * m.weight *
-                m.buy_sell_price_dict[c[1]][tm] *
-                m.commodity_dict['price'][c]
-                for tm in m.tm
-                for c in sell_tuples)
+        return -sum(
+            m.e_co_sell[(tm,) + c] * m.weight_t[tm] *
+            m.buy_sell_price_ts[c[1], tm] *
+            m.commodity_dict['price'][c]
+            for tm in timesteps
+            for c in sell_tuples)
 
     elif cost_type == 'Purchase':
-        buy_tuples = commodity_subset(m.com_tuples, m.com_buy)
+        buy_tuples = m.com_buy_tuples
 
-        try:
-            return m.costs[cost_type] == sum(
-                m.e_co_buy[(tm,) + c] * m.weight *
-                m.buy_sell_price_dict[c[1], ][tm] *
-                m.commodity_dict['price'][c]
-                for tm in m.tm
-                for c in buy_tuples)
-        except KeyError:
-            return m.costs[cost_type] == sum(
-                m.e_co_buy[(tm,) + c] * m.weight *
-                m.buy_sell_price_dict[c[1]][tm] *
-                m.commodity_dict['price'][c]
-                for tm in m.tm
-                for c in buy_tuples)
+        return sum(
+            m.e_co_buy[(tm,) + c] * m.weight_t[tm] *
+            m.buy_sell_price_ts[c[1], tm] *
+            m.commodity_dict['price'][c]
+            for tm in timesteps
+            for c in buy_tuples)
 
     elif cost_type == 'Environmental':
-        return m.costs[cost_type] == sum(
+        return sum(
             - commodity_balance(m, tm, sit, com) *
-            m.weight *
+            m.weight_t[tm] *
             m.commodity_dict['price'][(sit, com, com_type)]
-            for tm in m.tm
-            for sit, com, com_type in m.com_tuples
-            if com in m.com_env)
+            for tm in timesteps
+            for sit, com, com_type in m.com_env_tuples)
 
     else:
         raise NotImplementedError("Unknown cost type.")
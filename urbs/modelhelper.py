@@ -1,4 +1,6 @@
+import numpy as np
 import pandas as pd
+from .util import is_string
 
 
 def annuity_factor(n, i):
@@ -32,6 +34,9 @@ def commodity_balance(m, tm, sit, com):
     as helper function in create_model for constraints on demand and stock
     commodities.
 
+    If the model was created with shared_balance=True, the shared expression
+    m.e_co_balance is returned instead of building a new one.
+
     Args:
         m: the model object
         tm: the timestep
@@ -42,116 +47,344 @@ def commodity_balance(m, tm, sit, com):
         balance: net value of consumed (positive) or provided (negative) power
 
     """
-    balance = (sum(m.e_pro_in[(tm, site, process, com)]
+    if m.shared_balance and (sit, com) in m.balance_tuples:
+        return m.e_co_balance[tm, sit, com]
+    return commodity_balance_terms(m, tm, sit, com)
+
+
+def commodity_balance_terms(m, tm, sit, com):
+    """Build commodity balance expression at given timestep.
+
+    Only the terms listed for (sit, com) in the incidence index
+    m.balance_index (cf. commodity_incidence) are visited.
+
+    Args:
+        m: the model object
+        tm: the timestep
+        site: the site
+        com: the commodity
+
+    Returns
+        balance: net value of consumed (positive) or provided (negative) power
+
+    """
+    try:
+        incidence = m.balance_index[(sit, com)]
+    except KeyError:
+        # no process, transmission or storage touches (sit, com)
+        return 0
+
+    balance = (sum(m.e_pro_in[(tm,) + p]
                    # usage as input for process increases balance
-                   for site, process in m.pro_tuples
-                   if site == sit and (process, com) in m.r_in_dict)
-               - sum(m.e_pro_out[(tm, site, process, com)]
+                   for p in incidence['pro_in'])
+               - sum(m.e_pro_out[(tm,) + p]
                      # output from processes decreases balance
-                     for site, process in m.pro_tuples
-                     if site == sit and (process, com) in m.r_out_dict)
-               + sum(m.e_tra_in[(tm, site_in, site_out, transmission, com)]
+                     for p in incidence['pro_out'])
+               + sum(m.e_tra_in[(tm,) + t]
                      # exports increase balance
-                     for site_in, site_out, transmission, commodity
-                     in m.tra_tuples
-                     if site_in == sit and commodity == com)
-               - sum(m.e_tra_out[(tm, site_in, site_out, transmission, com)]
+                     for t in incidence['tra_in'])
+               - sum(m.e_tra_out[(tm,) + t]
                      # imports decrease balance
-                     for site_in, site_out, transmission, commodity
-                     in m.tra_tuples
-                     if site_out == sit and commodity == com)
-               + sum(m.e_sto_in[(tm, site, storage, com)] -
-                     m.e_sto_out[(tm, site, storage, com)]
+                     for t in incidence['tra_out'])
+               + sum(m.e_sto_in[(tm,) + s] - m.e_sto_out[(tm,) + s]
                      # usage as input for storage increases consumption
                      # output from storage decreases consumption
-                     for site, storage, commodity in m.sto_tuples
-                     if site == sit and commodity == com))
+                     for s in incidence['sto']))
     return balance
 
 
-def dsm_down_time_tuples(time, sit_com_tuple, m):
-    """ Dictionary for the two time instances of DSM_down
+def commodity_incidence(process, r_in, r_out, transmission, storage):
+    """Index of all model entities adjacent to a (site, commodity) tuple.
 
+    Scans the process, transmission and storage tables once and collects,
+    for every (site, commodity) tuple, the index tuples of those entities
+    that consume or provide that commodity at that site. This allows
+    commodity_balance to only visit the terms that actually exist instead of
+    filtering all process, transmission and storage tuples for each call.
 
     Args:
-        time: list with time indices
-        sit_com_tuple: a list of (site, commodity) tuples
-        m: model instance
+        process: process DataFrame, indexed by (site, process)
+        r_in: process input ratio Series, indexed by (process, commodity)
+        r_out: process output ratio Series, indexed by (process, commodity)
+        transmission: transmission DataFrame, indexed by
+            (site in, site out, transmission, commodity)
+        storage: storage DataFrame, indexed by (site, storage, commodity)
 
     Returns:
-        A list of possible time tuples depending on site and commodity
+        a dict of (site, commodity) tuples to dicts with the keys 'pro_in',
+        'pro_out' (lists of (site, process, commodity) tuples), 'tra_in'
+        (exports), 'tra_out' (imports; both lists of (site in, site out,
+        transmission, commodity) tuples) and 'sto' (list of (site, storage,
+        commodity) tuples)
+
     """
-    if m.dsm.empty:
-        return []
+    incidence = {}
 
-    delay = m.dsm['delay']
-    ub = max(time)
-    lb = min(time)
-    time_list = []
+    def entry(sit, com):
+        if (sit, com) not in incidence:
+            incidence[(sit, com)] = {'pro_in': [], 'pro_out': [],
+                                     'tra_in': [], 'tra_out': [], 'sto': []}
+        return incidence[(sit, com)]
 
-    for (site, commodity) in sit_com_tuple:
-        for step1 in time:
-            for step2 in range(step1
-                               - max(int(delay[site, commodity]
-                                     / m.dt.value), 1),
-                               step1
-                               + max(int(delay[site, commodity]
-                                     / m.dt.value), 1) + 1):
-                if lb <= step2 <= ub:
-                    time_list.append((step1, step2, site, commodity))
+    # group process commodities by process, so that each (site, process)
+    # tuple only visits its own input and output commodities
+    com_in = {}
+    for pro, com in r_in.index:
+        com_in.setdefault(pro, []).append(com)
+    com_out = {}
+    for pro, com in r_out.index:
+        com_out.setdefault(pro, []).append(com)
 
-    return time_list
+    for sit, pro in process.index:
+        for com in com_in.get(pro, []):
+            entry(sit, com)['pro_in'].append((sit, pro, com))
+        for com in com_out.get(pro, []):
+            entry(sit, com)['pro_out'].append((sit, pro, com))
+
+    for sin, sout, tra, com in transmission.index:
+        entry(sin, com)['tra_in'].append((sin, sout, tra, com))
+        entry(sout, com)['tra_out'].append((sin, sout, tra, com))
+
+    for sit, sto, com in storage.index:
+        entry(sit, com)['sto'].append((sit, sto, com))
 
+    return incidence
 
-def dsm_time_tuples(timestep, time, delay):
-    """ Tuples for the two time instances of DSM_down
+
+def timestep_periods(m):
+    """ Predecessor and period bounds of each modelled timestep
+
+    Without period information, all modelled timesteps form one period,
+    whose first timestep is preceded by the initial timestep. With a column
+    'period' in the timestep properties (cf. aggregate_timeseries), each
+    period is cyclic: its first timestep is preceded by its last one.
 
     Args:
-        timestep: current timestep
-        time: list with time indices
-        delay: allowed dsm delay in particular site and commodity
+        m: model instance, requires attributes timesteps and timestep_prop
 
     Returns:
-        A list of possible time tuples of a current time step in a specific
-        site and commodity
+        (predecessor, period_bounds) tuple of dicts, mapping each modelled
+        timestep to its preceding timestep and to the (first, last)
+        timesteps of its period, respectively
     """
+    time = m.timesteps[1:]
+    predecessor = dict(zip(time, m.timesteps[:-1]))
+    if 'period' not in m.timestep_prop.columns:
+        bounds = (time[0], time[-1]) if time else None
+        return predecessor, dict.fromkeys(time, bounds)
 
-    ub = max(time)
-    lb = min(time)
+    period_bounds = {}
+    period = m.timestep_prop['period'].loc[time]
+    for _, steps in period.groupby(period, sort=False):
+        steps = steps.index.tolist()
+        predecessor[steps[0]] = steps[-1]
+        period_bounds.update(dict.fromkeys(steps, (steps[0], steps[-1])))
+    return predecessor, period_bounds
 
-    time_list = list()
 
-    for step in range(timestep - delay, timestep + delay + 1):
-        if step >= lb and step <= ub:
-            time_list.append(step)
+def timestep_durations(m):
+    """ Duration (in hours) of each modelled timestep
 
-    return time_list
+    Args:
+        m: model instance, requires attributes timesteps, timestep_prop
+           and dt
 
+    Returns:
+        a dict of modelled timestep -> duration; the column 'duration' of the
+        timestep properties (cf. segment_timeseries) if given, else dt
+    """
+    time = m.timesteps[1:]
+    if 'duration' not in m.timestep_prop.columns:
+        return dict.fromkeys(time, m.dt.value)
+    return m.timestep_prop['duration'].loc[time].astype(float).to_dict()
 
-def dsm_recovery(timestep, time, recov):
-    """ Time frame for the allowed time indices in case of recovery
+
+def predecessor_duration(m, t):
+    """ Duration (in hours) of the timestep preceding a modelled timestep
 
     Args:
-        timestep: current timestep
-        time: list with time indices
-        recov: allowed dsm recovery in particular site and commodity
+        m: model instance, requires attributes predecessor, duration_dict,
+           timestep_prop and dt
+        t: a modelled timestep
 
     Returns:
-        A list of possible time indices which are within the modelled time
-        area
+        the duration of m.predecessor[t]; for the (not modelled) initial
+        timestep, its entry in column 'duration' of the timestep properties
+        if given, else dt
     """
+    previous = m.predecessor[t]
+    if previous in m.duration_dict:
+        return m.duration_dict[previous]
+    if 'duration' in m.timestep_prop.columns:
+        return float(m.timestep_prop['duration'].loc[previous])
+    return m.dt.value
+
 
-    ub = max(time)
+def timestep_weights(m):
+    """ Weight of each modelled timestep for an annual result
 
-    time_list = list()
+    Without a column 'weight' in the timestep properties, all timesteps are
+    weighted with m.weight. Otherwise, weights are proportional to it (e.g.
+    the number of original periods a representative period stands for) and
+    scaled such that the weighted modelled timesteps cover as many hours as
+    with m.weight (c.f. annual_weights).
 
-    for step in range(timestep, timestep+recov):
-        if step <= ub:
-            time_list.append(step)
+    Args:
+        m: model instance, requires attributes timesteps, timestep_prop,
+           weight and dt
+
+    Returns:
+        a dict of modelled timestep -> weight
+    """
+    time = m.timesteps[1:]
+    if 'weight' not in m.timestep_prop.columns:
+        return dict.fromkeys(time, m.weight.value)
+    return annual_weights(m.timestep_prop, m.timesteps, m.dt.value)
+
+
+def annual_weight(timestep_prop, timesteps, dt=1):
+    """ Uniform weight of the timesteps of a horizon for an annual result
+
+    The length of a year (8760 hours) divided by the total duration of all
+    timesteps, including the initial timestep, i.e. 8760 / (len(timesteps)
+    * dt) unless durations are given by column 'duration'.
+
+    Args:
+        timestep_prop: timestep properties (input table 'timestep'), may be
+           empty
+        timesteps: list of timesteps, the first being the initial timestep
+        dt: timestep duration in hours, unless given by column 'duration'
+
+    Returns:
+        the weight (float)
+    """
+    if 'duration' in timestep_prop.columns:
+        duration = timestep_prop['duration'].loc[list(timesteps)].sum()
+    else:
+        duration = len(timesteps) * dt
+    return 8760.0 / float(duration)
+
+
+def annual_weights(timestep_prop, timesteps, dt=1):
+    """ Weight of each modelled timestep of a horizon for an annual result
+
+    Same as timestep_weights for a model of the given timesteps, computed
+    from the input data, e.g. for results stitched from several models.
+
+    Args:
+        timestep_prop: timestep properties (input table 'timestep'), may be
+           empty
+        timesteps: list of timesteps, the first being the initial timestep
+        dt: timestep duration in hours, unless given by column 'duration'
+
+    Returns:
+        a dict of modelled timestep -> weight
+    """
+    time = list(timesteps)[1:]
+    weight = annual_weight(timestep_prop, timesteps, dt)
+    if 'weight' not in timestep_prop.columns:
+        return dict.fromkeys(time, weight)
+    relative = timestep_prop['weight'].loc[time].astype(float)
+    if 'duration' in timestep_prop.columns:
+        duration = timestep_prop['duration'].loc[time].astype(float)
+    else:
+        duration = pd.Series(float(dt), index=time)
+    # weighted durations add up to weight * (duration of modelled timesteps)
+    scale = weight * duration.sum() / (relative * duration).sum()
+    return (relative * scale).to_dict()
+
+
+def dsm_down_time_tuples(time, sit_com_tuple, m):
+    """ Dictionary for the two time instances of DSM_down
+
+
+    Args:
+        time: list with time indices
+        sit_com_tuple: a list of (site, commodity) tuples
+        m: model instance
+
+    Returns:
+        A list of possible time tuples depending on site and commodity
+    """
+    if m.dsm.empty:
+        return []
+
+    time_list = []
+
+    for (site, commodity) in sit_com_tuple:
+        window = m.dsm_delay_window[(site, commodity)]
+        for step1 in time:
+            time_list.extend((step1, step2, site, commodity)
+                             for step2 in window[step1])
 
     return time_list
 
 
+def dsm_windows(m):
+    """ Lookup tables for DSM delay and recovery windows
+
+    For each DSM (site, commodity) tuple, the windows of all modelled
+    timesteps are derived at once from the allowed delay and recovery
+    durations, so that DSM rules only need a dictionary lookup instead of
+    generating the window anew for each (timestep, site, commodity).
+
+    The delay window is symmetric: timestep tt lies in the window of t
+    exactly if t lies in the window of tt. The same table therefore serves
+    for the forward lookup (downshift timesteps tt for upshift timestep t)
+    and the backward lookup (upshift timesteps t for downshift timestep tt).
+
+    Args:
+        m: model instance, requires attributes timesteps, duration_dict,
+           dsm_dict and period_bounds; windows are clipped to the period of
+           each timestep
+
+    Returns:
+        (delay_window, recovery_window) tuple of dicts, each mapping a
+        (site, commodity) tuple to a dict of modelled timestep -> range of
+        timesteps
+    """
+    delay_window = {}
+    recovery_window = {}
+    if m.dsm.empty:
+        return delay_window, recovery_window
+
+    time = np.array(m.timesteps[1:])
+    steps = time.tolist()
+    position = np.arange(len(steps))
+    lb = np.searchsorted(time, [m.period_bounds[t][0] for t in steps])
+    ub = np.searchsorted(time, [m.period_bounds[t][1] for t in steps])
+
+    # start and end of each timestep (in hours), so that windows given in
+    # hours also work for timesteps of different duration
+    duration = np.array([m.duration_dict[t] for t in steps], dtype=float)
+    end = np.cumsum(duration)
+    start = end - duration
+    eps = 1e-9
+
+    for (site, commodity) in m.dsm.index:
+        delay = m.dsm_dict['delay'][(site, commodity)]
+        recov = m.dsm_dict['recov'][(site, commodity)]
+
+        # window of timesteps starting within [t - delay, t + delay], at
+        # least the neighbouring timesteps, clipped to the period of t
+        first = np.searchsorted(start, start - delay - eps, 'left')
+        stop = np.searchsorted(start, start + delay + eps, 'right')
+        first = np.maximum(np.minimum(first, position - 1), lb)
+        stop = np.minimum(np.maximum(stop, position + 2), ub + 1)
+        delay_window[(site, commodity)] = dict(
+            zip(steps, map(range, time[first].tolist(),
+                           (time[stop - 1] + 1).tolist())))
+
+        # window of timesteps ending within [t, t + recov), at least t,
+        # clipped to the period of t
+        stop = np.searchsorted(end, start + recov + eps, 'right')
+        stop = np.minimum(np.maximum(stop, position + 1), ub + 1)
+        recovery_window[(site, commodity)] = dict(
+            zip(steps, map(range, steps, (time[stop - 1] + 1).tolist())))
+
+    return delay_window, recovery_window
+
+
 def commodity_subset(com_tuples, type_name):
     """ Unique list of commodity names for given type.
 
@@ -162,8 +395,9 @@ def commodity_subset(com_tuples, type_name):
     Returns:
         The set (unique elements/list) of commodity names of the desired type
     """
-    if type(type_name) is str:
-        # type_name: ('Stock', 'SupIm', 'Env' or 'Demand')
+    if is_string(type_name) or not hasattr(type_name, '__contains__'):
+        # type_name: ('Stock', 'SupIm', 'Env' or 'Demand'), or its code in
+        # an encoded model
         return set(com for sit, com, com_type in com_tuples
                    if com_type == type_name)
     else:
@@ -205,3 +439,85 @@ def search_sell_buy_tuple(instance, sit_in, pro_in, coin):
         if not(sell_in.isdisjoint(buy_out)):
             return sell_pro
     return None
+
+
+def bidirectional_tuples(tra_tuples):
+    """ Map transmission tuples to one representative per direction pair.
+
+    Args:
+        tra_tuples: a list of (site in, site out, transmission, commodity)
+
+    Returns:
+        a dict of transmission tuple -> the tuple of the pair (in either
+        direction) that is smaller; tuples without opposite direction map
+        to themselves
+    """
+    tra_tuples = set(tra_tuples)
+    bi_dict = {}
+    for (sin, sout, tra, com) in tra_tuples:
+        reverse = (sout, sin, tra, com)
+        if reverse in tra_tuples:
+            bi_dict[(sin, sout, tra, com)] = min((sin, sout, tra, com),
+                                                 reverse)
+        else:
+            bi_dict[(sin, sout, tra, com)] = (sin, sout, tra, com)
+    return bi_dict
+
+
+def presolve_bounds(m):
+    """ Turn single-variable constraints into variable bounds.
+
+    Capacity ranges (cap-lo, cap-up) become bounds of the total capacity
+    variables; if cap-lo == cap-up, total and new capacity are fixed, so that
+    their definition constraint becomes redundant. Flows and storage
+    contents are bounded by the maximal capacity times timestep duration.
+    Constraint rules skip the corresponding rows if m.presolve is set.
+
+    Args:
+        m: a Pyomo ConcreteModel instance, after variable declaration
+
+    Returns:
+        None
+    """
+    def bound(value):
+        # infinite values mean 'no bound' for Pyomo
+        return None if np.isinf(value) else value
+
+    def capacity_bounds(cap, cap_new, props, suffix, flows):
+        for idx in cap:
+            lo = props['cap-lo' + suffix][idx]
+            up = props['cap-up' + suffix][idx]
+            inst_cap = props['inst-cap' + suffix][idx]
+            if lo == up and up >= inst_cap:
+                cap[idx].fix(up)
+                cap_new[idx].fix(up - inst_cap)
+            else:
+                cap[idx].setlb(max(lo, 0))
+                cap[idx].setub(bound(up))
+            for var in flows:
+                for t in m.tm:
+                    var[(t,) + idx].setub(bound(m.duration_dict[t] * up))
+
+    capacity_bounds(m.cap_pro, m.cap_pro_new, m.process_dict, '',
+                    [m.tau_pro])
+    if m.compact:
+        # the shared capacity of both directions is bounded by the
+        # intersection of their capacity ranges; it is not fixed
+        for idx in m.tra_tuples:
+            cap_bi = m.cap_tra_bi[m.tra_bi_dict[idx]]
+            lo = m.transmission_dict['cap-lo'][idx]
+            up = m.transmission_dict['cap-up'][idx]
+            cap_bi.setlb(max(lo, cap_bi.lb or 0))
+            if not np.isinf(up) and (cap_bi.ub is None or up < cap_bi.ub):
+                cap_bi.setub(up)
+            for t in m.tm:
+                m.e_tra_in[(t,) + idx].setub(bound(m.duration_dict[t] * up))
+    else:
+        capacity_bounds(m.cap_tra, m.cap_tra_new, m.transmission_dict, '',
+                        [m.e_tra_in])
+    capacity_bounds(m.cap_sto_p, m.cap_sto_p_new, m.storage_dict, '-p',
+                    [m.e_sto_in, m.e_sto_out])
+    capacity_bounds(m.cap_sto_c, m.cap_sto_c_new, m.storage_dict, '-c', [])
+    for (t, sit, sto, com) in m.e_sto_con:
+        m.e_sto_con[t, sit, sto, com].setub(
+            bound(m.storage_dict['cap-up-c'][(sit, sto, com)]))
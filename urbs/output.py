@@ -79,7 +79,7 @@ def get_timeseries(instance, com, sites, timesteps=None):
     """
     if timesteps is None:
         # default to all simulated timesteps
-        timesteps = sorted(get_entity(instance, 'tm').index)
+        timesteps = sorted(get_entity(instance, 'tm', copy=False).index)
     else:
         timesteps = sorted(timesteps)  # implicit: convert range to list
 
@@ -90,18 +90,27 @@ def get_timeseries(instance, com, sites, timesteps=None):
     # DEMAND
     # default to zeros if commodity has no demand, get timeseries
     try:
-        # select relevant timesteps (=rows)
-        # select commodity (xs), then the sites from remaining simple columns
-        # and sum all together to form a Series
-        demand = (get_input(instance, 'demand').loc[timesteps]
-                                               .xs(com, axis=1, level=1)[sites]
-                                               .sum(axis=1))
+        if hasattr(instance, 'demand_ts'):
+            # model instance: sum the (site, commodity) columns of the
+            # timeseries array over the relevant timesteps
+            demand = instance.demand_ts.series(
+                [(sit, com) for sit in sites], timesteps)
+        else:
+            # select relevant timesteps (=rows)
+            # select commodity (xs), then the sites from remaining simple
+            # columns and sum all together to form a Series
+            demand = (get_input(instance, 'demand')
+                      .loc[timesteps]
+                      .xs(com, axis=1, level=1)[sites]
+                      .sum(axis=1))
     except KeyError:
         demand = pd.Series(0, index=timesteps)
     demand.name = 'Demand'
 
     # STOCK
-    eco = get_entity(instance, 'e_co_stock')
+    # the results are only selected and reshaped into new objects below, so
+    # read-only views of the result cache suffice (c.f. get_entity)
+    eco = get_entity(instance, 'e_co_stock', copy=False)
     eco = eco.xs([com, 'Stock'], level=['com', 'com_type'])
     try:
         stock = eco.unstack()[sites].sum(axis=1)
@@ -110,22 +119,24 @@ def get_timeseries(instance, com, sites, timesteps=None):
     stock.name = 'Stock'
 
     # PROCESS
-    created = get_entity(instance, 'e_pro_out')
-    created = created.xs(com, level='com').loc[timesteps]
+    # e_pro_in/e_pro_out only exist for actual process-commodity pairs, so a
+    # commodity without any producing (consuming) process has no entries
+    created = get_entity(instance, 'e_pro_out', copy=False)
     try:
+        created = created.xs(com, level='com').loc[timesteps]
         created = created.unstack(level='sit')[sites].fillna(0).sum(axis=1)
-        created = created.unstack(level='pro')
+        created = created.unstack(level='pro').fillna(0)
         created = drop_all_zero_columns(created)
-    except KeyError:
+    except (KeyError, ValueError):
         created = pd.DataFrame(index=timesteps)
 
-    consumed = get_entity(instance, 'e_pro_in')
-    consumed = consumed.xs(com, level='com').loc[timesteps]
+    consumed = get_entity(instance, 'e_pro_in', copy=False)
     try:
+        consumed = consumed.xs(com, level='com').loc[timesteps]
         consumed = consumed.unstack(level='sit')[sites].fillna(0).sum(axis=1)
-        consumed = consumed.unstack(level='pro')
+        consumed = consumed.unstack(level='pro').fillna(0)
         consumed = drop_all_zero_columns(consumed)
-    except KeyError:
+    except (KeyError, ValueError):
         consumed = pd.DataFrame(index=timesteps)
 
     # TRANSMISSION
@@ -134,7 +145,7 @@ def get_timeseries(instance, com, sites, timesteps=None):
     # if commodity is transportable
     df_transmission = get_input(instance, 'transmission')
     if com in set(df_transmission.index.get_level_values('Commodity')):
-        imported = get_entity(instance, 'e_tra_out')
+        imported = get_entity(instance, 'e_tra_out', copy=False)
         imported = imported.loc[timesteps].xs(com, level='com')
         imported = imported.unstack(level='tra').sum(axis=1)
         imported = imported.unstack(level='sit_')[sites].fillna(0).sum(axis=1)
@@ -145,7 +156,7 @@ def get_timeseries(instance, com, sites, timesteps=None):
         imported = imported[other_sites_im]  # ...from other_sites
         imported = drop_all_zero_columns(imported)
 
-        exported = get_entity(instance, 'e_tra_in')
+        exported = get_entity(instance, 'e_tra_in', copy=False)
         exported = exported.loc[timesteps].xs(com, level='com')
         exported = exported.unstack(level='tra').sum(axis=1)
         exported = exported.unstack(level='sit')[sites].fillna(0).sum(axis=1)
@@ -179,8 +190,8 @@ def get_timeseries(instance, com, sites, timesteps=None):
                               columns=['Level', 'Stored', 'Retrieved'])
 
     # DEMAND SIDE MANAGEMENT (load shifting)
-    dsmup = get_entity(instance, 'dsm_up')
-    dsmdo = get_entity(instance, 'dsm_down')
+    dsmup = get_entity(instance, 'dsm_up', copy=False)
+    dsmdo = get_entity(instance, 'dsm_down', copy=False)
 
     if dsmup.empty:
         # if no DSM happened, the demand is not modified (delta = 0)
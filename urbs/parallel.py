@@ -0,0 +1,96 @@
+"""Worker processes with a fixed assignment of tasks.
+
+A multiprocessing.Pool hands each task to an arbitrary worker, so workers
+that keep built models between iterations (Benders subproblems, ADMM
+regions) would end up building and holding every model. A PinnedPool always
+sends the k-th task of a map call to the same worker process, so that each
+worker builds and keeps only its own share of the models.
+"""
+import multiprocessing
+
+
+class PinnedPool(object):
+    """Local worker processes, each always running the same task positions.
+
+    Task k of every map call is run by worker k % processes. Workers run on
+    the local machine only.
+
+    Args:
+        processes: number of worker processes
+        initializer: (optional) function called in each worker on start
+        initargs: arguments of initializer
+
+    Example:
+        >>> pool = PinnedPool(4, _init_worker, (data,))
+        >>> try:
+        ...     results = pool.map(_solve_block, tasks)
+        ... finally:
+        ...     pool.close()
+        ...     pool.join()
+    """
+    def __init__(self, processes, initializer=None, initargs=()):
+        self._connections = []
+        self._processes = []
+        for _ in range(processes):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_serve, args=(child, initializer, initargs))
+            process.daemon = True
+            process.start()
+            child.close()
+            self._connections.append(parent)
+            self._processes.append(process)
+
+    def map(self, function, tasks):
+        """Apply function to all tasks, task k in worker k % processes.
+
+        Args:
+            function: a module-level (picklable) function
+            tasks: list of arguments, one per call of function
+
+        Returns:
+            list of results, in order of tasks; an exception raised in a
+            worker is raised again here
+        """
+        n = len(self._connections)
+        tasks = list(tasks)
+        for k, connection in enumerate(self._connections):
+            connection.send((function, tasks[k::n]))
+        results = [None] * len(tasks)
+        error = None
+        for k, connection in enumerate(self._connections):
+            ok, value = connection.recv()
+            if not ok:
+                error = error or value
+                continue
+            results[k::n] = value
+        if error is not None:
+            raise error
+        return results
+
+    def close(self):
+        """Tell all workers to exit after their current tasks. """
+        for connection in self._connections:
+            connection.send(None)
+            connection.close()
+
+    def join(self):
+        """Wait for all workers to exit. """
+        for process in self._processes:
+            process.join()
+
+
+def _serve(connection, initializer, initargs):
+    """Worker loop: run the tasks received until None is received. """
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        function, tasks = message
+        try:
+            connection.send((True, [function(task) for task in tasks]))
+        except Exception as err:
+            connection.send((False, err))
+    connection.close()
@@ -0,0 +1,181 @@
+"""Scenario runs with one solver instance kept alive.
+
+ScenarioSolver builds a model with mutable=True for the first scenario and
+applies the following scenarios with update_model. With a Pyomo persistent
+solver interface (e.g. 'gurobi_persistent', 'cplex_persistent'), the model
+is transferred to the solver once; afterwards only the constraints that
+refer to changed parameter values are replaced, so that the solver keeps
+its problem and can reoptimise from the previous basis. Other solvers are
+called as usual, with the previous solution as warm start where supported.
+Scenarios that change non-mutable data lead to a rebuild.
+"""
+import pyomo.core as pyomo
+from pyomo.opt.base import SolverFactory
+from .model import create_model
+from .scenario import mutable_params, same_value, update_model
+from .util import is_string
+
+try:
+    from pyomo.core.expr import identify_mutable_parameters
+except ImportError:
+    try:
+        from pyomo.core.expr.current import identify_mutable_parameters
+    except ImportError:
+        identify_mutable_parameters = None  # Pyomo < 5.6: reload on update
+
+try:
+    from pyomo.solvers.plugins.solvers.persistent_solver import (
+        PersistentSolver)
+except ImportError:
+    PersistentSolver = None  # Pyomo without persistent solver interfaces
+
+
+class ScenarioSolver(object):
+    """Solve scenarios of one urbs model, reusing model and solver.
+
+    Args:
+        solver: a solver name (e.g. 'gurobi_persistent') or a Pyomo solver
+            instance
+        dt: timestep duration in hours (default: 1)
+        timesteps: optional list of timesteps, default: demand timeseries
+        warmstart: start from the previous solution where supported
+        **model_kwds: keyword arguments forwarded to create_model
+
+    Attributes:
+        solver: the Pyomo solver instance
+        prob: the current urbs model instance (None before the first solve)
+        result: the solver results of the last solve
+        rebuilds: number of times the model was (re)built
+
+    Example:
+        >>> runner = ScenarioSolver('gurobi_persistent', dt=1,
+        ...                         timesteps=range(3500, 3669))
+        >>> for scenario in scenarios:
+        ...     prob = runner.solve(scenario(read_excel('mimo-example.xlsx')))
+        ...     report(prob, '{}.xlsx'.format(scenario.__name__))
+    """
+    def __init__(self, solver, dt=1, timesteps=None, warmstart=True,
+                 **model_kwds):
+        if is_string(solver):
+            solver = SolverFactory(solver)
+        self.solver = solver
+        self.dt = dt
+        self.timesteps = timesteps
+        self.warmstart = warmstart
+        self.model_kwds = dict(model_kwds, mutable=True)
+        self.prob = None
+        self.result = None
+        self.rebuilds = 0
+        self._param_constraints = None
+
+    @property
+    def persistent(self):
+        """True if the solver keeps the model between solves. """
+        # other interfaces with a set_instance method (e.g. appsi) are
+        # called like ordinary solvers
+        return (PersistentSolver is not None and
+                isinstance(self.solver, PersistentSolver))
+
+    def solve(self, data, **kwds):
+        """Solve the model for the given scenario data.
+
+        Args:
+            data: a dict of DataFrames, as returned by read_excel and
+                modified by a scenario function
+            **kwds: keyword arguments forwarded to the solver's solve method
+
+        Returns:
+            the solved urbs model instance (the same object as before unless
+            the model had to be rebuilt)
+        """
+        warm = self.prob is not None
+        if warm:
+            try:
+                self._update(data)
+            except ValueError:
+                # non-mutable data changed
+                warm = False
+        if not warm:
+            self._build(data)
+
+        if warm and self.warmstart and self.solver.warm_start_capable():
+            kwds.setdefault('warmstart', True)
+        if self.persistent:
+            self.result = self.solver.solve(**kwds)
+        else:
+            self.result = self.solver.solve(self.prob, **kwds)
+        return self.prob
+
+    def _build(self, data):
+        """Create the model and transfer it to a persistent solver. """
+        self.prob = create_model(data, self.dt, self.timesteps,
+                                 **self.model_kwds)
+        self.rebuilds += 1
+        if self.persistent:
+            self.solver.set_instance(self.prob)
+            self._param_constraints = parameter_constraints(self.prob)
+
+    def _update(self, data):
+        """Update the model in place and push the changed constraints. """
+        prob = self.prob
+        before = [(p, pyomo.value(p))
+                  for param in mutable_params(prob) for p in param.values()]
+        co2_limit = prob.res_global_co2_limit
+        co2_active = co2_limit.active
+        update_model(prob, data)
+        if not self.persistent:
+            return
+
+        if self._param_constraints is None:
+            # parameter occurrences unknown: transfer the whole model
+            self.solver.set_instance(prob)
+            return
+
+        changed = {}
+        for p, value in before:
+            if not same_value(pyomo.value(p), value):
+                for con in self._param_constraints.get(id(p), []):
+                    changed[id(con)] = con
+        if co2_limit.active != co2_active:
+            changed[id(co2_limit)] = co2_limit
+
+        for con in changed.values():
+            was_active = co2_active if con is co2_limit else con.active
+            if was_active:
+                self.solver.remove_constraint(con)
+            if con.active:
+                self.solver.add_constraint(con)
+
+
+def parameter_constraints(prob):
+    """Map mutable parameter values to the constraints that refer to them.
+
+    Args:
+        prob: a urbs model instance created with mutable=True
+
+    Returns:
+        dict of id(parameter value) -> list of constraint data objects, or
+        None if parameters cannot be identified with this Pyomo version
+    """
+    if identify_mutable_parameters is None:
+        return None
+    ids = set(id(p) for param in mutable_params(prob) for p in param.values())
+    occurrences = {}
+    for con in prob.component_data_objects(pyomo.Constraint):
+        found = set()
+        for expr in (con.lower, con.body, con.upper):
+            for p in _parameters(expr):
+                if id(p) in ids:
+                    found.add(id(p))
+        for param_id in found:
+            occurrences.setdefault(param_id, []).append(con)
+    return occurrences
+
+
+def _parameters(expr):
+    """Mutable parameters in an expression (or the expression itself). """
+    if expr is None:
+        return []
+    if getattr(expr, 'is_expression_type', lambda: False)():
+        return identify_mutable_parameters(expr)
+    return [expr]
@@ -87,7 +87,7 @@ def plot(prob, com, sit, dt, timesteps=None,
 
     if timesteps is None:
         # default to all simulated timesteps
-        timesteps = sorted(get_entity(prob, 'tm').index)
+        timesteps = sorted(get_entity(prob, 'tm', copy=False).index)
 
     # convert timesteps to hour series for the plots
     hoursteps = timesteps * dt[0]
@@ -332,7 +332,7 @@ def result_figures(prob, figure_basename, plot_title_prefix=None,
         **kwds: (optional) keyword arguments are forwarded to urbs.plot()
     """
     # retrieve parameter 'dt' from the model
-    dt = get_entity(prob, 'dt')
+    dt = get_entity(prob, 'dt', copy=False)
 
     # default to all demand (sit, com) tuples if none are specified
     if plot_tuples is None:
@@ -340,7 +340,8 @@ def result_figures(prob, figure_basename, plot_title_prefix=None,
 
     # default to all timesteps if no periods are given
     if periods is None:
-        periods = {'all': sorted(get_entity(prob, 'tm').index)}
+        periods = {'all': sorted(get_entity(prob, 'tm', copy=False)
+                                 .index)}
 
     # default to PNG and PDF plots if no filetypes are specified
     if extensions is None:
@@ -0,0 +1,211 @@
+"""Build profiler for create_model.
+
+Records, for each Set, Param, Var, Expression, Constraint and Objective
+declared on the model, the wall time and peak memory of its construction,
+the number of rule calls and of Skip returns (where they can be counted),
+and the number of generated nonzeros (variable occurrences in constraints,
+objectives and expressions).
+"""
+import json
+import time
+import types
+import pandas as pd
+import pyomo.core as pyomo
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  # Python 2
+
+# pyomo.core.expr.current is deprecated from Pyomo 6 on
+try:
+    from pyomo.core.expr import identify_variables
+except ImportError:
+    try:
+        from pyomo.core.expr.current import identify_variables
+    except ImportError:
+        from pyomo.core.base.expr import identify_variables
+
+# component attributes that may hold a rule function
+RULE_ATTRIBUTES = ['rule', '_init_rule', 'initialize', 'filter']
+
+PROFILE_COLUMNS = ['type', 'size', 'time', 'memory', 'counted', 'calls',
+                   'skips', 'skip-ratio', 'nonzeros']
+
+
+class ProfiledModel(pyomo.ConcreteModel):
+    """ConcreteModel that profiles the construction of its components.
+
+    The profile is stored as a list of dicts in the attribute _profile, one
+    entry per component, in order of declaration. Use get_build_profile to
+    retrieve it as a DataFrame.
+
+    Rule calls and Skip returns are counted for rules given as plain
+    functions, as stored by Pyomo 5.x. Later Pyomo versions wrap rules in
+    Initializer objects, which cannot be counted; such components have
+    counted False and NaN calls, skips and skip-ratio.
+    """
+    def __init__(self, *args, **kwds):
+        super(ProfiledModel, self).__init__(*args, **kwds)
+        self._profile = []
+
+    def add_component(self, name, val):
+        counter = {'calls': 0, 'skips': 0}
+        counted = True
+        skip = getattr(type(val), 'Skip', None)
+        for attr in RULE_ATTRIBUTES:
+            rule = getattr(val, attr, None)
+            if isinstance(rule, types.FunctionType):
+                setattr(val, attr, _counting_rule(rule, counter, skip))
+            elif callable(rule):
+                # e.g. a Pyomo 6 Initializer object
+                counted = False
+
+        memory_before = _traced_memory()
+        start = time.time()
+        super(ProfiledModel, self).add_component(name, val)
+        duration = time.time() - start
+        memory_after = _traced_memory(peak=True)
+
+        # restore the original rules, e.g. for pickling
+        for attr in RULE_ATTRIBUTES:
+            rule = getattr(val, attr, None)
+            if hasattr(rule, 'wrapped_rule'):
+                setattr(val, attr, rule.wrapped_rule)
+
+        try:
+            size = len(val)
+        except TypeError:
+            size = 1
+        if counted:
+            calls, skips = counter['calls'], counter['skips']
+            skip_ratio = float(skips) / calls if calls else 0.0
+        else:
+            calls, skips, skip_ratio = (float('nan'),) * 3
+        self._profile.append({
+            'name': name,
+            'type': val.type().__name__,
+            'size': size,
+            'time': duration,
+            'memory': memory_after - memory_before,
+            'counted': counted,
+            'calls': calls,
+            'skips': skips,
+            'skip-ratio': skip_ratio,
+            'nonzeros': _count_nonzeros(val)})
+
+
+def start_memory_tracing():
+    """Start tracemalloc, unless unavailable or already tracing.
+
+    Returns:
+        True if tracing was started, i.e. must be stopped by the caller
+    """
+    if tracemalloc is None or tracemalloc.is_tracing():
+        return False
+    tracemalloc.start()
+    return True
+
+
+def stop_memory_tracing():
+    """Stop tracemalloc and free its traces. """
+    tracemalloc.stop()
+
+
+def _counting_rule(rule, counter, skip):
+    """Wrap rule function to count its calls and Skip returns. """
+    def counting_rule(*args, **kwds):
+        counter['calls'] += 1
+        result = rule(*args, **kwds)
+        if skip is not None and result is skip:
+            counter['skips'] += 1
+        return result
+    counting_rule.wrapped_rule = rule
+    return counting_rule
+
+
+def _traced_memory(peak=False):
+    """Currently traced (or peak traced) memory in bytes, NaN if unknown.
+
+    Requesting the current value resets the peak, so that a subsequent
+    peak value refers to the time since. The peak can only be reset from
+    Python 3.9 on; before, it may stem from an earlier component, so the
+    memory is reported as unknown.
+    """
+    if (tracemalloc is None or not tracemalloc.is_tracing() or
+            not hasattr(tracemalloc, 'reset_peak')):
+        return float('nan')
+    current, peak_memory = tracemalloc.get_traced_memory()
+    if peak:
+        return peak_memory
+    tracemalloc.reset_peak()
+    return current
+
+
+def _count_nonzeros(component):
+    """Number of variable occurrences in a constraint/objective/expression.
+    """
+    if component.type() not in (pyomo.Constraint, pyomo.Objective,
+                                pyomo.Expression):
+        return 0
+    nonzeros = 0
+    for data in component.values():
+        expr = getattr(data, 'body', None)
+        if expr is None:
+            expr = data.expr
+        if expr is None:
+            continue
+        nonzeros += len(set(id(v) for v in identify_variables(expr)))
+    return nonzeros
+
+
+def get_build_profile(instance):
+    """Return the build profile of a model created with profile=True.
+
+    Args:
+        instance: a model created by create_model(..., profile=True)
+
+    Returns:
+        a DataFrame with one row per component (in order of declaration)
+        and the columns type, size, time (s), memory (bytes of peak memory
+        increase; NaN before Python 3.9), counted (whether rule calls could
+        be counted), calls, skips, skip-ratio (NaN unless counted) and
+        nonzeros
+
+    Example:
+        >>> prob = create_model(data, profile=True)
+        >>> get_build_profile(prob).sort_values('time').tail()
+    """
+    try:
+        profile = instance._profile
+    except AttributeError:
+        raise ValueError("Model was not created with profile=True.")
+    return (pd.DataFrame(profile, columns=['name'] + PROFILE_COLUMNS)
+              .set_index('name'))
+
+
+def write_build_profile(instance, filename):
+    """Write the build profile of a model to a JSON file.
+
+    Args:
+        instance: a model created by create_model(..., profile=True)
+        filename: JSON file to be written
+
+    Returns:
+        nothing
+    """
+    profile = get_build_profile(instance)
+    records = [dict(name=name, **{col: _json_value(row[col])
+                                  for col in PROFILE_COLUMNS})
+               for name, row in profile.iterrows()]
+    with open(filename, 'w') as f:
+        json.dump(records, f, indent=2)
+
+
+def _json_value(value):
+    """Convert numpy scalars (and NaN) for JSON serialization. """
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
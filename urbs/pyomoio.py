@@ -1,13 +1,18 @@
+import numpy as np
 import pandas as pd
 import pyomo.core as pyomo
+from .encoding import decode_frame
 
 
-def get_entity(instance, name):
+def get_entity(instance, name, copy=True):
     """ Retrieve values (or duals) for an entity in a model instance.
 
     Args:
         instance: a Pyomo ConcreteModel instance
-        name: name of a Set, Param, Var, Constraint or Objective
+        name: name of a Set, Param, Var, Expression, Constraint or Objective
+        copy: (optional) if False, return a read-only view of a cached
+            result instead of an independent copy; only for callers that
+            do not modify the result in place
 
     Returns:
         a Pandas Series with domain as index and values (or 1's, for sets) of
@@ -15,19 +20,58 @@ def get_entity(instance, name):
     """
     # magic: short-circuit if problem contains a result cache
     if hasattr(instance, '_result') and name in instance._result:
-        return instance._result[name].copy(deep=True)
+        if copy:
+            return instance._result[name].copy()
+        return result_view(instance._result[name])
+    return extract_entity(instance, name)
 
+
+def result_view(series):
+    """ Read-only view of a cached result Series
+
+    The values are shared with the cache and protected against writes, so
+    in-place modifications of the view raise a ValueError instead of
+    altering the cache; use get_entity with copy=True for a modifiable
+    result. The index is copied shallowly, so that renaming index levels
+    of the view leaves the cache untouched.
+
+    Args:
+        series: a Series of a result cache
+
+    Returns:
+        a new Series object sharing the values of series
+    """
+    values = series.values
+    if isinstance(values, np.ndarray):
+        values.flags.writeable = False
+    view = series.copy(deep=False)
+    view.index = series.index.copy()
+    return view
+
+
+def extract_entity(instance, name):
+    """ Retrieve values (or duals) for an entity from the model components.
+
+    Same as get_entity, but always reads the model, ignoring a result cache.
+
+    Args:
+        instance: a Pyomo ConcreteModel instance
+        name: name of a Set, Param, Var, Expression, Constraint or Objective
+
+    Returns:
+        a Pandas Series, c.f. get_entity
+    """
     # retrieve entity, its type and its onset names
     entity = instance.__getattribute__(name)
     labels = _get_onset_names(entity)
 
-    # extract values
+    # extract index keys and values in one pass; the index and value columns
+    # are built from these flat lists in bulk, instead of concatenating a
+    # (index..., value) tuple per element
     if isinstance(entity, pyomo.Set):
-        if entity.dimen > 1:
-            results = pd.DataFrame([v + (1,) for v in entity.value])
-        else:
-            # Pyomo sets don't have values, only elements
-            results = pd.DataFrame([(v, 1) for v in entity.value])
+        # Pyomo sets don't have values, only elements
+        keys = list(entity.value)
+        values = np.ones(len(keys))
 
         # for unconstrained sets, the column label is identical to their index
         # hence, make index equal to entity name and append underscore to name
@@ -36,46 +80,27 @@ def get_entity(instance, name):
         if not labels:
             labels = [name]
             name = name+'_'
-
-    elif isinstance(entity, pyomo.Param):
-        if entity.dim() > 1:
-            results = pd.DataFrame(
-                [v[0]+(v[1],) for v in entity.iteritems()])
-        elif entity.dim() == 1:
-            results = pd.DataFrame(
-                [(v[0], v[1]) for v in entity.iteritems()])
-        else:
-            results = pd.DataFrame(
-                [(v[0], v[1].value) for v in entity.iteritems()])
-            labels = ['None']
-
-    elif isinstance(entity, pyomo.Constraint):
-        if entity.dim() > 1:
-            results = pd.DataFrame(
-                [v[0] + (instance.dual[v[1]],) for v in entity.iteritems()])
-        elif entity.dim() == 1:
-            results = pd.DataFrame(
-                [(v[0], instance.dual[v[1]]) for v in entity.iteritems()])
-        else:
-            results = pd.DataFrame(
-                [(v[0], instance.dual[v[1]]) for v in entity.iteritems()])
-            labels = ['None']
-
+        dim = entity.dimen
     else:
-        # create DataFrame
-        if entity.dim() > 1:
-            # concatenate index tuples with value if entity has
-            # multidimensional indices v[0]
-            results = pd.DataFrame(
-                [v[0]+(v[1].value,) for v in entity.iteritems()])
-        elif entity.dim() == 1:
-            # otherwise, create tuple from scalar index v[0]
-            results = pd.DataFrame(
-                [(v[0], v[1].value) for v in entity.iteritems()])
+        if isinstance(entity, pyomo.Param):
+            # pyomo.value resolves the values of mutable parameters
+            value = pyomo.value
+        elif isinstance(entity, pyomo.Expression):
+            value = _expression_value
+        elif isinstance(entity, pyomo.Constraint):
+            def value(con):
+                return instance.dual[con]
         else:
-            # assert(entity.dim() == 0)
-            results = pd.DataFrame(
-                [(v[0], v[1].value) for v in entity.iteritems()])
+            def value(data):
+                return data.value
+        keys = []
+        values = []
+        for idx, data in entity.iteritems():
+            keys.append(idx)
+            values.append(value(data))
+        values = _value_array(values)
+        dim = entity.dim()
+        if dim == 0:
             labels = ['None']
 
     # check for duplicate onset names and append one to several "_" to make
@@ -84,19 +109,39 @@ def get_entity(instance, name):
         if label in labels[:k] or label == name:
             labels[k] = labels[k] + "_"
 
-    if not results.empty:
-        # name columns according to labels + entity name
-        results.columns = labels + [name]
-        results.set_index(labels, inplace=True)
+    if keys:
+        # index from the key lists, with levels named according to labels
+        if dim > 1:
+            index = pd.MultiIndex.from_tuples(keys, names=labels)
+        else:
+            index = pd.Index(keys, name=labels[0])
+        results = pd.Series(values, index=index, name=name)
 
-        # convert to Series
-        results = results[name]
+        # encoded model: replace integer codes by labels
+        if getattr(instance, '_codebook', None):
+            results = decode_frame(results, instance._codebook)
     else:
         # return empty Series
         results = pd.Series(name=name)
     return results
 
 
+def _value_array(values):
+    """ Float array of values (None becomes NaN), else an object array """
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array(values, dtype=object)
+
+
+def _expression_value(expression):
+    """ Value of an expression, or None if its variables have no values """
+    try:
+        return pyomo.value(expression)
+    except ValueError:
+        return None
+
+
 def get_entities(instance, names):
     """ Return one DataFrame with entities in columns and a common index.
 
@@ -113,10 +158,12 @@ def get_entities(instance, names):
 
     df = pd.DataFrame()
     for name in names:
-        other = get_entity(instance, name)
+        # the DataFrame gets its own copy of the values, so a view of the
+        # cache suffices
+        other = get_entity(instance, name, copy=False)
 
         if df.empty:
-            df = other.to_frame()
+            df = other.to_frame().copy()
         else:
             index_names_before = df.index.names
 
@@ -129,11 +176,12 @@ def get_entities(instance, names):
 
 
 def list_entities(instance, entity_type):
-    """ Return list of sets, params, variables, constraints or objectives
+    """ Return list of sets, params, variables, expressions, constraints or
+    objectives
 
     Args:
         instance: a Pyomo ConcreteModel object
-        entity_type: "set", "par", "var", "con" or "obj"
+        entity_type: "set", "par", "var", "expr", "con" or "obj"
 
     Returns:
         DataFrame of entities
@@ -156,6 +204,8 @@ def list_entities(instance, entity_type):
             return isinstance(entity, pyomo.Param)
         elif entity_type == 'var':
             return isinstance(entity, pyomo.Var)
+        elif entity_type == 'expr':
+            return isinstance(entity, pyomo.Expression)
         elif entity_type == 'con':
             return isinstance(entity, pyomo.Constraint)
         elif entity_type == 'obj':
@@ -235,8 +285,8 @@ def _get_onset_names(entity):
             # no domain, so no labels needed
             pass
 
-    elif isinstance(entity, (pyomo.Param, pyomo.Var, pyomo.Constraint,
-                    pyomo.Objective)):
+    elif isinstance(entity, (pyomo.Param, pyomo.Var, pyomo.Expression,
+                             pyomo.Constraint, pyomo.Objective)):
         if entity.dim() > 0 and entity._index:
             labels = _get_onset_names(entity._index)
         else:
@@ -0,0 +1,314 @@
+"""Rolling horizon solve mode.
+
+Splits the modelled timesteps into overlapping windows that are solved one
+after another. Storage content (e_sto_con) and process throughput (tau_pro,
+for the ramping constraints) of the last committed timestep are carried into
+the next window as its fixed initial state. Without a prior investment
+result, the new capacities of each window are lower bounds in the next one.
+The committed parts of all windows are stitched into one result cache.
+"""
+import pandas as pd
+import pyomo.core as pyomo
+from pyomo.opt import TerminationCondition
+from pyomo.opt.base import SolverFactory
+from .encoding import require_labels
+from .model import costs_expression, create_model
+from .modelhelper import annual_weights
+from .pyomoio import get_entity
+from .saveload import ResultContainer, create_result_cache
+from .util import is_string
+
+# cost types that scale with the modelled timesteps
+TIME_DEPENDENT_COSTS = ['Variable', 'Fuel', 'Revenue', 'Purchase',
+                        'Environmental']
+
+# new capacities that are fixed from a prior (investment) result
+CAPACITY_VARIABLES = ['cap_pro_new', 'cap_tra_new', 'cap_sto_c_new',
+                      'cap_sto_p_new']
+
+
+def rolling_windows(timesteps, window, overlap):
+    """Split timesteps into overlapping windows.
+
+    Args:
+        timesteps: list of timesteps, the first being the initial timestep
+        window: number of modelled timesteps per window
+        overlap: number of modelled timesteps at the end of each window that
+            are only used for foresight and re-optimised in the next window
+
+    Returns:
+        list of (window timesteps, committed timesteps) tuples; the first
+        window timestep is the initial timestep of the window, i.e. the last
+        committed timestep of the previous window
+    """
+    if not 0 <= overlap < window:
+        raise ValueError("overlap must be smaller than window and >= 0.")
+    timesteps = list(timesteps)
+    commit = window - overlap
+    windows = []
+    start = 0
+    while start < len(timesteps) - 1:
+        window_steps = timesteps[start:start + window + 1]
+        if start + window + 1 >= len(timesteps):
+            # last window: commit everything up to the end
+            committed = window_steps[1:]
+        else:
+            committed = window_steps[1:commit + 1]
+        windows.append((window_steps, committed))
+        start += len(committed)
+    return windows
+
+
+def run_rolling_horizon(data, timesteps, window, overlap, solver, dt=1,
+                        capacities=None, **model_kwds):
+    """Solve an urbs model in a rolling horizon and stitch the results.
+
+    Each window is created with create_model on its own timesteps. In every
+    window, the storage content of the final timestep needs to be at least
+    the initial storage content (storage.init * capacity), so that no window
+    empties the storage at the expense of the next ones; all windows but the
+    first start with storage content and process throughput fixed to the
+    values of the previous window.
+
+    Annual limits (commodity max, global CO2 limit) apply to each window
+    after scaling with its weight, i.e. to the annualised window values.
+
+    Without capacities, each window may invest, but not below the new
+    capacities of the previous window, so that the capacities of the last
+    window are feasible for all windows.
+
+    Args:
+        data: a dict of DataFrames, as returned by read_excel
+        timesteps: list of timesteps, the first being the initial timestep
+        window: number of modelled timesteps per window
+        overlap: number of modelled timesteps re-optimised by the next window
+        solver: a solver name (e.g. 'glpk') or a Pyomo solver instance
+        dt: timestep duration in hours (default: 1)
+        capacities: optional result of a prior (investment) run, e.g. a
+            solved model or a loaded ResultContainer; its new capacities
+            are fixed in all windows
+        **model_kwds: keyword arguments forwarded to create_model
+
+    Returns:
+        a ResultContainer with input data and stitched result cache, usable
+        with report, result_figures and save
+
+    Example:
+        >>> data = read_excel('mimo-example.xlsx')
+        >>> prob = run_rolling_horizon(data, range(0, 8761), 168, 24, 'glpk',
+        ...                            capacities=load('invest.h5'))
+        >>> report(prob, 'report.xlsx')
+    """
+    if is_string(solver):
+        solver = SolverFactory(solver)
+    timesteps = list(timesteps)
+
+    require_labels('run_rolling_horizon', model_kwds)
+    fixed_capacities = {}
+    if capacities is not None:
+        for name in CAPACITY_VARIABLES:
+            fixed_capacities[name] = get_entity(capacities, name)
+
+    results = []
+    previous = None
+    windows = rolling_windows(timesteps, window, overlap)
+    for k, (window_steps, committed) in enumerate(windows):
+        prob = create_model(data, dt, window_steps, **model_kwds)
+        fix_capacities(prob, fixed_capacities)
+        if previous is not None:
+            fix_initial_state(prob, previous)
+            if capacities is None:
+                bound_capacities(prob, previous)
+
+        result = solver.solve(prob)
+        condition = result.solver.termination_condition
+        if condition != TerminationCondition.optimal:
+            raise RuntimeError(
+                "Window {} of {} (timesteps {} to {}) not solved to "
+                "optimality: {}.".format(k + 1, len(windows), window_steps[1],
+                                         window_steps[-1], condition))
+        previous = prob
+        results.append((prob, committed))
+
+    weights = annual_weights(data.get('timestep', pd.DataFrame()), timesteps,
+                             dt)
+    return ResultContainer(data, stitch_results(results, timesteps, dt,
+                                                weights))
+
+
+def fix_capacities(prob, capacities):
+    """Fix new capacity variables to given values.
+
+    Args:
+        prob: a urbs model instance
+        capacities: dict of variable name -> Series of new capacities
+
+    Returns:
+        None
+    """
+    for name, values in capacities.items():
+        var = getattr(prob, name)
+        for idx, value in values.iteritems():
+            if idx in var:
+                var[idx].fix(value)
+
+
+def bound_capacities(prob, previous):
+    """Bound new capacity variables from below by those of a prior window.
+
+    Args:
+        prob: a urbs model instance of the current window
+        previous: the solved urbs model instance of the previous window
+
+    Returns:
+        None
+    """
+    for name in CAPACITY_VARIABLES:
+        var = getattr(prob, name)
+        for idx, prior in getattr(previous, name).iteritems():
+            if idx not in var or prior.value is None:
+                continue
+            lower = var[idx].lb
+            var[idx].setlb(prior.value if lower is None
+                           else max(lower, prior.value))
+
+
+def fix_initial_state(prob, previous):
+    """Fix storage content and throughput of the initial timestep.
+
+    The initial timestep of prob is a modelled timestep of previous, whose
+    values are carried over. The initial storage content is not linked to
+    the storage capacity then.
+
+    Args:
+        prob: a urbs model instance of the current window
+        previous: the solved urbs model instance of the previous window
+
+    Returns:
+        None
+    """
+    t0 = prob.t[1]  # Pyomo uses 1-based indexing
+    for s in prob.sto_tuples:
+        prob.e_sto_con[(t0,) + s].fix(previous.e_sto_con[(t0,) + s].value)
+        prob.res_initial_and_final_storage_state[(t0,) + s].deactivate()
+    for p in prob.pro_tuples:
+        prob.tau_pro[(t0,) + p].fix(previous.tau_pro[(t0,) + p].value)
+
+
+def stitch_results(results, timesteps, dt=1, weights=None):
+    """Combine result caches of rolling horizon windows.
+
+    Args:
+        results: list of (solved model, committed timesteps) tuples
+        timesteps: all timesteps, the first being the initial timestep
+        dt: timestep duration in hours (default: 1)
+        weights: (optional) dict of timestep -> weight for the whole
+            horizon (c.f. annual_weights); default: uniform weights for dt
+
+    Returns:
+        a result cache (dict of entity name -> Series), see stitch_caches
+    """
+    if weights is None:
+        weights = annual_weights(pd.DataFrame(), timesteps, dt)
+    caches = []
+    for prob, committed in results:
+        cache = create_result_cache(prob)
+        cache['costs'] = committed_costs(prob, committed, weights)
+        index = cache['weight_t'].index
+        cache['weight_t'] = pd.Series(
+            [weights[t] for t in index], index=index, name='weight_t')
+        caches.append((cache, committed))
+    return stitch_caches(caches, timesteps)
+
+
+def committed_costs(prob, committed, weights):
+    """Costs of a solved window, time-dependent ones of committed steps.
+
+    Time-dependent costs are weighted with the weights of the whole horizon
+    instead of the window's weight_t.
+
+    Args:
+        prob: a solved urbs model instance
+        committed: list of committed timesteps of the window
+        weights: dict of timestep -> weight for the whole horizon
+
+    Returns:
+        a Series of costs by cost type, like the result entity costs
+    """
+    costs = create_result_cache(prob, ['costs'])['costs'].copy()
+    for cost_type in TIME_DEPENDENT_COSTS:
+        if cost_type in costs.index:
+            costs[cost_type] = sum(
+                pyomo.value(costs_expression(prob, cost_type, [t])) /
+                prob.weight_t[t] * weights[t]
+                for t in committed)
+    return costs
+
+
+def stitch_caches(caches, timesteps):
+    """Combine result caches of consecutive windows.
+
+    Time-dependent entities (index level 't') are restricted to the committed
+    timesteps of each window (plus the initial timestep of the first window)
+    and concatenated. Time-independent variables (capacities) are the
+    maximum over all windows. Time-dependent cost types are summed over
+    all windows.
+
+    Args:
+        caches: list of (result cache, committed timesteps) tuples; the
+            time-dependent costs of each cache must cover its committed
+            timesteps only, weighted for the whole horizon (c.f.
+            committed_costs)
+        timesteps: all timesteps, the first being the initial timestep
+
+    Returns:
+        a result cache (dict of entity name -> Series)
+    """
+    # weight = length of year / total duration of all timesteps (c.f.
+    # annual_weight); the duration of the initial timestep follows from the
+    # weight of the first window, which starts with that timestep
+    first = caches[0][0]
+    initial = 8760.0 / first['weight'].iloc[0] - first['duration'].sum()
+    duration = sum(cache['duration'][cache['duration'].index.isin(committed)]
+                   .sum() for cache, committed in caches)
+    weight = 8760.0 / (initial + duration)
+
+    stitched = {}
+    for name, first in caches[0][0].items():
+        if name == 'costs':
+            stitched[name] = _stitch_costs(caches)
+        elif name == 'weight':
+            stitched[name] = pd.Series([weight], index=first.index,
+                                       name=name)
+        elif 't' in first.index.names:
+            parts = []
+            for k, (cache, committed) in enumerate(caches):
+                series = cache[name]
+                steps = series.index.get_level_values('t')
+                keep = steps.isin(committed)
+                if k == 0:
+                    keep |= steps == timesteps[0]
+                parts.append(series[keep])
+            stitched[name] = pd.concat(parts)
+        elif first.dtype.kind == 'f' and name.startswith('cap_'):
+            stitched[name] = pd.concat(
+                [cache[name] for cache, _ in caches], axis=1).max(axis=1)
+            stitched[name].name = name
+        else:
+            stitched[name] = first
+    return stitched
+
+
+def _stitch_costs(caches):
+    """Combine costs of all windows, see stitch_caches. """
+    costs = caches[0][0]['costs'].copy()
+    for cost_type in TIME_DEPENDENT_COSTS:
+        costs[cost_type] = 0
+    for cache, _ in caches:
+        for cost_type in TIME_DEPENDENT_COSTS:
+            costs[cost_type] += cache['costs'][cost_type]
+    for cost_type in costs.index:
+        if cost_type not in TIME_DEPENDENT_COSTS:
+            costs[cost_type] = max(cache['costs'][cost_type]
+                                   for cache, _ in caches)
+    return costs
@@ -0,0 +1,268 @@
+"""Scenario run functions: result directory, solver setup, single scenario
+runs and a parallel batch runner.
+
+run_scenarios parses the input workbook once and runs the scenarios in a
+process pool. The CPU cores are divided between the worker processes and
+the threads of their solvers, so that concurrent solves do not oversubscribe
+the machine.
+"""
+import copy
+import multiprocessing
+import os
+from datetime import datetime
+from pyomo.opt.base import SolverFactory
+from .input import read_excel
+from .model import create_model
+from .profiler import write_build_profile
+from .plot import result_figures
+from .report import report
+from .rolling import run_rolling_horizon
+from .saveload import create_result_cache, report_entities, save
+from .util import is_string
+from .validation import validate_input
+
+# state of a worker process: the parsed input data
+_worker = {}
+
+
+def prepare_result_directory(result_name):
+    """ create a time stamped directory within the result folder """
+    # timestamp for result directory
+    now = datetime.now().strftime('%Y%m%dT%H%M')
+
+    # create result directory if not existent
+    result_dir = os.path.join('result', '{}-{}'.format(result_name, now))
+    if not os.path.exists(result_dir):
+        os.makedirs(result_dir)
+
+    return result_dir
+
+
+def setup_solver(optim, logfile='solver.log', threads=None):
+    """ set log file (and number of threads) of a solver
+
+    Args:
+        optim: a Pyomo solver instance
+        logfile: solver log file name
+        threads: (optional) maximum number of solver threads
+
+    Returns:
+        the solver instance
+    """
+    if optim.name in ['gurobi', 'gurobi_persistent']:
+        # reference with list of option names
+        # http://www.gurobi.com/documentation/5.6/reference-manual/parameters
+        optim.set_options("logfile={}".format(logfile))
+        if threads:
+            optim.set_options("threads={}".format(threads))
+        # optim.set_options("timelimit=7200")  # seconds
+        # optim.set_options("mipgap=5e-4")  # default = 1e-4
+    elif optim.name in ['cplex', 'cplex_persistent']:
+        if threads:
+            optim.options['threads'] = threads
+    elif optim.name == 'glpk':
+        # reference with list of options
+        # execute 'glpsol --help'
+        # (glpk is single-threaded)
+        optim.set_options("log={}".format(logfile))
+        # optim.set_options("tmlim=7200")  # seconds
+        # optim.set_options("mipgap=.0005")
+    else:
+        print("Warning from setup_solver: no options set for solver "
+              "'{}'!".format(optim.name))
+    return optim
+
+
+def run_scenario(input_file, timesteps, scenario, result_dir, dt,
+                 plot_tuples=None,  plot_sites_name=None, plot_periods=None,
+                 report_tuples=None, report_sites_name=None, profile=False,
+                 window=None, overlap=0, runner=None, solver='gurobi',
+                 solver_io='python', threads=None, report_only=False):
+    """ run an urbs model for given input, time steps and scenario
+
+    Results are extracted from the model on first access; the HDF5 file
+    contains the input data and all results, or with report_only only those
+    that report and result_figures read.
+
+    Args:
+        input_file: filename to an Excel spreadsheet for urbs.read_excel, or
+            an input data dict that was read before (it is copied before the
+            scenario modifies it)
+        timesteps: a list of timesteps, e.g. range(0,8761)
+        scenario: a scenario function that modifies the input data dict
+        result_dir: directory name for result spreadsheet and plots
+        dt: length of each time step (unit: hours)
+        plot_tuples: (optional) list of plot tuples (c.f. urbs.result_figures)
+        plot_sites_name: (optional) dict of names for sites in plot_tuples
+        plot_periods: (optional) dict of plot periods(c.f. urbs.result_figures)
+        report_tuples: (optional) list of (sit, com) tuples (c.f. urbs.report)
+        report_sites_name: (optional) dict of names for sites in report_tuples
+        profile: (optional) write model build profile next to the logfile
+        window: (optional) solve in a rolling horizon of windows with this
+            number of timesteps (c.f. urbs.run_rolling_horizon)
+        overlap: (optional) number of overlapping timesteps between windows
+        runner: (optional) a urbs.ScenarioSolver that keeps model and solver
+            of the previous scenario and updates them in place; it solves
+            with its own solver and model options, so solver and solver_io
+            are not used, and timesteps and dt must equal those of the
+            runner; cannot be combined with window or profile (pass
+            profile=True to the ScenarioSolver instead)
+        solver: (optional) solver name, default: 'gurobi'
+        solver_io: (optional) solver interface, default: 'python'; None for
+            the solver's default interface (e.g. for glpk)
+        threads: (optional) maximum number of solver threads
+        report_only: (optional) if True, extract and save only the results
+            that report and result_figures read (c.f.
+            urbs.saveload.REPORT_ENTITIES), which saves time and memory for
+            large models; default: all results
+
+    Returns:
+        the urbs model instance
+    """
+    if runner is not None:
+        if window:
+            raise ValueError("window and runner cannot be combined, as each "
+                             "rolling horizon window is a separate model.")
+        if profile:
+            raise ValueError("profile and runner cannot be combined; pass "
+                             "profile=True to the ScenarioSolver instead.")
+        if (runner.timesteps is None or
+                list(runner.timesteps) != list(timesteps) or
+                runner.dt != dt):
+            raise ValueError("timesteps and dt must equal those of the "
+                             "runner, which builds the model with its own.")
+
+    # scenario name, read and modify data for scenario
+    sce = scenario.__name__
+    if is_string(input_file):
+        data = read_excel(input_file)
+    else:
+        data = copy.deepcopy(input_file)
+    data = scenario(data)
+    validate_input(data)
+
+    # create filename for logfile and set up solver
+    log_filename = os.path.join(result_dir, '{}.log').format(sce)
+    if runner is not None:
+        optim = runner.solver
+    else:
+        # cplex, glpk, gurobi, ...
+        if solver_io:
+            optim = SolverFactory(solver, solver_io=solver_io)
+        else:
+            optim = SolverFactory(solver)
+    optim = setup_solver(optim, logfile=log_filename, threads=threads)
+
+    if window:
+        # solve window by window, stitch results into one result container
+        prob = run_rolling_horizon(data, timesteps, window, overlap, optim,
+                                   dt)
+    elif runner is not None:
+        # update model of previous scenario in place (or rebuild it if
+        # non-mutable data changed) and solve, warm started
+        prob = runner.solve(data, tee=True)
+    else:
+        # create model
+        prob = create_model(data, dt, timesteps, profile=profile)
+        if profile:
+            write_build_profile(
+                prob,
+                os.path.join(result_dir, '{}-profile.json').format(sce))
+
+        # solve model and read results
+        optim.solve(prob, tee=True)
+
+    # on request, extract only the results that report and result_figures
+    # read (on first access); otherwise save attaches the full result cache
+    if report_only and not hasattr(prob, '_result'):
+        prob._result = create_result_cache(prob, report_entities(prob),
+                                           lazy=True)
+
+    # save problem solution (and input data) to HDF5 file
+    save(prob, os.path.join(result_dir, '{}.h5'.format(sce)))
+
+    # write report to spreadsheet
+    report(
+        prob,
+        os.path.join(result_dir, '{}.xlsx').format(sce),
+        report_tuples=report_tuples,
+        report_sites_name=report_sites_name)
+
+    # result plots
+    result_figures(
+        prob,
+        os.path.join(result_dir, '{}'.format(sce)),
+        plot_title_prefix=sce.replace('_', ' '),
+        plot_tuples=plot_tuples,
+        plot_sites_name=plot_sites_name,
+        periods=plot_periods,
+        figure_size=(24, 9))
+    return prob
+
+
+def run_scenarios(input_file, timesteps, scenarios, result_dir, dt,
+                  processes=None, threads=None, **kwds):
+    """ run scenarios in parallel worker processes
+
+    The input is read once and shared by all workers. By default, there are
+    as many workers as scenarios, but at most one per CPU core, and each
+    solver gets an equal share of the cores as threads.
+
+    Args:
+        input_file: filename to an Excel spreadsheet for urbs.read_excel, or
+            an input data dict
+        timesteps: a list of timesteps, e.g. range(0,8761)
+        scenarios: list of scenario functions (defined at module level, so
+            that they can be passed to worker processes)
+        result_dir: directory name for result spreadsheets and plots
+        dt: length of each time step (unit: hours)
+        processes: (optional) number of worker processes
+        threads: (optional) number of solver threads per worker
+        **kwds: keyword arguments forwarded to run_scenario (e.g. solver,
+            plot_tuples, report_tuples)
+
+    Returns:
+        dict of scenario name -> HDF5 result file name
+
+    Example:
+        >>> run_scenarios('mimo-example.xlsx', range(0, 169),
+        ...               [scenario_base, scenario_co2_limit], 'result', 1,
+        ...               solver='gurobi')
+    """
+    if is_string(input_file):
+        input_file = read_excel(input_file)
+    cores = multiprocessing.cpu_count()
+    if processes is None:
+        processes = min(len(scenarios), cores)
+    if threads is None:
+        threads = max(1, cores // processes)
+
+    tasks = [(timesteps, scenario, result_dir, dt, threads, kwds)
+             for scenario in scenarios]
+    if processes == 1:
+        _init_worker(input_file)
+        results = [_run_scenario_task(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                    initargs=(input_file,))
+        try:
+            results = pool.map(_run_scenario_task, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    return dict(results)
+
+
+def _init_worker(data):
+    """Initialise the state of a worker process. """
+    _worker.clear()
+    _worker['data'] = data
+
+
+def _run_scenario_task(task):
+    """Run a scenario in a worker process, return (name, result file). """
+    timesteps, scenario, result_dir, dt, threads, kwds = task
+    run_scenario(_worker['data'], timesteps, scenario, result_dir, dt,
+                 threads=threads, **kwds)
+    sce = scenario.__name__
+    return sce, os.path.join(result_dir, '{}.h5'.format(sce))
@@ -1,28 +1,124 @@
 import pandas as pd
-from .pyomoio import get_entity, list_entities
+from .pyomoio import extract_entity, list_entities
 
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping  # Python 2
 
-def create_result_cache(prob):
-    entity_types = ['set', 'par', 'var']
+
+def result_entities(prob):
+    """List of entity names that a result cache of prob contains.
+
+    Args:
+        prob: a urbs model instance
+
+    Returns:
+        list of set, param, var and expr names, and con names if the model
+        has dual values
+    """
+    entity_types = ['set', 'par', 'var', 'expr']
     if hasattr(prob, 'dual'):
         entity_types.append('con')
 
     entities = []
     for entity_type in entity_types:
         entities.extend(list_entities(prob, entity_type).index.tolist())
+    return entities
+
+
+# entities read by report and result_figures (c.f. get_constants,
+# get_timeseries and plot)
+REPORT_ENTITIES = [
+    'tm', 'dt', 'costs',
+    'cap_pro', 'cap_pro_new', 'cap_tra', 'cap_tra_new',
+    'cap_sto_c', 'cap_sto_c_new', 'cap_sto_p', 'cap_sto_p_new',
+    'e_co_stock', 'e_pro_in', 'e_pro_out', 'e_tra_in', 'e_tra_out',
+    'e_sto_con', 'e_sto_in', 'e_sto_out', 'dsm_up', 'dsm_down']
+
+
+def report_entities(prob):
+    """List of entity names that report and result_figures read from prob.
+
+    Args:
+        prob: a urbs model instance
+
+    Returns:
+        list of the names in REPORT_ENTITIES that prob contains
+    """
+    return [name for name in REPORT_ENTITIES if hasattr(prob, name)]
+
+
+def create_result_cache(prob, names=None, lazy=False):
+    """Create a result cache (entity name -> Series) of a solved model.
+
+    Args:
+        prob: a urbs model instance containing a solution
+        names: (optional) list of entity names to include; default: all
+            (c.f. result_entities)
+        lazy: (optional) if True, return a ResultCache that extracts each
+            entity on first access; it refers to prob, so use False (a plain
+            dict) for caches that outlive the model or are sent to other
+            processes
+
+    Returns:
+        dict or ResultCache of entity name -> Series
+    """
+    if names is None:
+        names = result_entities(prob)
+    if lazy:
+        return ResultCache(prob, names)
 
     result_cache = {}
-    for entity in entities:
-        result_cache[entity] = get_entity(prob, entity)
+    for entity in names:
+        result_cache[entity] = extract_entity(prob, entity)
     return result_cache
 
 
-def save(prob, filename):
+class ResultCache(Mapping):
+    """Result cache that extracts entities from a model on first access.
+
+    Extracted Series are kept; get_entity hands out copies of them, or
+    read-only views with copy=False (c.f. result_view).
+
+    Args:
+        prob: a urbs model instance containing a solution
+        names: list of entity names the cache may contain
+    """
+    def __init__(self, prob, names):
+        self._prob = prob
+        self._names = list(names)
+        self._values = {}
+
+    def __getitem__(self, name):
+        if name not in self._values:
+            if name not in self._names:
+                raise KeyError(name)
+            self._values[name] = extract_entity(self._prob, name)
+        return self._values[name]
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+
+def save(prob, filename, names=None):
     """Save urbs model input and result cache to a HDF5 store file.
 
+    If prob has no result cache yet, a lazy one (see create_result_cache)
+    is attached, so that only the saved entities are extracted, and each of
+    them only once for later calls of report or result_figures.
+
     Args:
         prob: a urbs model instance containing a solution
         filename: HDF5 store file to be written
+        names: (optional) list of entity names to save; default: all
+            entities of the result cache
 
     Returns:
         Nothing
@@ -32,12 +128,14 @@ def save(prob, filename):
                             category=pd.io.pytables.PerformanceWarning)
 
     if not hasattr(prob, '_result'):
-        prob._result = create_result_cache(prob)
+        prob._result = create_result_cache(prob, names, lazy=True)
+    if names is None:
+        names = list(prob._result.keys())
 
     with pd.HDFStore(filename, mode='w') as store:
         for name in prob._data.keys():
             store['data/'+name] = prob._data[name]
-        for name in prob._result.keys():
+        for name in names:
             store['result/'+name] = prob._result[name]
 
 
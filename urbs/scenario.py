@@ -0,0 +1,232 @@
+"""Mutable scenario parameters for models created with mutable=True.
+
+Commodity prices and limits, capacity bounds, efficiencies, process ratios
+and the global CO2 limit are declared as mutable Params. They replace the
+corresponding entries of the model's input dicts (commodity_dict,
+process_dict, ..., r_in_dict, r_out_dict), so that all constraint rules
+refer to them without change. update_model then applies the data of another
+scenario to the built model in place instead of rebuilding it.
+"""
+import math
+import pandas as pd
+import pyomo.core as pyomo
+
+# input table -> columns that are declared as mutable parameters
+MUTABLE_COLUMNS = {
+    'commodity': ['price', 'max', 'maxperhour'],
+    'process': ['cap-lo', 'cap-up'],
+    'transmission': ['eff', 'cap-lo', 'cap-up'],
+    'storage': ['eff-in', 'eff-out', 'cap-lo-p', 'cap-up-p', 'cap-lo-c',
+                'cap-up-c'],
+}
+
+# input table -> index set of the mutable parameters
+INDEX_SETS = {
+    'commodity': 'com_tuples',
+    'process': 'pro_tuples',
+    'transmission': 'tra_tuples',
+    'storage': 'sto_tuples',
+}
+
+# process commodity direction -> (parameter name, ratio dict attribute)
+RATIO_PARAMS = {
+    'In': ('process_ratio_in', 'r_in_dict'),
+    'Out': ('process_ratio_out', 'r_out_dict'),
+}
+
+# input columns derived by pyomo_model_prep, ignored by update_model
+DERIVED_COLUMNS = ['annuity-factor']
+
+
+def param_name(table, column):
+    """Name of the mutable parameter for an input column.
+
+    Example:
+        >>> param_name('storage', 'cap-up-p')
+        'storage_cap_up_p'
+    """
+    return '{}_{}'.format(table, column.replace('-', '_'))
+
+
+def mutable_params(m):
+    """List of the mutable parameter components of a model.
+
+    Args:
+        m: a urbs model instance created with mutable=True
+
+    Returns:
+        list of Param components
+    """
+    names = [param_name(table, column)
+             for table, columns in sorted(MUTABLE_COLUMNS.items())
+             for column in columns]
+    names.extend(name for name, _ in
+                 (RATIO_PARAMS[direction] for direction in ['In', 'Out']))
+    names.append('co2_limit')
+    return [m.find_component(name) for name in names]
+
+
+def co2_limit_active(limit):
+    """True if the global CO2 limit is finite and not negative. """
+    return not math.isinf(limit) and limit >= 0
+
+
+def declare_mutable_params(m):
+    """Declare mutable parameters and put them into the input dicts.
+
+    Args:
+        m: a urbs model instance under construction, with the sets
+            com_tuples, pro_tuples, tra_tuples and sto_tuples
+
+    Returns:
+        None
+    """
+    for table, columns in sorted(MUTABLE_COLUMNS.items()):
+        props = getattr(m, table + '_dict')
+        index = getattr(m, INDEX_SETS[table])
+        for column in columns:
+            name = param_name(table, column)
+            m.add_component(name, pyomo.Param(
+                index,
+                initialize=dict(props[column]),
+                mutable=True,
+                doc='{}.{} (mutable)'.format(table, column)))
+            props[column] = m.find_component(name)
+
+    for direction in ['In', 'Out']:
+        name, attr = RATIO_PARAMS[direction]
+        ratios = getattr(m, attr)
+        m.add_component(name + '_tuples', pyomo.Set(
+            within=m.pro*m.com,
+            initialize=sorted(ratios.keys()),
+            doc='Process commodities with {} ratio'.format(direction)))
+        m.add_component(name, pyomo.Param(
+            m.find_component(name + '_tuples'),
+            initialize=ratios,
+            mutable=True,
+            doc='process_commodity.ratio, {} (mutable)'.format(direction)))
+        # a plain dict of the parameter entries, as a component must not be
+        # assigned to a second attribute of the model
+        param = m.find_component(name)
+        setattr(m, attr, dict((key, param[key]) for key in param))
+
+    m.co2_limit = pyomo.Param(
+        initialize=m.global_prop.loc['CO2 limit', 'value'],
+        mutable=True,
+        doc='Global CO2 limit (mutable)')
+
+
+def update_model(prob, data):
+    """Apply scenario data to a model created with mutable=True.
+
+    Only the values of mutable parameters (see MUTABLE_COLUMNS, the process
+    commodity ratios and the global CO2 limit) may differ from the data the
+    model was built with. The global CO2 limit constraint is activated or
+    deactivated according to the new limit. Input DataFrames of the model
+    are updated and a cached result is discarded.
+
+    Args:
+        prob: a urbs model instance created with mutable=True
+        data: a dict of DataFrames, e.g. a scenario function applied to a
+            copy of the data the model was built with
+
+    Returns:
+        sorted list of the names of changed components
+
+    Example:
+        >>> prob = create_model(data, mutable=True)
+        >>> for scenario in scenarios:
+        ...     update_model(prob, scenario(copy.deepcopy(data)))
+        ...     optim.solve(prob)
+    """
+    if not getattr(prob, 'mutable', False):
+        raise ValueError("Model was not created with mutable=True.")
+    check_structure(prob, data)
+
+    changed = set()
+    for table, columns in sorted(MUTABLE_COLUMNS.items()):
+        for column in columns:
+            name = param_name(table, column)
+            values = data[table][column]
+            if _update_param(prob.find_component(name), values):
+                changed.add(name)
+            getattr(prob, table)[column] = values
+
+    ratios = data['process_commodity']['ratio']
+    for direction in ['In', 'Out']:
+        name, _ = RATIO_PARAMS[direction]
+        if _update_param(prob.find_component(name),
+                         ratios.xs(direction, level='Direction')):
+            changed.add(name)
+    prob.process_commodity['ratio'] = ratios
+    prob.r_in = prob.process_commodity.xs('In', level='Direction')['ratio']
+    prob.r_out = prob.process_commodity.xs('Out', level='Direction')['ratio']
+
+    limit = data['global_prop'].loc['CO2 limit', 'value']
+    if not same_value(pyomo.value(prob.co2_limit), limit):
+        prob.co2_limit.set_value(limit)
+        changed.add('co2_limit')
+    prob.global_prop.loc['CO2 limit', 'value'] = limit
+    prob._data['global_prop'].loc['CO2 limit', 'value'] = limit
+    constraint = prob.res_global_co2_limit
+    if constraint.active != co2_limit_active(limit):
+        if co2_limit_active(limit):
+            constraint.activate()
+        else:
+            constraint.deactivate()
+        changed.add('res_global_co2_limit')
+
+    if hasattr(prob, '_result'):
+        del prob._result
+    return sorted(changed)
+
+
+def check_structure(prob, data):
+    """Raise ValueError if data differs in anything but mutable values.
+
+    Args:
+        prob: a urbs model instance created with mutable=True
+        data: a dict of DataFrames
+
+    Returns:
+        None
+    """
+    if set(data.keys()) != set(prob._data.keys()):
+        raise ValueError("Input tables differ from the model's: {}".format(
+            sorted(set(data.keys()) ^ set(prob._data.keys()))))
+
+    differences = []
+    for name in sorted(data.keys()):
+        old, new = prob._data[name], data[name]
+        if not old.index.equals(new.index):
+            differences.append('{} (index)'.format(name))
+            continue
+        ignore = DERIVED_COLUMNS + MUTABLE_COLUMNS.get(name, [])
+        if name == 'process_commodity':
+            ignore = ignore + ['ratio']
+        if name == 'global_prop':
+            old = old.drop('CO2 limit')
+            new = new.drop('CO2 limit')
+        columns = [c for c in new.columns if c not in ignore]
+        if (set(columns) - set(old.columns) or
+                not old[columns].equals(new[columns])):
+            differences.append(name)
+    if differences:
+        raise ValueError("Changes of non-mutable input data require "
+                         "rebuilding the model: {}".format(
+                             ', '.join(differences)))
+
+
+def _update_param(param, values):
+    """Set changed values of a mutable parameter; True if any changed. """
+    changed = False
+    for idx, value in values.iteritems():
+        if not same_value(pyomo.value(param[idx]), value):
+            param[idx] = value
+            changed = True
+    return changed
+
+
+def same_value(a, b):
+    """Equality of parameter values, treating NaN as equal to NaN. """
+    return a == b or (pd.isnull(a) and pd.isnull(b))
@@ -0,0 +1,145 @@
+"""Array storage of input tables for the model rules.
+
+A TimeSeriesStore holds a timeseries DataFrame (demand, supim,
+buy_sell_price) as one contiguous float array (timesteps x columns) plus
+two small lookup dicts for column and timestep positions, instead of one
+dict entry per cell as returned by DataFrame.to_dict().
+
+A ParamStore replaces DataFrame.to_dict() for the property tables
+(commodity, process, transmission, storage, dsm). It converts a column to
+a NumPy array only when a rule first reads it and shares one index of
+row positions between all columns of the table.
+"""
+import numpy as np
+import pandas as pd
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping  # Python 2
+
+
+class TimeSeriesStore(object):
+    """Fast (column, timestep) lookup of a timeseries DataFrame.
+
+    Columns are addressed by their label, e.g. ('Mid', 'Elec') for demand
+    and supim; labels of one-level columns (buy_sell_price) may be given
+    with or without the enclosing tuple, e.g. 'Elec buy' or ('Elec buy',).
+
+    Args:
+        frame: DataFrame with timesteps as index, e.g. data['demand']
+
+    Attributes:
+        values: 2-D float array (timesteps x columns)
+        index: list of timesteps
+        columns: list of column labels
+
+    Example:
+        >>> demand = TimeSeriesStore(data['demand'])
+        >>> mid = demand[('Mid', 'Elec'), 3500]
+        >>> total = demand.series(demand.columns, range(3500, 3669))
+    """
+    def __init__(self, frame):
+        self.values = np.ascontiguousarray(frame.values, dtype=np.float64)
+        self.index = frame.index.tolist()
+        self._rows = dict((t, i) for i, t in enumerate(self.index))
+        self.relabel(frame.columns.tolist())
+
+    def relabel(self, columns):
+        """Replace the column labels, e.g. codes by names. """
+        self.columns = list(columns)
+        self._cols = {}
+        for j, column in enumerate(self.columns):
+            self._cols[column] = j
+            if isinstance(column, tuple) and len(column) == 1:
+                self._cols[column[0]] = j
+
+    def __getitem__(self, key):
+        """Value of (column, timestep); raises KeyError if not found. """
+        column, t = key
+        return float(self.values[self._rows[t], self._cols[column]])
+
+    def __contains__(self, column):
+        return column in self._cols
+
+    def series(self, columns, timesteps):
+        """Sum of given columns over given timesteps.
+
+        Columns not in the store are skipped.
+
+        Args:
+            columns: list of column labels
+            timesteps: list of timesteps
+
+        Returns:
+            a Series indexed by timesteps; raises KeyError if none of the
+            columns exists or a timestep is unknown
+        """
+        cols = [self._cols[c] for c in columns if c in self._cols]
+        if not cols:
+            raise KeyError(columns)
+        rows = [self._rows[t] for t in timesteps]
+        values = self.values[np.ix_(rows, cols)].sum(axis=1)
+        return pd.Series(values, index=timesteps)
+
+
+class ParamStore(object):
+    """Column-wise (column, index tuple) lookup of a property table.
+
+    Offers the access of DataFrame.to_dict(), i.e. store[column][idx], e.g.
+    m.process_dict['inv-cost'][(sit, pro)]. Columns are converted to
+    arrays on first access; the row positions are shared by all columns.
+    A column may be replaced by any mapping, e.g. a mutable Pyomo Param.
+
+    Args:
+        frame: DataFrame, e.g. data['process']
+
+    Example:
+        >>> process_dict = ParamStore(data['process'])
+        >>> inv_cost = process_dict['inv-cost'][('Mid', 'Biomass plant')]
+    """
+    def __init__(self, frame):
+        self.frame = frame
+        self._columns = {}
+        self._positions = None
+
+    def __getitem__(self, column):
+        try:
+            return self._columns[column]
+        except KeyError:
+            pass
+        if column not in self.frame.columns:
+            raise KeyError(column)
+        if self._positions is None:
+            self._positions = dict(
+                (idx, i) for i, idx in enumerate(self.frame.index))
+        values = self.frame[column].values
+        self._columns[column] = ParamColumn(values, self._positions)
+        return self._columns[column]
+
+    def __setitem__(self, column, values):
+        self._columns[column] = values
+
+    def __contains__(self, column):
+        return column in self._columns or column in self.frame.columns
+
+    def keys(self):
+        return list(self.frame.columns)
+
+
+class ParamColumn(Mapping):
+    """Read-only mapping of index tuple -> value of one table column. """
+    def __init__(self, values, positions):
+        self.values = values
+        self._positions = positions
+
+    def __getitem__(self, idx):
+        # item() returns Python scalars, which, unlike NumPy scalars, are
+        # safe as left operands of Pyomo expressions
+        return self.values.item(self._positions[idx])
+
+    def __iter__(self):
+        return iter(self._positions)
+
+    def __len__(self):
+        return len(self._positions)
@@ -1,11 +1,28 @@
+from collections import namedtuple
 import pandas as pd
 
+# one inconsistency of the input data: name of the check, input table,
+# index (row or column label) of the offending entry and error message
+Violation = namedtuple('Violation', ['check', 'table', 'index', 'message'])
+
+# input table -> [(lower bound, upper bound, installed capacity column,
+#                  name used in the error message)]
+CAPACITY_COLUMNS = {
+    'process': [('cap-lo', 'cap-up', 'inst-cap', 'processes')],
+    'transmission': [('cap-lo', 'cap-up', 'inst-cap', 'transmissions')],
+    'storage': [('cap-lo-p', 'cap-up-p', 'inst-cap-p', 'storage powers'),
+                ('cap-lo-c', 'cap-up-c', 'inst-cap-c',
+                 'storage capacities')],
+}
+
 
 def validate_input(data):
     """ Input validation function
 
     This function raises errors if inconsistent or illogical inputs are
-    made, that might lead to erreneous results.
+    made, that might lead to erreneous results. All violations found by
+    find_violations are listed in the error message; the exception type is
+    that of the first one.
 
     Args:
         data: Input data frames as read in by input.read_excel
@@ -14,64 +31,110 @@ def validate_input(data):
         Customized error messages.
 
     """
+    violations = find_violations(data)
+    if not violations:
+        return
+    error = KeyError if violations[0].check == 'maxperstep' else ValueError
+    if len(violations) == 1:
+        raise error(violations[0].message)
+    raise error('{} input errors:\n'.format(len(violations)) +
+                '\n'.join(v.message for v in violations))
 
-    # Ensure correct formation of vertex rule
-    for (sit, pro) in data['process'].index:
-        for com in data['commodity'].index.get_level_values('Commodity'):
-            simplified_pro_com_index = ([(p, c) for p, c, d in
-                                        data['process_commodity'].index
-                                        .tolist()])
-            simplified_com_index = ([(s, c) for s, c, t in data['commodity']
-                                    .index.tolist()])
-            if ((pro, com) in simplified_pro_com_index and
-                (sit, com) not in simplified_com_index):
-                raise ValueError('Commodities used in a process at a site must'
-                                 ' be specified in the commodity input sheet'
-                                 '! The pair (' + sit + ',' + com + ')'
-                                 ' is not in commodity input sheet.')
 
-    # Identify infeasible process, transmission and storage capacity
-    # constraints before solving
-    for index in data['process'].index:
-        if not (data['process'].loc[index]['cap-lo'] <=
-                data['process'].loc[index]['cap-up'] and
-                data['process'].loc[index]['inst-cap'] <=
-                data['process'].loc[index]['cap-up']):
-            raise ValueError('Ensure cap_lo <= cap_up and inst_cap <= cap_up'
-                             ' for all processes.')
-
-    for index in data['transmission'].index:
-        if not (data['transmission'].loc[index]['cap-lo'] <=
-                data['transmission'].loc[index]['cap-up'] and
-                data['transmission'].loc[index]['inst-cap'] <=
-                data['transmission'].loc[index]['cap-up']):
-            raise ValueError('Ensure cap_lo <= cap_up and inst_cap <= cap_up'
-                             ' for all transmissions.')
-
-    for index in data['storage'].index:
-        if not (data['storage'].loc[index]['cap-lo-p'] <=
-                data['storage'].loc[index]['cap-up-p'] and
-                data['storage'].loc[index]['inst-cap-p'] <=
-                data['storage'].loc[index]['cap-up-p']):
-            raise ValueError('Ensure cap_lo <= cap_up and inst_cap <= cap_up'
-                             ' for all storage powers.')
-
-        elif not (data['storage'].loc[index]['cap-lo-c'] <=
-                  data['storage'].loc[index]['cap-up-c'] and
-                  data['storage'].loc[index]['inst-cap-c'] <=
-                  data['storage'].loc[index]['cap-up-c']):
-            raise ValueError('Ensure cap_lo <= cap_up and inst_cap <= cap_up'
-                             ' for all storage capacities.')
+def find_violations(data):
+    """ Find all inconsistencies of the input data in one pass
 
-    # Identify SupIm values larger than 1, which lead to an infeasible model
-    if (data['supim'] > 1).sum().sum() > 0:
-        raise ValueError('All values in Sheet SupIm must be <= 1.')
+    Checks the vertex rule (commodities of a process at a site must be
+    defined for this site), capacity bounds (cap-lo <= cap-up and
+    inst-cap <= cap-up), SupIm values <= 1 and outdated column labels.
+
+    Args:
+        data: Input data frames as read in by input.read_excel
+
+    Returns:
+        list of Violation(check, table, index, message) tuples, empty if
+        the data is consistent
+
+    Example:
+        >>> for v in find_violations(data):
+        ...     print(v.table, v.index, v.message)
+    """
+    violations = []
+    violations.extend(_vertex_rule_violations(data))
+    for table in ['process', 'transmission', 'storage']:
+        violations.extend(_capacity_violations(data, table))
+    violations.extend(_supim_violations(data))
 
     # Identify outdated column label 'maxperstep' on the commodity tab and
     # suggest a rename to 'maxperhour'
     if 'maxperstep' in list(data['commodity']):
-        raise KeyError("Maximum allowable commodities are defined by per "
-                       "hour. Please change the column name 'maxperstep' "
-                       "in the commodity worksheet to 'maxperhour' and "
-                       "ensure that the input values are adjusted "
-                       "correspondingly.")
+        violations.append(Violation(
+            'maxperstep', 'commodity', 'maxperstep',
+            "Maximum allowable commodities are defined by per "
+            "hour. Please change the column name 'maxperstep' "
+            "in the commodity worksheet to 'maxperhour' and "
+            "ensure that the input values are adjusted "
+            "correspondingly."))
+    return violations
+
+
+def _vertex_rule_violations(data):
+    """ (site, commodity) pairs used by a process, but not defined """
+    commodity = data['commodity'].index
+    site_com = set(zip(commodity.get_level_values('Site'),
+                       commodity.get_level_values('Commodity')))
+
+    # process commodities that are defined for at least one site
+    pro_com = data['process_commodity'].index
+    pro_com = pd.DataFrame({
+        'Process': pro_com.get_level_values('Process'),
+        'Commodity': pro_com.get_level_values('Commodity')})
+    pro_com = pro_com[pro_com['Commodity'].isin(
+        commodity.get_level_values('Commodity'))].drop_duplicates()
+
+    # join processes at sites with their commodities
+    process = data['process'].index
+    sit_pro = pd.DataFrame({
+        'Site': process.get_level_values('Site'),
+        'Process': process.get_level_values('Process')})
+    used = sit_pro.merge(pro_com, on='Process')
+
+    violations = []
+    missing = set()
+    for sit, com in zip(used['Site'], used['Commodity']):
+        if (sit, com) in site_com or (sit, com) in missing:
+            continue
+        missing.add((sit, com))
+        violations.append(Violation(
+            'vertex_rule', 'commodity', (sit, com),
+            'Commodities used in a process at a site must'
+            ' be specified in the commodity input sheet'
+            '! The pair ({},{})'
+            ' is not in commodity input sheet.'.format(sit, com)))
+    return violations
+
+
+def _capacity_violations(data, table):
+    """ Rows of a table with cap-lo > cap-up or inst-cap > cap-up """
+    # Identify infeasible process, transmission and storage capacity
+    # constraints before solving; comparisons with NaN are violations, too
+    df = data[table]
+    violations = []
+    for lo, up, inst, name in CAPACITY_COLUMNS[table]:
+        feasible = (df[lo] <= df[up]) & (df[inst] <= df[up])
+        for index in df.index[~feasible.values]:
+            violations.append(Violation(
+                'capacity', table, index,
+                'Ensure cap_lo <= cap_up and inst_cap <= cap_up'
+                ' for all {}: {}'.format(name, index)))
+    return violations
+
+
+def _supim_violations(data):
+    """ SupIm columns with values larger than 1 """
+    # Identify SupIm values larger than 1, which lead to an infeasible model
+    counts = (data['supim'] > 1).sum()
+    return [Violation('supim', 'supim', column,
+                      'All values in Sheet SupIm must be <= 1: {} values '
+                      'of {} are larger.'.format(count, column))
+            for column, count in counts[counts > 0].iteritems()]